@@ -16,3 +16,8 @@
 # limitations under the License.
 
 __version__ = "1.0.9"
+
+# define the data format version. Increase if
+# - a key is renamed
+# - a key is removed
+DATA_VERSION = 1
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016, Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import functools
+import os
+import subprocess
+import sys
+import tempfile
+
+from . import DATA_VERSION
+from . import limits as meta_limits
+from . import utils as meta_utils
+from . import workdir as meta_workdir
+
+
+__all__ = [
+    "async_from_archive",
+    "gather_from_archives",
+]
+
+
+async def _in_thread(func, *args):
+    """run func in the default executor"""
+    future = asyncio.get_running_loop().run_in_executor(None, func, *args)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        # the thread can not be stopped. Wait for it, so nothing is written
+        # to the tempdir after it was removed
+        await asyncio.wait([future])
+        raise
+
+
+async def _read_output(process, max_output):
+    """read the output of the process. Returns None if it is larger than
+    max_output"""
+    chunks = []
+    size = 0
+    while True:
+        chunk = await process.stdout.read(65536)
+        if not chunk:
+            return b''.join(chunks)
+        size += len(chunk)
+        if max_output is not None and size > max_output:
+            return None
+        chunks.append(chunk)
+
+
+async def _check_output(setup_dir, args, py_interpreter, limits=None,
+                        capture=False, stub_imports=None):
+    """the same as :func:`metaextract.utils._check_output` but as a
+    coroutine. The process group of the child is killed if the coroutine is
+    cancelled or a limit is exceeded"""
+    if limits is None:
+        limits = meta_limits.Limits()
+    cmd = [py_interpreter] + meta_utils._launcher_args(limits, capture,
+                                                       stub_imports)
+    cmd += ['setup.py'] + args
+    process = await asyncio.create_subprocess_exec(
+        *cmd, cwd=setup_dir, stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        start_new_session=True)
+    try:
+        output = await asyncio.wait_for(
+            _read_output(process, limits.max_output), limits.timeout)
+        if output is not None:
+            await process.wait()
+    except asyncio.TimeoutError:
+        raise meta_limits.LimitExceeded(
+            'timeout', "setup.py did not finish within %s seconds" %
+            limits.timeout)
+    finally:
+        # kill the child if it is still running. Once it is reaped (by the
+        # child watcher of the event loop), its pid and so the group id
+        # may belong to another process
+        if process.returncode is None:
+            meta_limits.kill_group(process.pid)
+        await asyncio.shield(process.wait())
+    if output is None:
+        raise meta_limits.output_exceeded(limits)
+    meta_limits.check_status(limits, process.returncode, output)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd,
+                                            output=output)
+    return output
+
+
+async def _setup_py_run_from_dir(root_dir, py_interpreter, limits, fields,
+                                 capture, stub_imports):
+    single_subdir, setup_py = await _in_thread(
+        meta_utils._setup_py_prepare, root_dir)
+    await _in_thread(meta_utils._fix_file_encoding, setup_py)
+    with tempfile.NamedTemporaryFile() as output_json:
+        args = meta_utils._setup_py_args(output_json.name, fields=fields)
+        await _check_output(single_subdir, args, py_interpreter, limits,
+                            capture, stub_imports)
+        max_output = meta_utils._max_output(limits)
+        if max_output is not None and \
+                os.path.getsize(output_json.name) > max_output:
+            raise meta_limits.output_exceeded(limits)
+        return meta_utils._setup_py_read_output(output_json.name)
+
+
+async def _from_extracted(archive_filename, py_interpreter, static, limits,
+                          fields, extraction_limits, workdir,
+                          background_cleanup, capture, stub_imports, sparse):
+    tempdir = await _in_thread(meta_workdir.make_tempdir, workdir)
+    try:
+        await _in_thread(meta_utils._extract_archive, archive_filename,
+                         tempdir, sparse, extraction_limits)
+        data = None
+        if static:
+            data = await _in_thread(meta_utils._static_run_from_dir, tempdir)
+        if data is None:
+            data = await _setup_py_run_from_dir(tempdir, py_interpreter,
+                                                limits, fields, capture,
+                                                stub_imports)
+        return data
+    finally:
+        await _in_thread(meta_workdir.remove_tempdir, tempdir,
+                         background_cleanup)
+
+
+###############################################################################
+async def async_from_archive(archive_filename, py_interpreter=sys.executable,
+                             cache=None, static=False, limits=None,
+                             fields=None, sparse=None,
+                             extraction_limits=None, workdir=None,
+                             background_cleanup=False, capture=False,
+                             stub_imports=None):
+    """the coroutine version of :func:`metaextract.utils.from_archive`
+
+    The archive is extracted in a thread of the default executor and
+    setup.py is run with :func:`asyncio.create_subprocess_exec`, so no
+    thread is blocked while setup.py runs. If the coroutine is cancelled,
+    a running setup.py is killed and the extracted files are removed.
+
+    :param archive_filename: a sdist archive or a wheel file
+    :param py_interpreter: The full path to the used python interpreter
+    :param cache: an optional :class:`metaextract.cache.ResultCache`
+    :param static: try to get the metadata without executing the setup.py
+                   first
+    :param limits: optional :class:`metaextract.limits.Limits` for the
+                   execution of setup.py
+    :param fields: an optional list of the keys which should be in the data
+    :param sparse: an optional :class:`metaextract.sparse.SparseExtraction`
+    :param extraction_limits: optional
+                              :class:`metaextract.limits.ExtractionLimits`
+    :param workdir: the directory the archive is extracted in
+    :param background_cleanup: remove the extracted files in a background
+                               thread
+    :param capture: replace setup() while setup.py runs (see
+                    :mod:`metaextract.capture`)
+    :param stub_imports: the top level packages which are served as stub
+                         modules (see :mod:`metaextract.stubs`)
+
+    :returns: a json blob with metadata or, if a limit was exceeded or the
+              archive is unsafe, with an ``error`` key
+    """
+    key = await _in_thread(meta_utils._cache_key, cache, archive_filename,
+                           py_interpreter, static, fields, capture,
+                           stub_imports)
+    if key is not None:
+        data = await _in_thread(cache.get, key)
+        if data is not None:
+            return data
+    if not await _in_thread(os.path.exists, archive_filename):
+        raise Exception("Archive '%s' does not exist" % (archive_filename))
+    run = functools.partial(_from_extracted, archive_filename,
+                            py_interpreter, static, limits, fields,
+                            extraction_limits, workdir,
+                            background_cleanup, capture, stub_imports)
+    try:
+        data = await _in_thread(meta_utils._read_without_extracting,
+                                archive_filename, static, extraction_limits)
+        if data is None:
+            try:
+                data = await run(sparse)
+            except meta_limits.ResultError:
+                raise
+            except Exception:
+                if sparse is None:
+                    raise
+                # try again with everything extracted
+                data = await run(None)
+    except meta_limits.ResultError as e:
+        return {'version': DATA_VERSION, 'error': e.to_dict()}
+    data = meta_utils._project(data, fields)
+    if key is not None:
+        await _in_thread(cache.put, key, data)
+    return data
+
+
+async def gather_from_archives(archives, py_interpreter=sys.executable,
+                               limit=16, return_exceptions=False, **kwargs):
+    """run :func:`async_from_archive` for many archives with at most
+    ``limit`` of them in flight at the same time
+
+    :param archives: an iterable of sdist archive or wheel filenames
+    :param py_interpreter: The full path to the used python interpreter
+    :param limit: the maximum number of concurrent extractions
+    :param return_exceptions: return exceptions as results instead of
+                              raising the first one (see
+                              :func:`asyncio.gather`)
+    :param kwargs: additional keyword arguments for
+                   :func:`async_from_archive`
+
+    :returns: a list with the results in the order of the given archives
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def _bounded(archive):
+        async with semaphore:
+            return await async_from_archive(archive, py_interpreter,
+                                            **kwargs)
+
+    return await asyncio.gather(*[_bounded(a) for a in archives],
+                                return_exceptions=return_exceptions)
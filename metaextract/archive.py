@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016, Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""open sdist archives with a single open() and without seeking
+
+The format is detected from the magic bytes, not from the filename. Tar
+archives are read as a stream (``r|``) so compressed archives are inflated
+exactly once.
+"""
+
+from __future__ import print_function
+
+from contextlib import contextmanager
+import os
+import tarfile
+import zipfile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+__all__ = [
+    "ARCHIVE_SUFFIXES",
+    "archive_size",
+    "detect_format",
+    "display_name",
+    "is_archive_name",
+    "is_fileobj",
+    "open_archive",
+    "open_source",
+]
+
+
+# the filename suffixes of the supported archives
+ARCHIVE_SUFFIXES = (
+    '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz', '.tbz2', '.tar.xz',
+    '.txz', '.tar.zst', '.tzst', '.zip', '.whl',
+)
+
+_MAGIC = (
+    (b'\x1f\x8b', 'gz'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zst'),
+    (b'PK\x03\x04', 'zip'),
+    (b'PK\x05\x06', 'zip'),
+)
+
+
+def is_archive_name(filename):
+    """check if the filename has the suffix of a supported archive"""
+    return filename.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def is_fileobj(archive):
+    """check if the archive is given as a file object instead of a
+    filename"""
+    return hasattr(archive, 'read')
+
+
+@contextmanager
+def open_source(archive):
+    """open the archive filename for reading. A (seekable) binary file
+    object is rewound to the start instead. It is not closed at the end"""
+    if is_fileobj(archive):
+        archive.seek(0)
+        yield archive
+        return
+    with open(archive, 'rb') as f:
+        yield f
+
+
+def display_name(archive):
+    """the archive filename or the name of the file object for messages"""
+    if not is_fileobj(archive):
+        return archive
+    return getattr(archive, 'name', None) or '<file object>'
+
+
+def archive_size(archive):
+    """the size of the archive filename or file object in bytes"""
+    if not is_fileobj(archive):
+        return os.path.getsize(archive)
+    return archive.seek(0, os.SEEK_END)
+
+
+def detect_format(head):
+    """detect the archive format from the first 512 bytes
+
+    :returns: ``gz``, ``bz2``, ``xz`` or ``zst`` for compressed tar archives,
+              ``tar``, ``zip`` or None if the format is unknown
+    """
+    for magic, fmt in _MAGIC:
+        if head.startswith(magic):
+            return fmt
+    if head[257:262] == b'ustar':
+        return 'tar'
+    return None
+
+
+def _open_tar_stream(fileobj, fmt):
+    if fmt == 'zst':
+        if zstandard is None:
+            raise Exception("the zstandard module is required for "
+                            "zstd compressed archives")
+        fileobj = zstandard.ZstdDecompressor().stream_reader(fileobj)
+        return tarfile.open(fileobj=fileobj, mode='r|')
+    return tarfile.open(fileobj=fileobj,
+                        mode='r|' + ('' if fmt == 'tar' else fmt))
+
+
+###############################################################################
+@contextmanager
+def open_archive(archive_filename):
+    """open a tar or zip archive. The file is opened once and the format is
+    detected from its content
+
+    :param archive_filename: the archive filename or a seekable binary file
+                             object
+
+    :returns: a context manager with a :class:`tarfile.TarFile` in streaming
+              mode (members must be read in order) or a
+              :class:`zipfile.ZipFile`
+    """
+    with open_source(archive_filename) as f:
+        fmt = detect_format(f.read(512))
+        f.seek(0)
+        if fmt is None:
+            # i.e. a zip file with a prefix or an old (v7) tar archive
+            fmt = 'zip' if zipfile.is_zipfile(f) else 'tar'
+            f.seek(0)
+        if fmt == 'zip':
+            archive = zipfile.ZipFile(f)
+        else:
+            try:
+                archive = _open_tar_stream(f, fmt)
+            except tarfile.ReadError:
+                raise Exception("Can not extract '%s'. "
+                                "Not a tar or zip file" %
+                                display_name(archive_filename))
+        with archive:
+            yield archive
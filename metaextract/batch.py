@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016, Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from concurrent import futures
+import os
+import sys
+
+from . import utils as meta_utils
+
+
+__all__ = [
+    "iter_archive_list",
+    "iter_from_archives",
+]
+
+
+def _error_record(archive, exc):
+    """build the record which is emitted for an archive that failed"""
+    return {
+        'archive': archive,
+        'error': {
+            'type': exc.__class__.__name__,
+            'message': str(exc),
+        }
+    }
+
+
+def _process_archive(archive, py_interpreter, kwargs):
+    """run from_archive() for a single archive inside a pool worker.
+    Exceptions are turned into error records so that a single broken
+    archive does not abort the whole batch"""
+    try:
+        if isinstance(py_interpreter, (list, tuple)):
+            data = {'interpreters': meta_utils.from_archive_multi(
+                archive, py_interpreter, **kwargs)}
+        else:
+            data = meta_utils.from_archive(archive, py_interpreter, **kwargs)
+    except Exception as e:
+        return _error_record(archive, e)
+    record = dict(data)
+    record['archive'] = archive
+    return record
+
+
+def iter_archive_list(fileobj):
+    """yield the archive filenames (one per line) from the given file
+    object. Empty lines are skipped"""
+    for line in fileobj:
+        line = line.strip()
+        if line:
+            yield line
+
+
+###############################################################################
+def iter_from_archives(archives, py_interpreter=sys.executable, jobs=None,
+                       **kwargs):
+    """extract metadata from many sdist archives in a process pool
+
+    The results are yielded in completion order, so a slow archive does
+    not hold back the others. ``archives`` is consumed lazily and only a
+    small, fixed number of archives is in flight at any time so memory
+    usage does not depend on the number of given archives.
+
+    :param archives: an iterable of sdist archive filenames
+    :param py_interpreter: The full path to the used python interpreter or
+                           a list of interpreters (see
+                           :func:`metaextract.utils.from_archive_multi`)
+    :param jobs: number of worker processes. Defaults to the number of CPUs
+    :param kwargs: additional keyword arguments for
+                   :func:`metaextract.utils.from_archive`, i.e. a ``cache``
+                   which is then shared by all worker processes
+
+    :returns: a generator of dicts. Each dict has an ``archive`` key and
+              either the ``version``/``data`` keys from
+              :func:`metaextract.utils.from_archive` or an ``error`` key
+              with the ``type`` and ``message`` of the failure. With a
+              list of interpreters, the dicts have an ``interpreters`` key
+              with the results by interpreter instead of ``version``/``data``
+    """
+    jobs = jobs or os.cpu_count() or 1
+    max_pending = jobs * 2
+    try:
+        with futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            pending = set()
+            for archive in archives:
+                pending.add(executor.submit(_process_archive, archive,
+                                            py_interpreter, kwargs))
+                if len(pending) < max_pending:
+                    continue
+                done, pending = futures.wait(
+                    pending, return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            for future in futures.as_completed(pending):
+                yield future.result()
+    finally:
+        # every worker has its own copy of the cache, so none of them
+        # counts all writes
+        if kwargs.get('cache') is not None:
+            kwargs['cache'].prune()
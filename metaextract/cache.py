@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016, Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from . import DATA_VERSION
+from . import archive as meta_archive
+
+
+__all__ = [
+    "ResultCache"
+]
+
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+# prints the environment of an interpreter which changes the results: the
+# prefix (i.e. a virtualenv) and the setuptools version
+_ENVIRONMENT_SCRIPT = """
+import sys
+try:
+    from importlib.metadata import version
+    setuptools_version = version('setuptools')
+except Exception:
+    try:
+        import setuptools
+        setuptools_version = setuptools.__version__
+    except Exception:
+        setuptools_version = None
+sys.stdout.write('%s\\n%s\\n' % (sys.prefix, setuptools_version))
+"""
+
+_environments_lock = threading.Lock()
+# the environment by interpreter binary identity
+_environments = {}
+
+
+def _file_sha256(filename):
+    """the hex sha256 digest of the given file's (or binary file object's)
+    content"""
+    h = hashlib.sha256()
+    with meta_archive.open_source(filename) as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _binary_identity(py_interpreter):
+    """identify an interpreter binary without starting it. The resolved
+    path together with size and mtime of the binary changes whenever the
+    interpreter is replaced or updated"""
+    path = shutil.which(py_interpreter) or py_interpreter
+    path = os.path.realpath(path)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return path
+    return "%s:%d:%d" % (path, st.st_size, int(st.st_mtime))
+
+
+def _environment(py_interpreter):
+    """the prefix and the setuptools version of the interpreter. A
+    virtualenv shares the binary with its base interpreter but not the
+    installed setuptools. The interpreter is only asked once per process"""
+    key = (py_interpreter, _binary_identity(py_interpreter))
+    with _environments_lock:
+        if key in _environments:
+            return _environments[key]
+    try:
+        output = subprocess.check_output(
+            [py_interpreter, '-c', _ENVIRONMENT_SCRIPT],
+            stderr=subprocess.DEVNULL).decode('utf-8')
+        environment = output.splitlines()
+    except (OSError, subprocess.CalledProcessError, UnicodeDecodeError):
+        environment = None
+    with _environments_lock:
+        _environments[key] = environment
+    return environment
+
+
+def _interpreter_identity(py_interpreter):
+    """identify an interpreter by its binary and its environment"""
+    identity = _binary_identity(py_interpreter)
+    environment = _environment(py_interpreter)
+    if environment is None:
+        return identity
+    return [identity] + environment
+
+
+class ResultCache(object):
+    """a persistent on-disk cache for from_archive() results
+
+    Entries are keyed on the archive content, the interpreter identity
+    and :data:`metaextract.DATA_VERSION`. Each entry is a single json file
+    which is written atomically (write to a tempfile and rename) so
+    several processes can share the same cache directory.
+
+    :param directory: the cache directory. Created if needed
+    :param max_size: maximum size of the cache in bytes. The least recently
+                     used entries are evicted first. ``None`` means unlimited
+    :param max_age: maximum age of an entry in seconds. ``None`` means
+                    unlimited
+    :param prune_interval: check the limits every ``prune_interval`` writes
+    """
+
+    def __init__(self, directory, max_size=None, max_age=None,
+                 prune_interval=100):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+        self.prune_interval = prune_interval
+        self._puts = 0
+
+    def key(self, archive_filename, py_interpreter, options=None):
+        """calculate the cache key for the given archive filename or
+        seekable binary file object
+
+        :param options: an optional json serializable dict with additional
+                        parameters which influence the result
+        """
+        h = hashlib.sha256()
+        h.update(json.dumps({
+            'archive': _file_sha256(archive_filename),
+            'interpreter': _interpreter_identity(py_interpreter),
+            'data_version': DATA_VERSION,
+            'options': options or {},
+        }, sort_keys=True).encode('utf-8'))
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def _expired(self, mtime, now):
+        return self.max_age is not None and now - mtime > self.max_age
+
+    def get(self, key):
+        """get the cached data for key or None if there is no valid entry"""
+        path = self._path(key)
+        try:
+            st = os.stat(path)
+            now = time.time()
+            if self._expired(st.st_mtime, now):
+                self._remove(path)
+                return None
+            with open(path, 'r') as f:
+                data = json.load(f)
+            # atime is used for LRU eviction, mtime keeps the creation time
+            os.utime(path, (now, st.st_mtime))
+        except (OSError, IOError):
+            return None
+        except ValueError:
+            # a broken entry. Should not happen with atomic writes
+            self._remove(path)
+            return None
+        return data
+
+    def put(self, key, data):
+        """store data for key"""
+        path = self._path(key)
+        shard = os.path.dirname(path)
+        if not os.path.isdir(shard):
+            try:
+                os.makedirs(shard)
+            except OSError:
+                # created by a concurrent process
+                if not os.path.isdir(shard):
+                    raise
+        fd, tmp_path = tempfile.mkstemp(dir=shard, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, sort_keys=True, separators=(',', ':'))
+            os.replace(tmp_path, path)
+        except Exception:
+            self._remove(tmp_path)
+            raise
+        self._puts += 1
+        if self.prune_interval and self._puts % self.prune_interval == 0:
+            self.prune()
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.unlink(path)
+        except OSError:
+            # already removed by a concurrent process
+            pass
+
+    def _entries(self):
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    yield path, os.stat(path)
+                except OSError:
+                    continue
+
+    def prune(self):
+        """remove expired entries and evict the least recently used entries
+        until the cache is smaller than max_size"""
+        if self.max_size is None and self.max_age is None:
+            return
+        now = time.time()
+        entries = []
+        total = 0
+        for path, st in self._entries():
+            if self._expired(st.st_mtime, now):
+                self._remove(path)
+                continue
+            entries.append((st.st_atime, st.st_size, path))
+            total += st.st_size
+        if self.max_size is None or total <= self.max_size:
+            return
+        entries.sort()
+        for atime, size, path in entries:
+            self._remove(path)
+            total -= size
+            if total <= self.max_size:
+                break
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016, Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""capture the setup() keyword arguments instead of running distutils
+
+In capture mode ``setuptools.setup`` and ``distutils.core.setup`` are
+replaced before the setup.py runs. The replacement converts its keyword
+arguments into the metadata, writes it like the metaextract command would
+and exits. The distribution is never finalized and no command runs.
+
+The original ``setup()`` (and with it the metaextract command) still runs
+if one of the requested keys may depend on more than the keyword
+arguments, i.e. on declarative config in setup.cfg or pyproject.toml or on
+keywords of setup() plugins like ``use_scm_version``.
+"""
+
+from __future__ import print_function
+
+import getopt
+import os
+import sys
+
+from . import DATA_VERSION
+from . import static as meta_static
+
+
+__all__ = [
+    "install",
+]
+
+
+ENGINE = "capture"
+
+# the setup() keywords the data keys are derived from. Other keys come from
+# the keyword with the same name
+_KEY_KWARGS = {
+    'contact': ('maintainer', 'author'),
+    'contact_email': ('maintainer_email', 'author_email'),
+    'fullname': ('name', 'version'),
+    'has_ext_modules': ('ext_modules',),
+}
+
+# set when the original setup() runs. A setuptools.setup() calls
+# distutils.core.setup() which must not capture again
+_fallback = []
+
+
+def _command_options(args):
+    """the options of the metaextract command in the setup.py arguments
+
+    :returns: a dict with ``output``, ``output_fd`` and ``fields`` or None
+              if the metaextract command is not run
+    """
+    for i, arg in enumerate(args):
+        if arg == 'metaextract' and args[i - 1:i] != ['--command-packages']:
+            break
+    else:
+        return None
+    try:
+        opts, rest = getopt.getopt(args[i + 1:], 'o:',
+                                   ['output=', 'output-fd=', 'fields='])
+    except getopt.GetoptError:
+        return None
+    if rest:
+        return None
+    options = {'output': None, 'output_fd': None, 'fields': None}
+    for opt, value in opts:
+        if opt in ('-o', '--output'):
+            options['output'] = value
+        elif opt == '--output-fd':
+            options['output_fd'] = value
+        else:
+            options['fields'] = set(f.strip() for f in value.split(','))
+    return options
+
+
+def _needs_distribution(attrs, keys):
+    """check if one of the data keys may need more than the keywords"""
+    for key in attrs:
+        if key not in meta_static._HANDLED_KWARGS and \
+                key not in meta_static._IGNORED_KWARGS:
+            # i.e. use_scm_version or pbr
+            return True
+    if not meta_static._has_declarative_config(os.getcwd()):
+        return False
+    for key in keys:
+        for kwarg in _KEY_KWARGS.get(key, (key,)):
+            if kwarg not in attrs:
+                return True
+    return False
+
+
+def _capture(attrs, fields):
+    """the json blob for the keywords or None if the distribution is
+    needed"""
+    try:
+        data = meta_static.setup_kwargs_to_data(attrs)
+    except meta_static._Unresolvable:
+        return None
+    if fields is not None:
+        data = dict((k, v) for k, v in data.items() if k in fields)
+    if _needs_distribution(attrs, data):
+        return None
+    return {
+        'version': DATA_VERSION,
+        'data': data,
+        'engine': ENGINE,
+    }
+
+
+def _replace(module):
+    original = module.setup
+
+    def setup(**attrs):
+        options = None if _fallback else _command_options(sys.argv[1:])
+        blob = _capture(attrs, options['fields']) if options else None
+        if blob is None:
+            _fallback.append(True)
+            return original(**attrs)
+        from . import metaextract as meta_command
+        meta_command.write_output(blob, options['output'],
+                                  options['output_fd'])
+        raise SystemExit(0)
+
+    setup._metaextract_original = original
+    module.setup = setup
+
+
+###############################################################################
+def install():
+    """replace ``setuptools.setup`` and ``distutils.core.setup`` in this
+    process. setuptools is only imported if importing distutils already
+    pulls it in (see :mod:`metaextract.forkserver`). Otherwise its setup()
+    ends in the replaced distutils setup()"""
+    modules = []
+    try:
+        import distutils.core
+        modules.append(distutils.core)
+    except ImportError:
+        pass
+    if 'setuptools' in sys.modules or 'distutils' not in sys.modules:
+        try:
+            import setuptools
+            modules.append(setuptools)
+        except ImportError:
+            pass
+    for module in modules:
+        if not hasattr(module.setup, '_metaextract_original'):
+            _replace(module)
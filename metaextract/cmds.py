@@ -19,23 +19,349 @@ from __future__ import print_function
 
 import argparse
 import json
+import os
+import signal
 import sys
 
+from . import batch as meta_batch
+from . import cache as meta_cache
+from . import forkserver as meta_forkserver
+from . import index as meta_index
+from . import limits as meta_limits
+from . import server as meta_server
+from . import sparse as meta_sparse
+from . import stubs as meta_stubs
 from . import utils as meta_utils
+from . import workdir as meta_workdir
 
 
-def main():
-    parser = argparse.ArgumentParser(prog="metaextract")
-    parser.add_argument('--python', type=str, nargs=1,
-                        help='path to the python interpreter which is used'
-                        'when calling setup.py. Defaults to %(default)s',
-                        default=sys.executable)
-    parser.add_argument('archive', type=str, nargs=1,
-                        help='filename of the archive')
-    args = parser.parse_args()
-    archive = args.archive[0]
-    data = meta_utils.from_archive(archive)
-    print(json.dumps(data, indent=4, sort_keys=True))
+def _run_batch(archives, py_interpreter, jobs, **kwargs):
+    """process many archives and print one compact json line per archive
+    as soon as it is done"""
+    for record in meta_batch.iter_from_archives(archives, py_interpreter,
+                                                jobs=jobs, **kwargs):
+        print(json.dumps(record, sort_keys=True, separators=(',', ':')))
+        sys.stdout.flush()
+
+
+def _iter_batch_input(archives, files_from):
+    """the archives given on the commandline followed by the ones listed
+    in the --files-from file"""
+    for archive in archives:
+        yield archive
+    if files_from == '-':
+        for archive in meta_batch.iter_archive_list(sys.stdin):
+            yield archive
+    elif files_from:
+        with open(files_from, 'r') as f:
+            for archive in meta_batch.iter_archive_list(f):
+                yield archive
+
+
+def _add_extraction_arguments(parser):
+    """the options which are passed to from_archive()"""
+    parser.add_argument('--python', type=str, action='append',
+                        metavar='PATH', help='path to the python '
+                        'interpreter which is used when calling setup.py. '
+                        'Can be given multiple times to get the metadata '
+                        'for every interpreter from a single extraction. '
+                        'Defaults to %s' % sys.executable)
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of parallel worker processes when '
+                        'processing multiple archives. Defaults to the '
+                        'number of CPUs')
+    parser.add_argument('--cache-dir', type=str, metavar='DIR',
+                        help='cache results in DIR. Archives which were '
+                        'already processed with the same interpreter are '
+                        'not extracted again')
+    parser.add_argument('--cache-max-size', type=int, metavar='MB',
+                        help='evict the least recently used cache entries '
+                        'when the cache grows larger than MB megabytes')
+    parser.add_argument('--cache-max-age', type=int, metavar='DAYS',
+                        help='expire cache entries after DAYS days')
+    parser.add_argument('--static', action='store_true',
+                        help='try to collect the metadata without executing '
+                        'setup.py. setup.py is only executed if that fails')
+    parser.add_argument('--capture', action='store_true',
+                        help='only record the setup() keyword arguments '
+                        'when setup.py is executed. The distribution is '
+                        'only finalized if a requested key needs it')
+    parser.add_argument('--stub-imports', type=str, nargs='?',
+                        metavar='NAME,...',
+                        const=','.join(meta_stubs.DEFAULT_STUBS),
+                        help='serve lightweight stub modules for the given '
+                        'comma separated packages while setup.py runs. '
+                        'Without NAMEs: %(const)s')
+    parser.add_argument('--warm', action='store_true',
+                        help='run setup.py files in warm worker '
+                        'interpreters which already imported setuptools '
+                        'instead of starting a new interpreter every time')
+    parser.add_argument('--warm-max-jobs', type=int, default=100,
+                        metavar='N', help='replace a warm worker after N '
+                        'setup.py runs. Defaults to %(default)s')
+    parser.add_argument('--timeout', type=float, metavar='SECONDS',
+                        help='kill setup.py (and everything it started) '
+                        'after SECONDS seconds')
+    parser.add_argument('--cpu-time', type=int, metavar='SECONDS',
+                        help='limit the cpu time of setup.py')
+    parser.add_argument('--memory', type=int, metavar='MB',
+                        help='limit the address space of setup.py')
+    parser.add_argument('--max-output', type=int, metavar='MB',
+                        help='limit the output of setup.py')
+    parser.add_argument('--max-extract-size', type=int, metavar='MB',
+                        default=4096, help='stop extracting archives with '
+                        'more than MB megabytes. Defaults to %(default)s')
+    parser.add_argument('--max-members', type=int, metavar='N',
+                        default=200000, help='stop extracting archives with '
+                        'more than N members. Defaults to %(default)s')
+    parser.add_argument('--max-ratio', type=int, metavar='N', default=1000,
+                        help='stop extracting archives with a compression '
+                        'ratio of more than N. Defaults to %(default)s')
+    parser.add_argument('--workdir', type=str, metavar='DIR',
+                        default=os.environ.get(meta_workdir.ENV_WORKDIR),
+                        help='extract the archives in DIR (i.e. a tmpfs). '
+                        'Defaults to $%s or the default temp directory' %
+                        meta_workdir.ENV_WORKDIR)
+    parser.add_argument('--background-cleanup', action='store_true',
+                        help='remove the extracted files in a background '
+                        'thread instead of before printing the result')
+    parser.add_argument('--fields', type=str, metavar='KEY,...',
+                        help='only extract the given comma separated keys '
+                        '(i.e. install_requires,extras_require)')
+    parser.add_argument('--sparse', action='store_true',
+                        help='extract large and binary files as empty '
+                        'placeholders. The archive is extracted again in '
+                        'full if that fails')
+    parser.add_argument('--sparse-threshold', type=int, metavar='KB',
+                        default=meta_sparse.DEFAULT_THRESHOLD // 1024,
+                        help='extract other files only up to KB kilobytes '
+                        'in full. Defaults to %(default)s')
+    parser.add_argument('--sparse-allow', action='append', default=[],
+                        metavar='GLOB', help='always extract files matching '
+                        'GLOB in full. Can be given multiple times')
+    parser.add_argument('--sparse-deny', action='append', default=[],
+                        metavar='GLOB', help='never extract files matching '
+                        'GLOB. Can be given multiple times')
+
+
+def _extraction_kwargs(args):
+    """the keyword arguments for from_archive() from the parsed options"""
+    cache = None
+    if args.cache_dir:
+        cache = meta_cache.ResultCache(
+            args.cache_dir,
+            max_size=args.cache_max_size and args.cache_max_size * 1024 ** 2,
+            max_age=args.cache_max_age and args.cache_max_age * 86400)
+    kwargs = {
+        'cache': cache,
+        'static': args.static,
+        'capture': args.capture,
+        'workdir': args.workdir,
+        'background_cleanup': args.background_cleanup,
+        'extraction_limits': meta_limits.ExtractionLimits(
+            max_bytes=args.max_extract_size * 1024 ** 2,
+            max_members=args.max_members, max_ratio=args.max_ratio),
+    }
+    if args.fields:
+        kwargs['fields'] = [f.strip() for f in args.fields.split(',')
+                            if f.strip()]
+    if args.stub_imports:
+        kwargs['stub_imports'] = [n.strip() for n in
+                                  args.stub_imports.split(',') if n.strip()]
+    if args.sparse:
+        kwargs['sparse'] = meta_sparse.SparseExtraction(
+            threshold=args.sparse_threshold * 1024,
+            allow=args.sparse_allow, deny=args.sparse_deny)
+    if args.timeout or args.cpu_time or args.memory or args.max_output:
+        kwargs['limits'] = meta_limits.Limits(
+            timeout=args.timeout, cpu_time=args.cpu_time,
+            memory=args.memory and args.memory * 1024 ** 2,
+            max_output=args.max_output and args.max_output * 1024 ** 2)
+    if args.warm:
+        kwargs['worker_pool'] = meta_forkserver.WorkerPool(
+            max_jobs=args.warm_max_jobs)
+    return kwargs
+
+
+def _index_main(argv):
+    """the ``metaextract index`` subcommand"""
+    parser = argparse.ArgumentParser(prog="metaextract index")
+    parser.add_argument('--db', type=str, metavar='FILE', required=True,
+                        help='the SQLite database of the index. Created if '
+                        'needed')
+    parser.add_argument('--requires', type=str, metavar='NAME',
+                        help='print one json line for every indexed archive '
+                        'which requires the project NAME')
+    parser.add_argument('--retry-errors', action='store_true',
+                        help='process archives again which failed before')
+    _add_extraction_arguments(parser)
+    parser.add_argument('mirror', type=str, nargs='?',
+                        help='the mirror directory. The index is updated '
+                        'with the new and changed archives in it')
+    args = parser.parse_args(argv)
+    if not args.mirror and not args.requires:
+        parser.error('a mirror directory or --requires is required')
+    if args.python and len(args.python) > 1:
+        parser.error('the index supports only one --python')
+    with meta_index.MirrorIndex(args.db) as index:
+        if args.mirror:
+            stats = index.update(args.mirror,
+                                 (args.python or [sys.executable])[0],
+                                 args.jobs,
+                                 retry_errors=args.retry_errors,
+                                 **_extraction_kwargs(args))
+            print(json.dumps(stats, sort_keys=True), file=sys.stderr)
+        if args.requires:
+            for row in index.requires(args.requires):
+                print(json.dumps(row, sort_keys=True,
+                                 separators=(',', ':')))
+
+
+def _default_cache_dir():
+    cache_home = os.environ.get('XDG_CACHE_HOME')
+    if not cache_home:
+        cache_home = os.path.expanduser('~/.cache')
+    return os.path.join(cache_home, 'metaextract')
+
+
+def _serve_main(argv):
+    """the ``metaextract serve`` subcommand"""
+    parser = argparse.ArgumentParser(prog="metaextract serve")
+    parser.add_argument('--socket', type=str, metavar='PATH',
+                        default=os.environ.get(meta_server.ENV_SOCKET),
+                        help='listen on the Unix domain socket PATH. '
+                        'Defaults to $%s' % meta_server.ENV_SOCKET)
+    parser.add_argument('--max-pending', type=int, default=64, metavar='N',
+                        help='stop accepting connections while N requests '
+                        'wait for a free job. Defaults to %(default)s')
+    parser.add_argument('--max-upload', type=int, default=512, metavar='MB',
+                        help='reject uploaded archives with more than MB '
+                        'megabytes. Defaults to %(default)s')
+    parser.add_argument('--read-timeout', type=float, default=30,
+                        metavar='SECONDS',
+                        help='disconnect clients which send nothing for '
+                        'SECONDS while the request is read. Defaults to '
+                        '%(default)s')
+    _add_extraction_arguments(parser)
+    args = parser.parse_args(argv)
+    if not args.socket:
+        parser.error('--socket or $%s is required' % meta_server.ENV_SOCKET)
+    if not args.cache_dir:
+        args.cache_dir = _default_cache_dir()
+    kwargs = _extraction_kwargs(args)
+    if 'worker_pool' not in kwargs and hasattr(os, 'fork'):
+        kwargs['worker_pool'] = meta_forkserver.WorkerPool(
+            max_jobs=args.warm_max_jobs)
+    py_interpreter = args.python or [sys.executable]
+    if len(py_interpreter) == 1:
+        py_interpreter = py_interpreter[0]
+    server = meta_server.Server(
+        args.socket, py_interpreter, jobs=args.jobs,
+        max_pending=args.max_pending,
+        max_upload=args.max_upload * 1024 ** 2,
+        read_timeout=args.read_timeout, **kwargs)
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.shutdown())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if 'worker_pool' in kwargs:
+            kwargs['worker_pool'].close()
+        meta_workdir.wait_for_cleanup()
+
+
+def _client_main(client, args, py_interpreter):
+    """process the archives with the daemon"""
+    if args.python is None:
+        # the interpreter of the daemon
+        py_interpreter = None
+    fields = None
+    if args.fields:
+        fields = [f.strip() for f in args.fields.split(',') if f.strip()]
+    if args.archive == ['-'] and not args.files_from:
+        data = client.from_fileobj(sys.stdin.buffer, fields, py_interpreter)
+        print(json.dumps(data, indent=4, sort_keys=True))
+        return
+    if len(args.archive) == 1 and not args.files_from:
+        data = client.from_archive(args.archive[0], fields, py_interpreter)
+        print(json.dumps(data, indent=4, sort_keys=True))
+        return
+    for archive in _iter_batch_input(args.archive, args.files_from):
+        record = dict(client.from_archive(archive, fields, py_interpreter))
+        record['archive'] = archive
+        print(json.dumps(record, sort_keys=True, separators=(',', ':')))
+        sys.stdout.flush()
+
+
+def _local_main(parser, args, py_interpreter, kwargs):
+    """process the archives in this process (or its process pool)"""
+    if args.archive == ['-'] and not args.files_from:
+        if isinstance(py_interpreter, list):
+            parser.error('"-" can only be used with a single --python')
+        data = meta_utils.from_fileobj(sys.stdin.buffer, py_interpreter,
+                                       **kwargs)
+        print(json.dumps(data, indent=4, sort_keys=True))
+        return
+    if len(args.archive) == 1 and not args.files_from:
+        if isinstance(py_interpreter, list):
+            data = meta_utils.from_archive_multi(args.archive[0],
+                                                 py_interpreter, **kwargs)
+        else:
+            data = meta_utils.from_archive(args.archive[0], py_interpreter,
+                                           **kwargs)
+        print(json.dumps(data, indent=4, sort_keys=True))
+        return
+    _run_batch(_iter_batch_input(args.archive, args.files_from),
+               py_interpreter, args.jobs, **kwargs)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv[:1] == ['index']:
+        return _index_main(argv[1:])
+    if argv[:1] == ['serve']:
+        return _serve_main(argv[1:])
+    parser = argparse.ArgumentParser(
+        prog="metaextract",
+        epilog='use "metaextract index --help" for the mirror index and '
+        '"metaextract serve --help" for the extraction daemon')
+    _add_extraction_arguments(parser)
+    parser.add_argument('--files-from', type=str, metavar='FILE',
+                        help='read additional archive filenames (one per '
+                        'line) from FILE. Use "-" to read from stdin')
+    parser.add_argument('--server', type=str, metavar='PATH',
+                        default=os.environ.get(meta_server.ENV_SOCKET),
+                        help='let the "metaextract serve" daemon on the Unix '
+                        'domain socket PATH process the archives if it '
+                        'is running. Only --python and --fields are passed '
+                        'on, the daemon uses its own options otherwise. '
+                        'Defaults to $%s' % meta_server.ENV_SOCKET)
+    parser.add_argument('archive', type=str, nargs='*',
+                        help='filename of the archive. Use "-" to read a '
+                        'single archive from stdin. If multiple archives '
+                        'are given, one json line per archive is printed')
+    args = parser.parse_args(argv)
+    # with multiple interpreters, the results are printed by interpreter
+    py_interpreter = args.python or [sys.executable]
+    if len(py_interpreter) == 1:
+        py_interpreter = py_interpreter[0]
+    if '-' in args.archive and args.archive != ['-']:
+        parser.error('"-" can only be used as the only archive')
+    if not args.archive and not args.files_from:
+        parser.error('at least one archive or --files-from is required')
+    if args.server:
+        client = meta_server.Client(args.server)
+        if client.available():
+            return _client_main(client, args, py_interpreter)
+    kwargs = _extraction_kwargs(args)
+    try:
+        _local_main(parser, args, py_interpreter, kwargs)
+    finally:
+        # the cache is only pruned every so many writes of one process
+        if kwargs['cache'] is not None:
+            kwargs['cache'].prune()
 
 
 # for debugging
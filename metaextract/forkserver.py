@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016, Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""warm worker interpreters which run setup.py in a forked child
+
+A worker is started once per interpreter with ``python -m
+metaextract.forkserver``. It imports distutils/setuptools and the
+metaextract command and then waits for requests (one json line per request)
+on stdin. Every request is executed in a forked child, so each setup.py
+still runs in its own process but the interpreter startup and the imports
+are only paid once per worker.
+"""
+
+from __future__ import print_function
+
+import atexit
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from . import limits as meta_limits
+
+
+__all__ = [
+    "WorkerPool",
+]
+
+
+def _maxrss():
+    """the peak resident set size of this process in bytes"""
+    if resource is None:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def _preimport():
+    """import the modules every setup.py run needs. setuptools is only
+    imported if importing distutils already pulls it in (the distutils shim
+    of setuptools >= 60). Otherwise importing it would monkeypatch distutils
+    and change the results for plain distutils setup.py files"""
+    try:
+        import distutils.core  # noqa: F401
+    except ImportError:
+        pass
+    if 'setuptools' in sys.modules or 'distutils' not in sys.modules:
+        try:
+            import setuptools  # noqa: F401
+        except ImportError:
+            pass
+    import metaextract.metaextract  # noqa: F401
+
+
+def _exec_setup_py(root_dir, args, env):
+    """run setup.py in the current (forked) process the same way
+    ``python setup.py args`` would do it. Returns the exit code"""
+    os.chdir(root_dir)
+    os.environ.clear()
+    os.environ.update(env)
+    sys.argv = ['setup.py'] + args
+    sys.path[0] = root_dir
+    try:
+        with open('setup.py', 'rb') as f:
+            code = compile(f.read(), 'setup.py', 'exec')
+        exec(code, {'__name__': '__main__', '__file__': 'setup.py',
+                    '__builtins__': __builtins__})
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException:
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+def _wait(pid, log, limits):
+    """wait until the child exited. With a timeout or a max_output, the
+    child is polled and its process group is killed when a limit is
+    exceeded. The child is not reaped (see
+    :func:`metaextract.limits.has_exited`)
+
+    :returns: the name of the exceeded limit or None
+    """
+    if not limits.timeout and not limits.max_output:
+        meta_limits.wait_exited(pid)
+        return None
+    deadline = time.time() + limits.timeout if limits.timeout else None
+    while not meta_limits.has_exited(pid):
+        limit = None
+        if deadline is not None and time.time() > deadline:
+            limit = 'timeout'
+        elif limits.max_output and \
+                os.fstat(log.fileno()).st_size > limits.max_output:
+            limit = 'max_output'
+        if limit is not None:
+            meta_limits.kill_group(pid)
+            return limit
+        time.sleep(0.01)
+    return None
+
+
+def _run_forked(request):
+    """fork a child for the given request and wait for it. Returns the exit
+    status, the combined stdout/stderr of the child and the name of the
+    exceeded limit (or None)"""
+    limits = request.get('limits')
+    if limits is not None:
+        limits = meta_limits.Limits.from_dict(limits)
+    with tempfile.TemporaryFile() as log:
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                devnull = os.open(os.devnull, os.O_RDONLY)
+                os.dup2(devnull, 0)
+                os.dup2(log.fileno(), 1)
+                os.dup2(log.fileno(), 2)
+                if limits is not None:
+                    os.setsid()
+                    meta_limits.set_rlimits(limits.cpu_time, limits.memory)
+                if request.get('stub_imports'):
+                    from . import stubs as meta_stubs
+                    meta_stubs.install(request['stub_imports'])
+                if request.get('capture'):
+                    from . import capture as meta_capture
+                    meta_capture.install()
+                status = _exec_setup_py(request['dir'], request['args'],
+                                        request['env'])
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(status)
+        limit = None
+        if limits is not None:
+            limit = _wait(pid, log, limits)
+            # kill what is left of the group before the child is reaped.
+            # Until then, the group id can't belong to another process
+            meta_limits.kill_group(pid)
+        returncode = meta_limits.reap(pid)
+        log.seek(0)
+        output = log.read().decode('utf-8', 'replace')
+    return returncode, output, limit
+
+
+def serve(infile, outfile):
+    """answer the requests from infile until it is closed"""
+    _preimport()
+    outfile.write(json.dumps({'maxrss': _maxrss()}) + "\n")
+    outfile.flush()
+    for line in infile:
+        status, output, limit = _run_forked(json.loads(line))
+        outfile.write(json.dumps({'status': status, 'output': output,
+                                  'limit': limit,
+                                  'maxrss': _maxrss()}) + "\n")
+        outfile.flush()
+
+
+class _Worker(object):
+    """the client side of a single worker process"""
+    def __init__(self, py_interpreter):
+        self.py_interpreter = py_interpreter
+        self.jobs = 0
+        self.process = subprocess.Popen(
+            [py_interpreter, '-m', 'metaextract.forkserver'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            universal_newlines=True)
+        self.initial_rss = self.maxrss = self._read()['maxrss']
+
+    def _read(self):
+        line = self.process.stdout.readline()
+        if not line:
+            self.close()
+            raise Exception("Worker for '%s' died" % self.py_interpreter)
+        return json.loads(line)
+
+    def run(self, root_dir, args, limits=None, capture=False,
+            stub_imports=None):
+        self.jobs += 1
+        self.process.stdin.write(json.dumps({
+            'dir': root_dir,
+            'args': args,
+            'env': dict(os.environ),
+            'limits': limits.to_dict() if limits is not None else None,
+            'capture': capture,
+            'stub_imports': list(stub_imports or ()),
+        }) + "\n")
+        self.process.stdin.flush()
+        response = self._read()
+        self.maxrss = response['maxrss']
+        return response['status'], response['output'], response['limit']
+
+    def close(self):
+        for f in (self.process.stdin, self.process.stdout):
+            try:
+                f.close()
+            except (IOError, OSError):
+                pass
+        self.process.wait()
+
+
+###############################################################################
+class WorkerPool(object):
+    """a pool of warm worker interpreters which run setup.py files
+
+    Workers are started on demand (one per concurrent caller and
+    interpreter) and reused afterwards. A worker is replaced after
+    ``max_jobs`` jobs or when its memory usage grew by more than
+    ``max_memory_growth`` bytes since it was started.
+
+    A pool which is passed to another process (i.e. to the workers of
+    :func:`metaextract.batch.iter_from_archives`) becomes a pool with the
+    same settings which is shared by everything in that process.
+
+    :param max_jobs: recycle a worker after that many jobs
+    :param max_memory_growth: recycle a worker when its peak memory usage
+                              grew by more than that many bytes
+    """
+    def __init__(self, max_jobs=100, max_memory_growth=64 * 1024 ** 2):
+        if not hasattr(os, 'fork'):
+            raise Exception("Worker pools need os.fork()")
+        self.max_jobs = max_jobs
+        self.max_memory_growth = max_memory_growth
+        self._lock = threading.Lock()
+        self._idle = {}
+
+    def __reduce__(self):
+        return (_process_pool, (self.max_jobs, self.max_memory_growth))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _acquire(self, py_interpreter):
+        with self._lock:
+            idle = self._idle.get(py_interpreter)
+            if idle:
+                return idle.pop()
+        return _Worker(py_interpreter)
+
+    def _release(self, worker):
+        if worker.jobs >= self.max_jobs or \
+                worker.maxrss - worker.initial_rss > self.max_memory_growth:
+            worker.close()
+            return
+        with self._lock:
+            self._idle.setdefault(worker.py_interpreter, []).append(worker)
+
+    def check_output(self, py_interpreter, root_dir, args, limits=None,
+                     capture=False, stub_imports=None):
+        """run ``setup.py args`` in root_dir with a warm worker for the
+        given interpreter. Behaves like :func:`subprocess.check_output`
+
+        :param limits: optional :class:`metaextract.limits.Limits` for the
+                       forked child
+        :param capture: replace setup() in the forked child (see
+                        :mod:`metaextract.capture`)
+        :param stub_imports: the top level packages which are served as
+                             stub modules in the forked child (see
+                             :mod:`metaextract.stubs`)
+
+        :returns: the combined stdout and stderr of the run
+        """
+        worker = self._acquire(py_interpreter)
+        try:
+            status, output, limit = worker.run(os.path.abspath(root_dir),
+                                               args, limits, capture,
+                                               stub_imports)
+        except BaseException:
+            worker.close()
+            raise
+        self._release(worker)
+        if limit == 'timeout':
+            raise meta_limits.LimitExceeded(
+                'timeout', "setup.py did not finish within %s seconds" %
+                limits.timeout)
+        if limit == 'max_output':
+            raise meta_limits.output_exceeded(limits)
+        if limits is not None:
+            meta_limits.check_status(limits, status, output)
+        if status != 0:
+            raise subprocess.CalledProcessError(
+                status, [py_interpreter, 'setup.py'] + args, output=output)
+        return output
+
+    def close(self):
+        """stop all idle workers"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for workers in idle.values():
+            for worker in workers:
+                worker.close()
+
+
+# the pools which were passed to this process, by settings
+_process_pools = {}
+
+
+def _process_pool(max_jobs, max_memory_growth):
+    key = (max_jobs, max_memory_growth)
+    if key not in _process_pools:
+        _process_pools[key] = WorkerPool(max_jobs, max_memory_growth)
+        atexit.register(_process_pools[key].close)
+    return _process_pools[key]
+
+
+if __name__ == '__main__':
+    # keep stdout for the answers. Everything else which is printed by
+    # this process goes to stderr
+    _answers = os.fdopen(os.dup(1), 'w')
+    os.dup2(2, 1)
+    serve(sys.stdin, _answers)
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016, Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""an incremental SQLite index of the archives in a local mirror
+
+The index records size, mtime, sha256 and the extracted metadata of every
+archive in a mirror directory (i.e. a PEP 503 simple index). On later runs
+only archives which are new or whose size or mtime changed are hashed and
+only archives whose content changed are processed again.
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import re
+import sqlite3
+import sys
+
+from . import DATA_VERSION
+from . import archive as meta_archive
+from . import batch as meta_batch
+from . import cache as meta_cache
+
+
+__all__ = [
+    "MirrorIndex",
+    "normalize_name",
+]
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS archives (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    name TEXT,
+    version TEXT,
+    error TEXT,
+    result TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS requires (
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    extra TEXT,
+    requirement TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS requires_name ON requires (name);
+CREATE INDEX IF NOT EXISTS requires_path ON requires (path);
+"""
+
+# commit after that many processed archives, so an interrupted run keeps
+# most of its work
+_COMMIT_INTERVAL = 500
+
+_NAME_RE = re.compile(r'^\s*([A-Za-z0-9][A-Za-z0-9._-]*)')
+
+
+def normalize_name(name):
+    """the normalized project name as defined in PEP 503"""
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def _requirements(data):
+    """the (extra, requirement) tuples of the extracted data. extra is None
+    for the install_requires"""
+    install_requires = data.get('install_requires') or []
+    if isinstance(install_requires, str):
+        install_requires = install_requires.splitlines()
+    for requirement in install_requires:
+        yield None, requirement
+    extras_require = data.get('extras_require') or {}
+    for extra in sorted(extras_require):
+        requirements = extras_require[extra]
+        if isinstance(requirements, str):
+            requirements = requirements.splitlines()
+        for requirement in requirements:
+            yield extra, requirement
+
+
+def _iter_mirror(mirror_dir):
+    """yield the relative path (with ``/``) and the stat result of every
+    archive below mirror_dir"""
+    for root, dirs, files in os.walk(mirror_dir):
+        dirs.sort()
+        for filename in sorted(files):
+            if not meta_archive.is_archive_name(filename):
+                continue
+            path = os.path.join(root, filename)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            relpath = os.path.relpath(path, mirror_dir)
+            yield relpath.replace(os.sep, '/'), st
+
+
+###############################################################################
+class MirrorIndex(object):
+    """a SQLite index of the archives in a mirror directory
+
+    The paths in the index are relative to the mirror directory, so a
+    mirror can be moved without indexing it again.
+
+    :param db_filename: the SQLite database. Created if needed
+    """
+    def __init__(self, db_filename):
+        self._db = sqlite3.connect(db_filename)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.executescript(_SCHEMA)
+        row = self._db.execute(
+            "SELECT value FROM meta WHERE key = 'data_version'").fetchone()
+        # results of another data version are extracted again
+        self._outdated = row is not None and row[0] != str(DATA_VERSION)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def _store(self, relpath, st, sha256, record):
+        record = dict(record)
+        record.pop('archive', None)
+        data = record.get('data') or {}
+        error = record.get('error')
+        self._db.execute("DELETE FROM requires WHERE path = ?", (relpath,))
+        self._db.execute(
+            "INSERT OR REPLACE INTO archives VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (relpath, st.st_size, st.st_mtime_ns, sha256, data.get('name'),
+             data.get('version'), error and error['type'],
+             json.dumps(record, sort_keys=True)))
+        rows = []
+        for extra, requirement in _requirements(data):
+            match = _NAME_RE.match(requirement)
+            if match:
+                rows.append((relpath, normalize_name(match.group(1)), extra,
+                             requirement.strip()))
+        self._db.executemany("INSERT INTO requires VALUES (?, ?, ?, ?)",
+                             rows)
+
+    def _remove(self, relpaths):
+        for relpath in relpaths:
+            self._db.execute("DELETE FROM requires WHERE path = ?",
+                             (relpath,))
+            self._db.execute("DELETE FROM archives WHERE path = ?",
+                             (relpath,))
+
+    def update(self, mirror_dir, py_interpreter=sys.executable, jobs=None,
+               retry_errors=False, **kwargs):
+        """bring the index up to date with the archives in mirror_dir
+
+        Archives with the same size and mtime as in the index are skipped
+        without reading them. Archives with a different size or mtime are
+        hashed and only processed if their content changed. Archives which
+        are not in mirror_dir anymore are removed from the index.
+
+        :param mirror_dir: the mirror directory
+        :param py_interpreter: The full path to the used python interpreter
+        :param jobs: number of worker processes. Defaults to the number of
+                     CPUs
+        :param retry_errors: process archives again which failed before
+        :param kwargs: additional keyword arguments for
+                       :func:`metaextract.utils.from_archive`
+
+        :returns: a dict with the number of ``added``, ``updated``,
+                  ``unchanged``, ``removed`` and ``failed`` archives
+        """
+        stats = dict.fromkeys(
+            ('added', 'updated', 'unchanged', 'removed', 'failed'), 0)
+        known = {}
+        for row in self._db.execute(
+                "SELECT path, size, mtime_ns, sha256, error FROM archives"):
+            known[row[0]] = row[1:]
+        todo = {}
+        with self._db:
+            for relpath, st in _iter_mirror(mirror_dir):
+                path = os.path.join(mirror_dir, relpath)
+                entry = known.pop(relpath, None)
+                sha256 = None
+                if entry is not None and not self._outdated and \
+                        not (retry_errors and entry[3]):
+                    size, mtime_ns = entry[:2]
+                    if (size, mtime_ns) == (st.st_size, st.st_mtime_ns):
+                        stats['unchanged'] += 1
+                        continue
+                    if size == st.st_size:
+                        sha256 = meta_cache._file_sha256(path)
+                        if sha256 == entry[2]:
+                            # touched, but not changed
+                            self._db.execute(
+                                "UPDATE archives SET mtime_ns = ? "
+                                "WHERE path = ?", (st.st_mtime_ns, relpath))
+                            stats['unchanged'] += 1
+                            continue
+                if sha256 is None:
+                    # hashed before processing, so the stored digest is the
+                    # one of the processed content
+                    sha256 = meta_cache._file_sha256(path)
+                todo[path] = (relpath, st, sha256,
+                              'added' if entry is None else 'updated')
+            self._remove(known)
+            stats['removed'] = len(known)
+        pending = 0
+        for record in meta_batch.iter_from_archives(
+                list(todo), py_interpreter, jobs=jobs, **kwargs):
+            relpath, st, sha256, kind = todo[record['archive']]
+            self._store(relpath, st, sha256, record)
+            stats['failed' if 'error' in record else kind] += 1
+            pending += 1
+            if pending >= _COMMIT_INTERVAL:
+                self._db.commit()
+                pending = 0
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('data_version', ?)",
+                (str(DATA_VERSION),))
+        self._outdated = False
+        return stats
+
+    def requires(self, name):
+        """the archives which require the project with the given name,
+        either directly or in one of their extras
+
+        :returns: a list of dicts with the ``path``, ``name`` and
+                  ``version`` of the archive and the ``requirement`` and
+                  ``extra`` (None for ``install_requires``)
+        """
+        rows = self._db.execute(
+            "SELECT a.path, a.name, a.version, r.requirement, r.extra "
+            "FROM requires r JOIN archives a ON a.path = r.path "
+            "WHERE r.name = ? ORDER BY a.path, r.extra",
+            (normalize_name(name),))
+        return [dict(zip(('path', 'name', 'version', 'requirement',
+                          'extra'), row)) for row in rows]
+
+    def get(self, path):
+        """the stored result of the archive with the given path (relative
+        to the mirror directory) or None"""
+        row = self._db.execute("SELECT result FROM archives WHERE path = ?",
+                               (path,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
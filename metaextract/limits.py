@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016, Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""limits for the extraction of archives and the execution of setup.py
+
+The cpu time and memory limits are applied by running setup.py through
+``python -m metaextract.limits`` which sets the rlimits (and installs the
+stub modules and the replaced setup() if requested) and then runs the
+setup.py in the same process.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+__all__ = [
+    "ExtractionLimits",
+    "LimitExceeded",
+    "Limits",
+    "ResultError",
+    "UnsafeArchive",
+]
+
+
+# the compression ratio is only checked for archives with more data. Small
+# archives with a high ratio are harmless
+_RATIO_MIN_BYTES = 1024 ** 2
+
+# waitid() can wait for a child without reaping it
+_HAS_WAITID = hasattr(os, 'waitid') and hasattr(os, 'WNOWAIT')
+
+# the wait status of the children which has_exited() had to reap
+_reaped = {}
+
+
+class ResultError(Exception):
+    """an error which is returned as structured error instead of metadata
+    (see :meth:`to_dict`) so a batch run can continue"""
+    def to_dict(self):
+        """the structured error which is returned instead of metadata"""
+        return {
+            'type': self.__class__.__name__,
+            'message': str(self),
+        }
+
+
+class LimitExceeded(ResultError):
+    """the extraction or a setup.py run was stopped because it exceeded one
+    of the limits
+
+    :param limit: the name of the exceeded limit (i.e. ``timeout``)
+    """
+    def __init__(self, limit, message):
+        super(LimitExceeded, self).__init__(message)
+        self.limit = limit
+
+    def to_dict(self):
+        d = super(LimitExceeded, self).to_dict()
+        d['limit'] = self.limit
+        return d
+
+
+class UnsafeArchive(ResultError):
+    """the archive has members which would be written outside of the
+    extraction directory or which are not regular files, directories or
+    links"""
+
+
+class ExtractionLimits(object):
+    """limits for the extraction of an archive. They are checked for every
+    member before it is extracted, so the extraction stops early. None
+    disables a limit
+
+    :param max_bytes: the maximum number of uncompressed bytes
+    :param max_members: the maximum number of members
+    :param max_ratio: the maximum ratio between the uncompressed bytes and
+                      the archive size
+    """
+    def __init__(self, max_bytes=4 * 1024 ** 3, max_members=200000,
+                 max_ratio=1000):
+        self.max_bytes = max_bytes
+        self.max_members = max_members
+        self.max_ratio = max_ratio
+
+    def check(self, members, size, archive_size):
+        """raise :class:`LimitExceeded` if the given number of members or
+        uncompressed bytes is too large"""
+        if self.max_members is not None and members > self.max_members:
+            raise LimitExceeded(
+                'max_members', "the archive has more than %d members" %
+                self.max_members)
+        if self.max_bytes is not None and size > self.max_bytes:
+            raise LimitExceeded(
+                'max_bytes', "the archive has more than %d uncompressed "
+                "bytes" % self.max_bytes)
+        if self.max_ratio is not None and size > _RATIO_MIN_BYTES and \
+                size > self.max_ratio * archive_size:
+            raise LimitExceeded(
+                'max_ratio', "the archive has a compression ratio of more "
+                "than %d" % self.max_ratio)
+
+
+class Limits(object):
+    """resource limits for the execution of a setup.py
+
+    :param timeout: wall clock time in seconds. The whole process group of
+                    setup.py is killed when it is exceeded
+    :param cpu_time: cpu time in seconds (``RLIMIT_CPU``)
+    :param memory: address space in bytes (``RLIMIT_AS``)
+    :param max_output: the maximum number of bytes setup.py may print or
+                       write as metadata
+    """
+    def __init__(self, timeout=None, cpu_time=None, memory=None,
+                 max_output=None):
+        self.timeout = timeout
+        self.cpu_time = cpu_time
+        self.memory = memory
+        self.max_output = max_output
+
+    def to_dict(self):
+        return {
+            'timeout': self.timeout,
+            'cpu_time': self.cpu_time,
+            'memory': self.memory,
+            'max_output': self.max_output,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**d)
+
+    def launcher_args(self, capture=False, stub_imports=None):
+        """the interpreter arguments to run setup.py with the rlimits (and
+        the replaced setup() of :mod:`metaextract.capture` and the stub
+        modules of :mod:`metaextract.stubs`)"""
+        if not self.cpu_time and not self.memory and not capture and \
+                not stub_imports:
+            return []
+        args = ['-m', 'metaextract.limits']
+        if self.cpu_time:
+            args += ['--cpu-time', str(self.cpu_time)]
+        if self.memory:
+            args += ['--memory', str(self.memory)]
+        if capture:
+            args += ['--capture']
+        if stub_imports:
+            args += ['--stub-imports', ','.join(stub_imports)]
+        return args + ['--']
+
+
+def set_rlimits(cpu_time=None, memory=None):
+    """set the cpu time and address space limits of this process"""
+    if resource is None:
+        return
+    if cpu_time:
+        # SIGXCPU at the soft limit, SIGKILL one second later
+        resource.setrlimit(resource.RLIMIT_CPU,
+                           (int(cpu_time), int(cpu_time) + 1))
+    if memory:
+        resource.setrlimit(resource.RLIMIT_AS, (int(memory), int(memory)))
+
+
+def kill_group(pid):
+    """kill the process group (session) which was started for pid. The
+    child must not be reaped yet. Otherwise its pid (and so the group id)
+    may already belong to another process"""
+    if pid in _reaped:
+        return
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+def has_exited(pid):
+    """check if the child exited. It is not reaped, so its process group
+    can still be killed. Without waitid(), the child has to be reaped and
+    :func:`kill_group` does nothing for it"""
+    if _HAS_WAITID:
+        return os.waitid(os.P_PID, pid,
+                         os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None
+    wpid, status = os.waitpid(pid, os.WNOHANG)
+    if wpid:
+        _reaped[pid] = status
+    return bool(wpid)
+
+
+def wait_exited(pid, timeout=None):
+    """wait until the child exited (see :func:`has_exited`)
+
+    :returns: False if the timeout expired before
+    """
+    if timeout is None and _HAS_WAITID:
+        os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT)
+        return True
+    deadline = time.time() + timeout if timeout is not None else None
+    delay = 0.0005
+    while not has_exited(pid):
+        if deadline is not None and time.time() >= deadline:
+            return False
+        time.sleep(delay)
+        delay = min(delay * 2, 0.05)
+    return True
+
+
+def reap(pid):
+    """reap the exited child
+
+    :returns: the exit code like :attr:`subprocess.Popen.returncode`
+    """
+    status = _reaped.pop(pid, None)
+    if status is None:
+        status = os.waitpid(pid, 0)[1]
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def check_status(limits, returncode, output):
+    """raise :class:`LimitExceeded` if a failed run was stopped by the
+    cpu time or memory limit"""
+    if returncode == 0:
+        return
+    sigxcpu = getattr(signal, 'SIGXCPU', None)
+    # a shell reports a signal as 128 + the signal number
+    if limits.cpu_time and sigxcpu is not None and \
+            returncode in (-sigxcpu, 128 + sigxcpu, -signal.SIGKILL,
+                           128 + signal.SIGKILL):
+        raise LimitExceeded(
+            'cpu_time', "setup.py exceeded the cpu time limit of %s "
+            "seconds" % limits.cpu_time)
+    if not isinstance(output, bytes):
+        output = (output or '').encode('utf-8', 'replace')
+    if limits.memory and b'MemoryError' in output:
+        raise LimitExceeded(
+            'memory', "setup.py exceeded the memory limit of %s bytes" %
+            limits.memory)
+
+
+class OutputCollector(object):
+    """read a file object until EOF and keep at most max_output bytes.
+    Everything after that is read and dropped, so the writer never
+    blocks"""
+    def __init__(self, fileobj, max_output=None, on_exceeded=None):
+        self.fileobj = fileobj
+        self.max_output = max_output
+        self.on_exceeded = on_exceeded
+        self.exceeded = False
+        self._chunks = []
+        self._size = 0
+
+    def run(self):
+        with self.fileobj:
+            while True:
+                chunk = self.fileobj.read(65536)
+                if not chunk:
+                    break
+                if self.exceeded:
+                    continue
+                self._size += len(chunk)
+                if self.max_output is not None and \
+                        self._size > self.max_output:
+                    self.exceeded = True
+                    self._chunks = []
+                    if self.on_exceeded is not None:
+                        self.on_exceeded()
+                    continue
+                self._chunks.append(chunk)
+
+    def start(self):
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def value(self):
+        return b''.join(self._chunks)
+
+
+def output_exceeded(limits):
+    return LimitExceeded(
+        'max_output', "setup.py exceeded the output limit of %s bytes" %
+        limits.max_output)
+
+
+def check_output(cmd, limits, **kwargs):
+    """the same as :func:`subprocess.check_output` but with the given
+    limits. The command runs in a new session so that its whole
+    process group can be killed
+
+    :raises: :class:`LimitExceeded` if a limit was exceeded
+    """
+    process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL,
+                               stdout=subprocess.PIPE,
+                               start_new_session=True, **kwargs)
+    collector = OutputCollector(process.stdout, limits.max_output,
+                                on_exceeded=lambda: kill_group(process.pid))
+    reader = collector.start()
+    timed_out = not wait_exited(process.pid, limits.timeout)
+    # kill what is left of the group. It may still hold the output open.
+    # The child is reaped afterwards, so the group id is still its own
+    kill_group(process.pid)
+    reader.join()
+    process.returncode = reap(process.pid)
+    if timed_out:
+        raise LimitExceeded(
+            'timeout', "setup.py did not finish within %s seconds" %
+            limits.timeout)
+    if collector.exceeded:
+        raise output_exceeded(limits)
+    output = collector.value()
+    check_status(limits, process.returncode, output)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd,
+                                            output=output)
+    return output
+
+
+def main(argv=None):
+    """set the rlimits, install the stub modules and the replaced setup()
+    and run the setup.py in this process"""
+    from . import forkserver as meta_forkserver
+
+    parser = argparse.ArgumentParser(prog="metaextract.limits")
+    parser.add_argument('--cpu-time', type=int)
+    parser.add_argument('--memory', type=int)
+    parser.add_argument('--capture', action='store_true')
+    parser.add_argument('--stub-imports')
+    parser.add_argument('setup_py')
+    parser.add_argument('args', nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+    set_rlimits(args.cpu_time, args.memory)
+    if args.stub_imports:
+        from . import stubs as meta_stubs
+        meta_stubs.install(args.stub_imports.split(','))
+    if args.capture:
+        from . import capture as meta_capture
+        meta_capture.install()
+    return meta_forkserver._exec_setup_py(os.getcwd(), args.args,
+                                          dict(os.environ))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -20,33 +20,41 @@ from __future__ import print_function
 
 from distutils.core import Command
 import json
+import os
 
-
-# define the data format version. Increase if
-# - a key is renamed
-# - a key is removed
-DATA_VERSION = 1
+from . import DATA_VERSION
 
 
 class metaextract(Command):
     """a distutils command to extract metadata"""
     description = "extract package metadata"
     user_options = [
-        ("output=", "o", "output for metadata json")
+        ("output=", "o", "output for metadata json"),
+        ("output-fd=", None, "inherited file descriptor for compact "
+         "metadata json"),
+        ("fields=", None, "comma separated list of the keys to extract. "
+         "Defaults to all keys"),
     ]
 
     def initialize_options(self):
         self.output = None
+        self.output_fd = None
+        self.fields = None
 
     def finalize_options(self):
         pass
 
     def run(self):
         data = dict()
+        fields = None
+        if self.fields:
+            fields = set(f.strip() for f in self.fields.split(','))
         # keep list ordered!
         for key in ['data_files', 'entry_points', 'extras_require',
                     'install_requires', 'python_requires', 'setup_requires',
                     'scripts', 'tests_require', 'tests_suite']:
+            if fields is not None and key not in fields:
+                continue
             if hasattr(self.distribution, key):
                 data[key] = getattr(self.distribution, key)
                 # dict_items objects can not be serialized with json
@@ -66,6 +74,8 @@ class metaextract(Command):
                      'get_version', 'get_download_url',
                      'get_fullname', 'get_author', 'get_author_email',
                      'has_ext_modules']:
+            if fields is not None and func.replace('get_', '') not in fields:
+                continue
             if hasattr(self.distribution, func):
                 data['{}'.format(func.replace('get_', ''))] = getattr(
                     self.distribution, func)()
@@ -74,11 +84,20 @@ class metaextract(Command):
             'version': DATA_VERSION,
             'data': data
         }
+        write_output(data_with_version, self.output, self.output_fd)
+
 
-        if self.output:
-            with open(self.output, "w+") as f:
-                f.write(json.dumps(data_with_version, indent=2,
-                                   sort_keys=True, default=str))
-        else:
-            print(json.dumps(data_with_version, indent=2,
-                             sort_keys=True, default=str))
+def write_output(data_with_version, output=None, output_fd=None):
+    """write the json to the inherited file descriptor output_fd, the file
+    output or stdout"""
+    if output_fd:
+        with os.fdopen(int(output_fd), "w") as f:
+            f.write(json.dumps(data_with_version, sort_keys=True,
+                               separators=(',', ':'), default=str))
+    elif output:
+        with open(output, "w+") as f:
+            f.write(json.dumps(data_with_version, indent=2,
+                               sort_keys=True, default=str))
+    else:
+        print(json.dumps(data_with_version, indent=2,
+                         sort_keys=True, default=str))
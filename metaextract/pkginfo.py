@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016, Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import configparser
+import email.parser
+import re
+import tarfile
+import zipfile
+
+try:
+    from packaging.markers import InvalidMarker, Marker
+except ImportError:
+    Marker = None
+
+from . import DATA_VERSION
+from . import archive as meta_archive
+from . import limits as meta_limits
+from . import static as meta_static
+
+
+__all__ = [
+    "from_archive",
+]
+
+
+ENGINE = "pkg-info"
+
+# core metadata fields which are mapped to the metaextract keys. If one of
+# them is listed as Dynamic, PKG-INFO can't be used
+_MAPPED_FIELDS = frozenset([
+    'author', 'author-email', 'classifier', 'description',
+    'download-url', 'home-page', 'keywords', 'license', 'maintainer',
+    'maintainer-email', 'name', 'provides-extra', 'requires-dist',
+    'requires-python', 'summary', 'version',
+])
+
+# keys which are not part of the core metadata. They are not included in
+# the data instead of guessing them
+_UNKNOWN_KEYS = ('data_files', 'has_ext_modules', 'scripts',
+                 'setup_requires', 'tests_require')
+
+# the maximum size of a metadata file which is read from an archive
+_MAX_MEMBER_SIZE = 16 * 1024 ** 2
+
+_EXTRA_MARKER_RE = re.compile(r'''\bextra\s*==\s*["']([^"']+)["']''')
+
+
+def _parse_metadata(text):
+    return email.parser.Parser().parsestr(text)
+
+
+def _metadata_version(msg):
+    try:
+        return tuple(int(v) for v in msg['Metadata-Version'].split('.'))
+    except (AttributeError, ValueError):
+        return (0, )
+
+
+def _dynamic_fields(msg):
+    return set(f.strip().lower() for f in msg.get_all('Dynamic') or [])
+
+
+def _value(msg, field):
+    value = msg.get(field)
+    if value is None or value == 'UNKNOWN':
+        return None
+    return value
+
+
+def _long_description(msg):
+    body = msg.get_payload()
+    if body and body.strip():
+        return body
+    description = _value(msg, 'Description')
+    if description is None:
+        return None
+    # continuation lines are indented with 8 spaces (or 7 spaces and '|')
+    lines = description.splitlines()
+    for i, line in enumerate(lines[1:], 1):
+        if line.startswith('        ') or line.startswith('       |'):
+            lines[i] = line[8:]
+    return "\n".join(lines)
+
+
+def _split_top_level(marker, operator):
+    """split the marker at the given boolean operator (``and`` or ``or``)
+    outside of parentheses and quoted strings"""
+    parts = []
+    depth = 0
+    quote = None
+    start = 0
+    i = 0
+    while i < len(marker):
+        char = marker[i]
+        if quote is not None:
+            if char == quote:
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif depth == 0 and char.isspace():
+            match = re.match(r'\s+%s\s+' % operator, marker[i:])
+            if match is not None:
+                parts.append(marker[start:i].strip())
+                i += match.end()
+                start = i
+                continue
+        i += 1
+    parts.append(marker[start:].strip())
+    return parts
+
+
+def _normalize_marker(marker):
+    if marker and Marker is not None:
+        try:
+            marker = str(Marker(marker))
+        except InvalidMarker:
+            raise meta_static._Unresolvable("invalid marker '%s'" % marker)
+    return marker
+
+
+def _split_extra_marker(marker):
+    """split ``python_version < "3" and extra == "foo"`` into the extra name
+    and the remaining marker. Extras joined with ``or`` (i.e.
+    ``extra == "test" or extra == "dev"``) give one tuple per extra
+
+    :returns: a list of (extra, marker) tuples. extra is None for the parts
+              of the marker which do not depend on an extra
+    """
+    marker = marker.strip()
+    while _is_parenthesized(marker):
+        marker = marker[1:-1].strip()
+    alternatives = _split_top_level(marker, 'or')
+    if len(alternatives) > 1:
+        if not any(_EXTRA_MARKER_RE.search(a) for a in alternatives):
+            return [(None, _normalize_marker(marker))]
+        result = []
+        for alternative in alternatives:
+            result.extend(_split_extra_marker(alternative))
+        return result
+    operands = _split_top_level(marker, 'and')
+    for i, operand in enumerate(operands):
+        if not _EXTRA_MARKER_RE.search(operand):
+            continue
+        others = operands[:i] + operands[i + 1:]
+        if _EXTRA_MARKER_RE.fullmatch(operand):
+            splits = [(_EXTRA_MARKER_RE.fullmatch(operand).group(1), '')]
+        elif len(operands) > 1:
+            splits = _split_extra_marker(operand)
+        else:
+            raise meta_static._Unresolvable("invalid marker '%s'" % marker)
+        result = []
+        for extra, rest in splits:
+            rest = " and ".join("(%s)" % m if len(operands) > 1 else m
+                                for m in others + ([rest] if rest else []))
+            result.append((extra, _normalize_marker(rest)))
+        return result
+    return [(None, _normalize_marker(marker))]
+
+
+def _is_parenthesized(marker):
+    """check if the whole marker is enclosed in a single pair of
+    parentheses"""
+    if not marker.startswith('(') or not marker.endswith(')'):
+        return False
+    depth = 0
+    for i, char in enumerate(marker):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0 and i != len(marker) - 1:
+                return False
+    return True
+
+
+def requires_dist_to_kwargs(requires_dist, provides_extra):
+    """map Requires-Dist and Provides-Extra back to install_requires and
+    extras_require in the format which is used for setup()
+
+    :returns: a tuple with install_requires and extras_require
+    """
+    install_requires = []
+    extras_require = dict((extra, []) for extra in provides_extra)
+    for line in requires_dist:
+        req, sep, marker = line.partition(';')
+        req, marker = req.strip(), marker.strip()
+        splits = _split_extra_marker(marker) if sep else [(None, '')]
+        for extra, marker in splits:
+            if extra is None:
+                install_requires.append(
+                    "%s; %s" % (req, marker) if marker else req)
+                continue
+            section = "%s:%s" % (extra, marker) if marker else extra
+            extras_require.setdefault(extra, [])
+            extras_require.setdefault(section, []).append(req)
+    return install_requires, extras_require
+
+
+def _parse_requires_txt(text):
+    """parse the requires.txt of an egg-info directory"""
+    install_requires = []
+    extras_require = {}
+    current = install_requires
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('[') and line.endswith(']'):
+            current = extras_require.setdefault(line[1:-1].strip(), [])
+        else:
+            current.append(line)
+    return install_requires, extras_require
+
+
+def parse_entry_points(text):
+    """parse an entry_points.txt into the format used for setup()"""
+    parser = configparser.RawConfigParser()
+    parser.optionxform = str
+    try:
+        parser.read_string(text)
+    except configparser.Error:
+        raise meta_static._Unresolvable("invalid entry_points.txt")
+    entry_points = dict(
+        (group, ["%s = %s" % (name, value)
+                 for name, value in parser.items(group)])
+        for group in parser.sections())
+    return entry_points or None
+
+
+def metadata_to_kwargs(msg):
+    """map core metadata (PKG-INFO or METADATA) to setup() keywords"""
+    keywords = _value(msg, 'Keywords')
+    if keywords is not None:
+        keywords = [k.strip() for k in keywords.split(',') if k.strip()] \
+            if ',' in keywords else keywords.split()
+    install_requires, extras_require = requires_dist_to_kwargs(
+        msg.get_all('Requires-Dist') or [],
+        msg.get_all('Provides-Extra') or [])
+    return {
+        'name': _value(msg, 'Name'),
+        'version': _value(msg, 'Version'),
+        'author': _value(msg, 'Author'),
+        'author_email': _value(msg, 'Author-email'),
+        'maintainer': _value(msg, 'Maintainer'),
+        'maintainer_email': _value(msg, 'Maintainer-email'),
+        'url': _value(msg, 'Home-page'),
+        'download_url': _value(msg, 'Download-URL'),
+        'description': _value(msg, 'Summary'),
+        'long_description': _long_description(msg),
+        'license': _value(msg, 'License'),
+        'keywords': keywords,
+        'classifiers': msg.get_all('Classifier') or [],
+        'python_requires': _value(msg, 'Requires-Python'),
+        'install_requires': install_requires,
+        'extras_require': extras_require,
+    }
+
+
+def kwargs_to_data(kwargs):
+    """the metaextract data for setup() keywords which were collected from
+    metadata files. Keys which are not part of the metadata are dropped"""
+    data = meta_static.setup_kwargs_to_data(kwargs)
+    for key in _UNKNOWN_KEYS:
+        data.pop(key, None)
+    return data
+
+
+def _member_kind(name):
+    """which of the interesting files is the archive member name"""
+    parts = name.strip('/').split('/')
+    if len(parts) == 2 and parts[1] == 'PKG-INFO':
+        return 'PKG-INFO'
+    if 3 <= len(parts) <= 4 and parts[-2].endswith('.egg-info') and \
+            parts[-1] in ('requires.txt', 'entry_points.txt', 'PKG-INFO'):
+        return 'egg-info/' + parts[-1]
+    return None
+
+
+def _read_member(read, size):
+    """read a metadata file with at most _MAX_MEMBER_SIZE bytes"""
+    if size > _MAX_MEMBER_SIZE:
+        raise meta_static._Unresolvable("metadata file is too large")
+    data = read(_MAX_MEMBER_SIZE + 1)
+    if len(data) > _MAX_MEMBER_SIZE:
+        raise meta_static._Unresolvable("metadata file is too large")
+    return data.decode('utf-8')
+
+
+def _usable_metadata(text):
+    """the parsed PKG-INFO if its values can be used as they are"""
+    msg = _parse_metadata(text)
+    if _metadata_version(msg) < (2, 2):
+        # before Metadata 2.2 there is no guarantee that the values are
+        # the same as the ones setup.py would calculate
+        raise meta_static._Unresolvable("PKG-INFO is too old")
+    if _dynamic_fields(msg) & _MAPPED_FIELDS:
+        raise meta_static._Unresolvable("dynamic metadata")
+    return msg
+
+
+def _read_members(archive_filename, extraction_limits=None):
+    """read the metadata files from the archive without extracting it. The
+    member count and the read bytes are checked against the
+    extraction_limits. The PKG-INFO is checked (and parsed) as soon as it
+    is read, so the rest of an archive with unusable metadata is not
+    decompressed"""
+    if extraction_limits is None:
+        extraction_limits = meta_limits.ExtractionLimits()
+    archive_size = meta_archive.archive_size(archive_filename)
+    members = {}
+    egg_info_dirs = set()
+    state = {'count': 0, 'size': 0}
+
+    def _add(name, size, open_member):
+        state['count'] += 1
+        extraction_limits.check(state['count'], state['size'], archive_size)
+        kind = _member_kind(name)
+        if kind is None:
+            return
+        if kind.startswith('egg-info/'):
+            egg_info_dirs.add(name.rsplit('/', 1)[0])
+        with open_member() as f:
+            text = _read_member(f.read, size)
+        state['size'] += len(text)
+        members[kind] = _usable_metadata(text) if kind == 'PKG-INFO' \
+            else text
+
+    with meta_archive.open_archive(archive_filename) as f:
+        if isinstance(f, zipfile.ZipFile):
+            for info in f.infolist():
+                _add(info.filename, info.file_size,
+                     lambda: f.open(info))
+        else:
+            for member in f:
+                if member.isfile():
+                    _add(member.name, member.size,
+                         lambda: f.extractfile(member))
+    if len(egg_info_dirs) > 1:
+        raise meta_static._Unresolvable("multiple egg-info directories")
+    return members, bool(egg_info_dirs)
+
+
+def _from_archive(archive_filename, extraction_limits):
+    if meta_static.Requirement is None:
+        raise meta_static._Unresolvable("packaging is not available")
+    members, has_egg_info = _read_members(archive_filename,
+                                          extraction_limits)
+    if 'PKG-INFO' not in members:
+        raise meta_static._Unresolvable("no PKG-INFO")
+    msg = members['PKG-INFO']
+    if not has_egg_info:
+        # entry points are not part of the core metadata
+        raise meta_static._Unresolvable("no egg-info directory")
+    kwargs = metadata_to_kwargs(msg)
+    if not msg.get_all('Requires-Dist') and \
+            'egg-info/requires.txt' in members:
+        kwargs['install_requires'], kwargs['extras_require'] = \
+            _parse_requires_txt(members['egg-info/requires.txt'])
+    if 'egg-info/entry_points.txt' in members:
+        kwargs['entry_points'] = parse_entry_points(
+            members['egg-info/entry_points.txt'])
+    return {
+        'version': DATA_VERSION,
+        'data': kwargs_to_data(kwargs),
+        'engine': ENGINE,
+    }
+
+
+###############################################################################
+def from_archive(archive_filename, extraction_limits=None):
+    """extract metadata from the PKG-INFO and the egg-info files of a sdist
+    archive without extracting it to disk
+
+    This only works for Metadata-Version 2.2 or later where none of the
+    used fields is declared as ``Dynamic``. The keys which are not part of
+    the package metadata (``setup_requires``, ``scripts``, ``data_files``,
+    ``tests_require`` and ``has_ext_modules``) are not included.
+
+    :param archive_filename: a sdist archive file
+    :param extraction_limits: optional
+                              :class:`metaextract.limits.ExtractionLimits`.
+                              Only the member count and the bytes of the
+                              read metadata files are checked
+
+    :returns: a json blob with metadata or None if the metadata in the
+              archive can not be used
+    """
+    try:
+        return _from_archive(archive_filename, extraction_limits)
+    except (meta_static._Unresolvable, tarfile.TarError, zipfile.BadZipfile,
+            UnicodeDecodeError, EOFError, IOError, OSError):
+        return None
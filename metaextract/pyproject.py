@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016, Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from email.headerregistry import Address
+import os
+
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+try:
+    from packaging.specifiers import InvalidSpecifier, SpecifierSet
+except ImportError:
+    SpecifierSet = None
+
+from . import DATA_VERSION
+from . import static as meta_static
+
+
+__all__ = [
+    "from_dir",
+]
+
+
+ENGINE = "pyproject"
+
+# [tool.setuptools] keys which do not influence the metadata
+_IGNORED_TOOL_KEYS = frozenset([
+    'exclude-package-data', 'include-package-data', 'license-files',
+    'namespace-packages', 'package-data', 'package-dir', 'packages',
+    'platforms', 'provides', 'obsoletes', 'py-modules', 'zip-safe',
+])
+
+# PEP 621 keys which are not (or not yet) mapped to metadata
+_IGNORED_PROJECT_KEYS = frozenset(['urls'])
+
+
+def _people(people, kind, kwargs):
+    names = []
+    emails = []
+    for person in people:
+        if 'name' not in person:
+            emails.append(person['email'])
+        elif 'email' not in person:
+            names.append(person['name'])
+        else:
+            emails.append(str(Address(display_name=person['name'],
+                                      addr_spec=person['email'])))
+    if names:
+        kwargs[kind] = ", ".join(names)
+    if emails:
+        kwargs[kind + '_email'] = ", ".join(emails)
+
+
+def _entry_points(project):
+    groups = dict(project.get('entry-points', {}))
+    for key, group in (('scripts', 'console_scripts'),
+                       ('gui-scripts', 'gui_scripts')):
+        if project.get(key):
+            groups[group] = project[key]
+    if not groups:
+        return None
+    return dict((name, ["%s = %s" % (k, v) for k, v in group.items()])
+                for name, group in groups.items())
+
+
+def _project_to_kwargs(root_dir, project):
+    """map the [project] table to setup() keywords the same way setuptools
+    does it"""
+    kwargs = {}
+    for key, value in project.items():
+        if key in ('name', 'version', 'description', 'keywords',
+                   'classifiers'):
+            kwargs[key] = value
+        elif key == 'readme':
+            if isinstance(value, str):
+                kwargs['long_description'] = meta_static._read_files(
+                    root_dir, [value])
+            else:
+                kwargs['long_description'] = value.get('text') or \
+                    meta_static._read_files(
+                        root_dir, [value['file']] if 'file' in value else [])
+        elif key == 'license':
+            if isinstance(value, str):
+                kwargs['license'] = value
+            elif 'file' in value:
+                kwargs['license'] = meta_static._read_files(
+                    root_dir, [value['file']])
+            else:
+                kwargs['license'] = value['text']
+        elif key in ('authors', 'maintainers'):
+            _people(value, key[:-1], kwargs)
+        elif key == 'requires-python':
+            try:
+                kwargs['python_requires'] = str(SpecifierSet(value))
+            except InvalidSpecifier:
+                raise meta_static._Unresolvable("invalid requires-python")
+        elif key == 'dependencies':
+            kwargs['install_requires'] = value
+        elif key == 'optional-dependencies':
+            kwargs['extras_require'] = value
+        elif key in ('scripts', 'gui-scripts', 'entry-points', 'dynamic'):
+            continue
+        elif key not in _IGNORED_PROJECT_KEYS:
+            raise meta_static._Unresolvable("unknown [project] key '%s'" %
+                                            key)
+    kwargs['entry_points'] = _entry_points(project)
+    return kwargs
+
+
+def _load(root_dir):
+    pyproject = os.path.join(root_dir, 'pyproject.toml')
+    try:
+        with open(pyproject, 'rb') as f:
+            return tomllib.load(f)
+    except (IOError, OSError, ValueError):
+        raise meta_static._Unresolvable("can not read pyproject.toml")
+
+
+def _from_dir(root_dir):
+    if tomllib is None or SpecifierSet is None:
+        raise meta_static._Unresolvable("no toml parser available")
+    if os.path.exists(os.path.join(root_dir, 'setup.py')):
+        raise meta_static._Unresolvable("setup.py exists")
+    if meta_static._has_setup_cfg_metadata(root_dir):
+        raise meta_static._Unresolvable("metadata in setup.cfg")
+    config = _load(root_dir)
+    project = config.get('project')
+    if not project:
+        raise meta_static._Unresolvable("no [project] table")
+    if project.get('dynamic'):
+        raise meta_static._Unresolvable("dynamic metadata")
+    tool = config.get('tool', {}).get('setuptools', {})
+    if set(tool) - _IGNORED_TOOL_KEYS:
+        raise meta_static._Unresolvable("unsupported [tool.setuptools]")
+    kwargs = _project_to_kwargs(root_dir, project)
+    return {
+        'version': DATA_VERSION,
+        'data': meta_static.setup_kwargs_to_data(kwargs),
+        'engine': ENGINE,
+    }
+
+
+###############################################################################
+def from_dir(root_dir):
+    """extract metadata from the static [project] table (PEP 621) of the
+    pyproject.toml in root_dir without executing anything
+
+    :param root_dir: the directory which contains the pyproject.toml
+
+    :returns: a json blob with metadata in the same format which the
+              metaextract command produces or None if the pyproject.toml
+              can not be handled statically (i.e. because there is also a
+              setup.py or because some fields are ``dynamic``)
+    """
+    try:
+        return _from_dir(root_dir)
+    except (meta_static._Unresolvable, KeyError, TypeError,
+            AttributeError):
+        return None
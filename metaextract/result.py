@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016, Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""compact result objects for keeping many results in memory
+
+:func:`metaextract.utils.from_archive` returns plain dicts. For large in
+process catalogs, :meth:`Result.from_dict` converts such a dict into an
+object with ``__slots__``. Lists become tuples, names, requirements and
+classifiers (which repeat across packages) are interned and a long
+``long_description`` is kept zlib compressed until it is accessed.
+:meth:`Result.to_dict` returns the original dict again.
+"""
+
+from __future__ import print_function
+
+from collections.abc import Mapping
+import sys
+import zlib
+
+from . import DATA_VERSION
+
+
+__all__ = [
+    "Metadata",
+    "Result",
+]
+
+
+# the keys of the data. Other keys are kept in a dict
+_KEYS = (
+    'author', 'author_email', 'classifiers', 'contact', 'contact_email',
+    'data_files', 'description', 'download_url', 'entry_points',
+    'extras_require', 'fullname', 'has_ext_modules', 'install_requires',
+    'keywords', 'license', 'maintainer', 'maintainer_email', 'name',
+    'python_requires', 'scripts', 'setup_requires', 'tests_require',
+    'tests_suite', 'url', 'version',
+)
+
+# the keys whose strings repeat across packages and are interned
+_INTERNED_KEYS = frozenset((
+    'author', 'classifiers', 'contact', 'extras_require', 'install_requires',
+    'keywords', 'license', 'maintainer', 'name', 'python_requires',
+    'setup_requires', 'tests_require',
+))
+
+# a long_description of at least that many bytes is compressed
+_COMPRESS_MIN_SIZE = 256
+
+
+def _freeze(value, intern=False):
+    """the compact form of a json value. Lists become tuples"""
+    if isinstance(value, str):
+        return sys.intern(value) if intern else value
+    if isinstance(value, list):
+        return tuple(_freeze(v, intern) for v in value)
+    if isinstance(value, dict):
+        return dict((sys.intern(k) if isinstance(k, str) else k,
+                     _freeze(v, intern)) for k, v in value.items())
+    return value
+
+
+def _thaw(value):
+    """the json value for the compact form"""
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    if isinstance(value, dict):
+        return dict((k, _thaw(v)) for k, v in value.items())
+    return value
+
+
+class Metadata(Mapping):
+    """the read-only data of a result. Behaves like the data dict but
+    lists are tuples. Keys which were not in the data are missing"""
+    __slots__ = _KEYS + ('_long_description', '_extra')
+
+    def __init__(self, data):
+        extra = {}
+        for key, value in data.items():
+            if key == 'long_description':
+                # the json data has no bytes, so bytes are compressed
+                if isinstance(value, str) and \
+                        len(value) >= _COMPRESS_MIN_SIZE:
+                    value = zlib.compress(value.encode('utf-8'))
+                self._long_description = value
+            elif key in _KEYS:
+                setattr(self, key, _freeze(value, key in _INTERNED_KEYS))
+            else:
+                extra[sys.intern(key)] = _freeze(value)
+        self._extra = extra or None
+
+    def _get(self, key):
+        if key == 'long_description':
+            value = self._long_description
+            if isinstance(value, bytes):
+                value = zlib.decompress(value).decode('utf-8')
+            return value
+        if key in _KEYS:
+            return getattr(self, key)
+        if self._extra is not None:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __getitem__(self, key):
+        try:
+            return self._get(key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for key in _KEYS + ('_long_description', ):
+            try:
+                getattr(self, key)
+            except AttributeError:
+                continue
+            yield key.lstrip('_')
+        if self._extra is not None:
+            for key in self._extra:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return '<Metadata %s>' % self.get('fullname', self.get('name'))
+
+    @property
+    def long_description(self):
+        """the long_description (decompressed on every access)"""
+        return self.get('long_description')
+
+    def to_dict(self):
+        """the data dict"""
+        return dict((key, _thaw(self[key])) for key in self)
+
+
+###############################################################################
+class Result(object):
+    """a compact result of :func:`metaextract.utils.from_archive`
+
+    :param version: the data format version
+    :param data: the :class:`Metadata` (None for an error)
+    :param engine: the engine which collected the metadata
+    :param error: the structured error (None if there is data)
+    """
+    __slots__ = ('version', 'data', 'engine', 'error')
+
+    def __init__(self, version=DATA_VERSION, data=None, engine=None,
+                 error=None):
+        self.version = version
+        self.data = data
+        self.engine = engine
+        self.error = error
+
+    @classmethod
+    def from_dict(cls, d):
+        """the compact result for a json blob of
+        :func:`metaextract.utils.from_archive`"""
+        data = d.get('data')
+        return cls(d['version'], Metadata(data) if data is not None else None,
+                   d.get('engine'), d.get('error'))
+
+    def to_dict(self):
+        """the json blob this result was created from"""
+        d = {'version': self.version}
+        if self.data is not None:
+            d['data'] = self.data.to_dict()
+        if self.engine is not None:
+            d['engine'] = self.engine
+        if self.error is not None:
+            d['error'] = self.error
+        return d
+
+    def __repr__(self):
+        if self.error is not None:
+            return '<Result error=%s>' % self.error['type']
+        return '<Result %r engine=%s>' % (self.data, self.engine)
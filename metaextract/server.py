@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016, Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""a long running extraction daemon on a Unix domain socket
+
+The daemon keeps its worker pool, result cache and imports warm, so a
+client (i.e. ``metaextract --server``) gets repeated results without
+starting a new interpreter. Every connection carries one request: a json
+line with either the ``archive`` path or the ``size`` of an uploaded
+archive, and optionally the ``fields`` and the ``python`` interpreter (or a
+list of interpreters). An upload is answered with a ``{"continue": true}``
+line and the client sends the archive bytes after that. The response is a
+json line with the result blob. Failures (i.e. a rejected upload) are
+returned as blob with an ``error`` key.
+
+Accepted connections wait in a bounded queue for one of the ``jobs``
+handler threads. When the queue is full, the daemon stops accepting, so
+further clients wait in the listen backlog of the socket. A client which
+sends nothing for ``read_timeout`` seconds is disconnected, so it can't
+hold a handler thread.
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import queue
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+
+from . import utils as meta_utils
+
+
+__all__ = [
+    "Client",
+    "ENV_SOCKET",
+    "Server",
+]
+
+
+ENV_SOCKET = 'METAEXTRACT_SOCKET'
+
+# the maximum length of a request line
+_MAX_REQUEST_LINE = 64 * 1024
+
+# the interval in which the accept loop checks for a shutdown
+_POLL_INTERVAL = 0.2
+
+
+def _read_request(rfile):
+    line = rfile.readline(_MAX_REQUEST_LINE + 1)
+    if len(line) > _MAX_REQUEST_LINE:
+        raise Exception("The request line is too long")
+    if not line:
+        raise Exception("Empty request")
+    return json.loads(line.decode('utf-8'))
+
+
+def _send(sock, message):
+    sock.sendall(json.dumps(message, sort_keys=True).encode('utf-8') + b'\n')
+
+
+def _receive(rfile):
+    line = rfile.readline()
+    if not line:
+        raise Exception("The server closed the connection")
+    return json.loads(line.decode('utf-8'))
+
+
+def _copy_upload(rfile, dest, size):
+    """copy exactly size bytes of the uploaded archive to dest"""
+    while size > 0:
+        chunk = rfile.read(min(size, 65536))
+        if not chunk:
+            raise Exception("The upload ended early")
+        dest.write(chunk)
+        size -= len(chunk)
+    dest.seek(0)
+
+
+###############################################################################
+class Server(object):
+    """the extraction daemon
+
+    :param socket_path: the path of the Unix domain socket. Only the
+                        current user can connect
+    :param py_interpreter: the interpreter for requests without ``python``
+    :param jobs: the number of requests which are processed at the same
+                 time. Defaults to the number of CPUs
+    :param max_pending: the number of accepted connections which may wait
+                        for a handler
+    :param max_upload: the maximum size of uploaded archives in bytes
+    :param read_timeout: the seconds a client may send nothing while the
+                         request and the upload are read. The connection
+                         is closed then
+    :param kwargs: additional keyword arguments for
+                   :func:`metaextract.utils.from_archive`, i.e. a ``cache``
+                   and a ``worker_pool``
+    """
+    def __init__(self, socket_path, py_interpreter=sys.executable, jobs=None,
+                 max_pending=64, max_upload=512 * 1024 ** 2,
+                 read_timeout=30, **kwargs):
+        self.socket_path = socket_path
+        self.py_interpreter = py_interpreter
+        self.jobs = jobs or os.cpu_count() or 1
+        self.max_upload = max_upload
+        self.read_timeout = read_timeout
+        self.kwargs = kwargs
+        self._queue = queue.Queue(max_pending)
+        self._stopped = threading.Event()
+        self._sock = None
+        self._threads = []
+
+    def _bind(self):
+        if os.path.exists(self.socket_path):
+            if Client(self.socket_path).available():
+                raise Exception("A server is already listening on '%s'" %
+                                self.socket_path)
+            # left over by a daemon which was killed
+            os.unlink(self.socket_path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)
+        try:
+            sock.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        sock.listen(self._queue.maxsize)
+        sock.settimeout(_POLL_INTERVAL)
+        return sock
+
+    def _process(self, request, conn, rfile):
+        kwargs = dict(self.kwargs)
+        if request.get('fields') is not None:
+            kwargs['fields'] = request['fields']
+        py_interpreter = request.get('python') or self.py_interpreter
+        if 'archive' in request:
+            if isinstance(py_interpreter, list):
+                return meta_utils.from_archive_multi(
+                    request['archive'], py_interpreter, **kwargs)
+            return meta_utils.from_archive(request['archive'],
+                                           py_interpreter, **kwargs)
+        size = int(request['size'])
+        if size > self.max_upload:
+            raise Exception("The upload has more than %d bytes" %
+                            self.max_upload)
+        with tempfile.SpooledTemporaryFile(
+                max_size=meta_utils._SPOOL_MAX_SIZE) as spool:
+            _send(conn, {'continue': True})
+            _copy_upload(rfile, spool, size)
+            if isinstance(py_interpreter, list):
+                return meta_utils.from_archive_multi(spool, py_interpreter,
+                                                     **kwargs)
+            return meta_utils.from_fileobj(spool, py_interpreter, **kwargs)
+
+    def _handle(self, conn):
+        with conn, conn.makefile('rb') as rfile:
+            try:
+                response = self._process(_read_request(rfile), conn, rfile)
+            except socket.timeout:
+                # the client is stuck or gone
+                return
+            except Exception as e:
+                response = meta_utils._error_result(e)
+            try:
+                _send(conn, response)
+            except (IOError, OSError):
+                # the client is gone
+                pass
+
+    def _run_handler(self):
+        while True:
+            conn = self._queue.get()
+            if conn is None:
+                return
+            self._handle(conn)
+
+    def serve_forever(self):
+        """accept and process requests until :meth:`shutdown` is called.
+        The socket is removed afterwards"""
+        self._sock = self._bind()
+        for _ in range(self.jobs):
+            thread = threading.Thread(target=self._run_handler,
+                                      name="metaextract-server")
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        try:
+            while not self._stopped.is_set():
+                try:
+                    conn, _ = self._sock.accept()
+                except socket.timeout:
+                    continue
+                conn.settimeout(self.read_timeout)
+                # blocks while the queue is full
+                self._queue.put(conn)
+        finally:
+            self._sock.close()
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+            for _ in self._threads:
+                self._queue.put(None)
+            for thread in self._threads:
+                thread.join()
+            self._threads = []
+
+    def shutdown(self):
+        """stop :meth:`serve_forever` after the running requests"""
+        self._stopped.set()
+
+
+class Client(object):
+    """a client for the extraction daemon
+
+    :param socket_path: the path of the Unix domain socket of the daemon
+    :param timeout: the timeout in seconds for the whole request
+    """
+    def __init__(self, socket_path, timeout=None):
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    def available(self):
+        """check if a daemon is listening on the socket"""
+        try:
+            self._connect().close()
+        except (IOError, OSError):
+            return False
+        return True
+
+    def _request(self, request, fileobj=None):
+        with self._connect() as sock, sock.makefile('rb') as rfile:
+            _send(sock, request)
+            if fileobj is not None:
+                response = _receive(rfile)
+                if not response.get('continue'):
+                    # the upload was rejected
+                    return response
+                while True:
+                    chunk = fileobj.read(65536)
+                    if not chunk:
+                        break
+                    sock.sendall(chunk)
+            return _receive(rfile)
+
+    def _options(self, fields, py_interpreter):
+        request = {}
+        if fields is not None:
+            request['fields'] = list(fields)
+        if py_interpreter is not None:
+            request['python'] = py_interpreter
+        return request
+
+    def from_archive(self, archive_filename, fields=None,
+                     py_interpreter=None):
+        """the result of :func:`metaextract.utils.from_archive` for the
+        archive, computed by the daemon
+
+        :param fields: an optional list of the keys which should be in the
+                       data
+        :param py_interpreter: the interpreter or a list of interpreters
+                               (see
+                               :func:`metaextract.utils.from_archive_multi`).
+                               Defaults to the one of the daemon
+        """
+        request = self._options(fields, py_interpreter)
+        request['archive'] = os.path.abspath(archive_filename)
+        return self._request(request)
+
+    def from_fileobj(self, fileobj, fields=None, py_interpreter=None):
+        """the same as :meth:`from_archive` but uploads the archive from a
+        binary file object"""
+        with tempfile.SpooledTemporaryFile(
+                max_size=meta_utils._SPOOL_MAX_SIZE) as spool:
+            shutil.copyfileobj(fileobj, spool)
+            request = self._options(fields, py_interpreter)
+            request['size'] = spool.tell()
+            spool.seek(0)
+            return self._request(request, spool)
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016, Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import configparser
+import glob
+import io
+import os
+
+try:
+    from packaging.specifiers import InvalidSpecifier, SpecifierSet
+except ImportError:
+    SpecifierSet = None
+
+from . import DATA_VERSION
+from . import static as meta_static
+
+
+__all__ = [
+    "from_dir",
+]
+
+
+ENGINE = "setup.cfg"
+
+_METADATA_ALIASES = {
+    'home_page': 'url',
+    'summary': 'description',
+    'classifier': 'classifiers',
+    'platform': 'platforms',
+}
+
+_METADATA_STRINGS = frozenset([
+    'author', 'author_email', 'download_url', 'maintainer',
+    'maintainer_email', 'name', 'url',
+])
+
+
+def _parse_list(value, separator=','):
+    """split by lines or, for a single line, by separator"""
+    if isinstance(value, list):
+        return value
+    if '\n' in value:
+        chunks = value.splitlines()
+    else:
+        chunks = value.split(separator)
+    return [chunk.strip() for chunk in chunks if chunk.strip()]
+
+
+def _parse_file(root_dir, value):
+    """resolve the ``file:`` directive"""
+    if not value.startswith('file:'):
+        return value
+    filenames = [f.strip() for f in value[len('file:'):].split(',')]
+    return meta_static._read_files(root_dir, filenames)
+
+
+def _parse_requirements(root_dir, value):
+    parsed = _parse_list(_parse_file(root_dir, value), separator=';')
+    return [line for line in parsed if not line.startswith('#')]
+
+
+def _find_attr_module(root_dir, module_name, package_dir):
+    """find the file of a module with the package_dir option applied"""
+    parts = module_name.split('.')
+    base = root_dir
+    if parts[0] in package_dir:
+        base = os.path.join(root_dir, package_dir[parts[0]])
+        parts = parts[1:]
+    elif '' in package_dir:
+        base = os.path.join(root_dir, package_dir[''])
+    path = os.path.join(base, *parts)
+    for candidate in (os.path.join(path, '__init__.py'), path + '.py'):
+        if os.path.isfile(candidate):
+            return candidate
+    raise meta_static._Unresolvable("module '%s' not found" % module_name)
+
+
+def _parse_attr(root_dir, value, package_dir):
+    """resolve the ``attr:`` directive statically. setuptools tries that,
+    too, before it imports the module"""
+    attr = value[len('attr:'):].strip()
+    if '.' in attr:
+        module_name, name = attr.rsplit('.', 1)
+    else:
+        module_name, name = '__init__', attr
+    filename = _find_attr_module(root_dir, module_name, package_dir)
+    module = meta_static._Module(root_dir, filename)
+    return meta_static._Evaluator(module)._concrete(module.lookup(name))
+
+
+def _parse_version(root_dir, value, package_dir):
+    if value.startswith('file:'):
+        return _parse_file(root_dir, value).strip()
+    if not value.startswith('attr:'):
+        return value
+    version = _parse_attr(root_dir, value, package_dir)
+    if isinstance(version, (tuple, list)):
+        return '.'.join(map(str, version))
+    return str(version)
+
+
+def _option_name(name):
+    return name.replace('-', '_').lower()
+
+
+def _section_to_kwargs(root_dir, parser, kwargs):
+    """map the sections to setup() keywords. The first value wins, the
+    same as in setuptools"""
+    options = dict((_option_name(k), v) for k, v in parser.items('options')) \
+        if parser.has_section('options') else {}
+    package_dir = {}
+    if 'package_dir' in options:
+        for line in _parse_list(options['package_dir']):
+            key, sep, val = line.partition('=')
+            if not sep:
+                raise meta_static._Unresolvable("invalid package_dir")
+            package_dir[key.strip()] = val.strip()
+
+    for section in parser.sections():
+        if section == 'metadata':
+            for name, value in parser.items(section):
+                name = _option_name(name)
+                name = _METADATA_ALIASES.get(name, name)
+                if kwargs.get(name):
+                    continue
+                if name in _METADATA_STRINGS:
+                    kwargs[name] = value
+                elif name == 'license':
+                    if value.startswith('file:'):
+                        raise meta_static._Unresolvable("license file")
+                    kwargs[name] = value
+                elif name in ('description', 'long_description'):
+                    kwargs[name] = _parse_file(root_dir, value)
+                elif name == 'classifiers':
+                    kwargs[name] = _parse_list(_parse_file(root_dir, value))
+                elif name == 'keywords':
+                    kwargs[name] = _parse_list(value)
+                elif name == 'version':
+                    kwargs[name] = _parse_version(root_dir, value,
+                                                  package_dir)
+        elif section == 'options':
+            for name, value in options.items():
+                if kwargs.get(name):
+                    continue
+                if name == 'install_requires':
+                    kwargs[name] = _parse_requirements(root_dir, value)
+                elif name in ('setup_requires', 'tests_require'):
+                    kwargs[name] = _parse_list(value, separator=';')
+                elif name == 'scripts':
+                    kwargs[name] = _parse_list(value)
+                elif name == 'entry_points':
+                    kwargs[name] = _parse_file(root_dir, value)
+                elif name == 'python_requires':
+                    try:
+                        kwargs[name] = str(SpecifierSet(value))
+                    except InvalidSpecifier:
+                        raise meta_static._Unresolvable(
+                            "invalid python_requires")
+        elif section == 'options.extras_require':
+            if not kwargs.get('extras_require'):
+                kwargs['extras_require'] = dict(
+                    (k, _parse_requirements(root_dir, v))
+                    for k, v in parser.items(section))
+        elif section == 'options.entry_points':
+            if not kwargs.get('entry_points'):
+                kwargs['entry_points'] = dict(
+                    (k, _parse_list(v)) for k, v in parser.items(section))
+        elif section == 'options.data_files':
+            if not kwargs.get('data_files'):
+                kwargs['data_files'] = [
+                    (k, _expand_data_files(root_dir, _parse_list(v)))
+                    for k, v in parser.items(section)]
+    return kwargs
+
+
+def _expand_data_files(root_dir, patterns):
+    """the same as setuptools.config.expand.glob_relative()"""
+    files = []
+    for pattern in patterns:
+        if any(char in pattern for char in '*?[]{}'):
+            matches = glob.glob(os.path.join(root_dir, pattern),
+                                recursive=True)
+            files.extend(sorted(
+                os.path.relpath(m, root_dir).replace(os.sep, '/')
+                for m in matches))
+        else:
+            files.append(os.path.normpath(pattern))
+    return files
+
+
+def _has_trivial_setup_py(root_dir):
+    """check if setup.py only calls setup() without any arguments"""
+    setup_py = os.path.join(root_dir, 'setup.py')
+    if not os.path.exists(setup_py):
+        # the setup.py which is created for a pyproject.toml
+        return os.path.exists(os.path.join(root_dir, 'pyproject.toml'))
+    module = meta_static._Module(root_dir, setup_py)
+    call = meta_static._find_setup_call(module)
+    return not call.args and not call.keywords
+
+
+def _from_dir(root_dir):
+    if meta_static.Requirement is None or SpecifierSet is None:
+        raise meta_static._Unresolvable("packaging is not available")
+    setup_cfg = os.path.join(root_dir, 'setup.cfg')
+    if not os.path.exists(setup_cfg):
+        raise meta_static._Unresolvable("no setup.cfg")
+    if meta_static._has_pyproject_metadata(root_dir):
+        raise meta_static._Unresolvable("metadata in pyproject.toml")
+    if not _has_trivial_setup_py(root_dir):
+        raise meta_static._Unresolvable("setup.py is not trivial")
+    # the same parser setuptools uses, including the interpolation
+    parser = configparser.ConfigParser()
+    parser.optionxform = str
+    try:
+        with io.open(setup_cfg, 'r', encoding='utf-8') as f:
+            parser.read_file(f)
+        kwargs = _section_to_kwargs(root_dir, parser, {})
+    except (configparser.Error, UnicodeDecodeError):
+        raise meta_static._Unresolvable("can not parse setup.cfg")
+    return {
+        'version': DATA_VERSION,
+        'data': meta_static.setup_kwargs_to_data(kwargs),
+        'engine': ENGINE,
+    }
+
+
+###############################################################################
+def from_dir(root_dir):
+    """extract metadata from the declarative setup.cfg in root_dir if the
+    setup.py just calls ``setup()`` without arguments
+
+    ``file:`` and ``attr:`` directives are resolved statically.
+
+    :param root_dir: the directory which contains the setup.cfg
+
+    :returns: a json blob with metadata in the same format which the
+              metaextract command produces or None if the setup.cfg can not
+              be handled statically
+    """
+    try:
+        return _from_dir(root_dir)
+    except (meta_static._Unresolvable, RecursionError):
+        return None
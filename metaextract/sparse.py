@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016, Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""sparse extraction of sdist archives
+
+Only the files a setup.py plausibly needs are extracted in full. Large and
+binary members are replaced by empty placeholder files, so checks like
+``os.path.exists()`` still work.
+"""
+
+from __future__ import print_function
+
+import copy
+import fnmatch
+import os
+
+
+__all__ = [
+    "SparseExtraction",
+]
+
+
+# always extracted in full, independent of the size
+DEFAULT_ALLOW = (
+    '*.py', '*.pyx', '*.pxd', '*.pyi', '*.cfg', '*.toml', '*.ini', '*.in',
+    '*.txt', '*.rst', '*.md', '*.json', '*.yaml', '*.yml', 'PKG-INFO',
+    'README*', 'LICENSE*', 'COPYING*', 'VERSION*', 'CHANGES*', 'CHANGELOG*',
+    'HISTORY*', 'AUTHORS*',
+)
+
+# binary files which setup.py does not need the content of
+DEFAULT_DENY = (
+    '*.so', '*.so.*', '*.dll', '*.dylib', '*.pyd', '*.a', '*.o', '*.obj',
+    '*.lib', '*.exe', '*.bin', '*.dat', '*.db', '*.sqlite', '*.pkl',
+    '*.pickle', '*.npy', '*.npz', '*.h5', '*.hdf5', '*.parquet', '*.zip',
+    '*.gz', '*.tgz', '*.bz2', '*.xz', '*.zst', '*.7z', '*.whl', '*.egg',
+    '*.jar', '*.png', '*.jpg', '*.jpeg', '*.gif', '*.bmp', '*.ico',
+    '*.tif', '*.tiff', '*.webp', '*.pdf', '*.mp3', '*.mp4', '*.wav',
+    '*.avi', '*.mov', '*.ttf', '*.otf', '*.woff', '*.woff2', '*.pyc',
+)
+
+DEFAULT_THRESHOLD = 256 * 1024
+
+
+def _match(name, patterns):
+    """match the member name against the globs. Globs without a ``/`` are
+    matched against the basename"""
+    basename = name.rsplit('/', 1)[-1]
+    for pattern in patterns:
+        if fnmatch.fnmatchcase(name if '/' in pattern else basename,
+                               pattern):
+            return True
+    return False
+
+
+class SparseExtraction(object):
+    """the rules which members are extracted in full
+
+    A member matching one of the ``deny`` globs becomes a placeholder, a
+    member matching one of the ``allow`` globs is extracted in full. All
+    other members are extracted in full if they are not larger than
+    ``threshold`` bytes. Globs without a ``/`` are matched against the
+    basename of the member, others against the path in the archive.
+
+    :param threshold: the maximum size of other members in bytes
+    :param allow: additional globs for members which are always extracted
+    :param deny: additional globs for members which are never extracted
+    :param defaults: use the default allow and deny globs, too
+    """
+    def __init__(self, threshold=DEFAULT_THRESHOLD, allow=(), deny=(),
+                 defaults=True):
+        self.threshold = threshold
+        self.allow = tuple(allow) + (DEFAULT_ALLOW if defaults else ())
+        self.deny = tuple(deny) + (DEFAULT_DENY if defaults else ())
+
+    def is_needed(self, name, size):
+        """check if the member with the given name and size is extracted
+        in full"""
+        while name.startswith('./'):
+            name = name[2:]
+        if _match(name, self.deny):
+            return False
+        if _match(name, self.allow):
+            return True
+        return size <= self.threshold
+
+    def tar_members(self, members):
+        """the given :class:`tarfile.TarInfo` members for
+        :meth:`tarfile.TarFile.extractall`. Members which are not needed
+        are replaced by empty copies"""
+        for member in members:
+            if member.isfile() and \
+                    not self.is_needed(member.name, member.size):
+                member = copy.copy(member)
+                member.size = 0
+            yield member
+
+    def extract_zip(self, zf, dest_dir, infos=None):
+        """extract the members of the given :class:`zipfile.ZipFile`
+
+        :param infos: the :class:`zipfile.ZipInfo` members to extract.
+                      Defaults to all members
+        """
+        for info in infos if infos is not None else zf.infolist():
+            if info.is_dir() or self.is_needed(info.filename,
+                                               info.file_size):
+                zf.extract(info, dest_dir)
+                continue
+            path = _zip_member_path(dest_dir, info.filename)
+            parent = os.path.dirname(path)
+            if not os.path.isdir(parent):
+                os.makedirs(parent)
+            with open(path, 'wb'):
+                pass
+
+
+def _zip_member_path(dest_dir, name):
+    """the path where :meth:`zipfile.ZipFile.extract` writes the member.
+    Absolute paths, drives and ``..`` components are removed the same way"""
+    arcname = name.replace('/', os.path.sep)
+    if os.path.altsep:
+        arcname = arcname.replace(os.path.altsep, os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    arcname = os.path.sep.join(
+        x for x in arcname.split(os.path.sep)
+        if x not in ('', os.path.curdir, os.path.pardir))
+    return os.path.join(dest_dir, arcname)
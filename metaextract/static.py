@@ -0,0 +1,922 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016, Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import ast
+import configparser
+import io
+import json
+import os
+import re
+
+try:
+    from packaging.requirements import InvalidRequirement, Requirement
+    from packaging.version import InvalidVersion, Version
+except ImportError:
+    Requirement = None
+
+from . import DATA_VERSION
+
+
+__all__ = [
+    "from_dir",
+    "setup_kwargs_to_data",
+]
+
+
+ENGINE = "ast"
+
+_SETUP_FUNCS = frozenset(['setuptools.setup', 'distutils.core.setup'])
+
+# setup() keywords which are resolved and used for the metadata
+_HANDLED_KWARGS = frozenset([
+    'author', 'author_email', 'classifiers', 'data_files', 'description',
+    'download_url', 'entry_points', 'ext_modules', 'extras_require',
+    'install_requires', 'keywords', 'license', 'long_description',
+    'maintainer', 'maintainer_email', 'name', 'python_requires', 'scripts',
+    'setup_requires', 'tests_require', 'url', 'version',
+])
+
+# setup() keywords which do not influence the metadata
+_IGNORED_KWARGS = frozenset([
+    'cmdclass', 'command_options', 'dependency_links', 'eager_resources',
+    'exclude_package_data', 'headers', 'include_package_data',
+    'libraries', 'license_file', 'license_files',
+    'long_description_content_type', 'namespace_packages', 'obsoletes',
+    'package_data', 'package_dir', 'packages', 'platforms', 'project_urls',
+    'provides', 'py_modules', 'requires', 'test_loader', 'test_suite',
+    'zip_safe',
+])
+
+_STR_METHODS = frozenset([
+    'endswith', 'format', 'join', 'lower', 'lstrip', 'partition',
+    'replace', 'rstrip', 'split', 'splitlines', 'startswith', 'strip',
+    'upper',
+])
+
+_MUTATING_METHODS = frozenset([
+    'add', 'append', 'clear', 'discard', 'extend', 'insert', 'pop',
+    'remove', 'setdefault', 'update',
+])
+
+_COMPARE_OPS = {
+    ast.Eq: lambda a, b: a == b,
+    ast.NotEq: lambda a, b: a != b,
+    ast.In: lambda a, b: a in b,
+    ast.NotIn: lambda a, b: a not in b,
+    ast.Is: lambda a, b: a is b,
+    ast.IsNot: lambda a, b: a is not b,
+}
+
+# python < 3.9 wraps subscripts in ast.Index. Later versions drop the class
+_AST_INDEX = getattr(ast, 'Index', ())
+
+
+class _Unresolvable(Exception):
+    """raised when a value can not be resolved statically"""
+
+
+class _Dotted(object):
+    """a reference to something imported, i.e. ``os.path.join``"""
+
+    def __init__(self, name):
+        self.name = name
+
+
+class _File(object):
+    """a file of the source tree opened via open()"""
+
+    def __init__(self, path, encoding):
+        self.path = path
+        self.encoding = encoding or 'utf-8'
+
+    def read(self):
+        try:
+            with io.open(self.path, 'r', encoding=self.encoding) as f:
+                return f.read()
+        except (IOError, OSError, UnicodeDecodeError, LookupError):
+            raise _Unresolvable("can not read '%s'" % self.path)
+
+    def readlines(self):
+        return self.read().splitlines(True)
+
+
+def _read_files(root_dir, filenames):
+    """the same as setuptools.config.expand.read_files(): join the content
+    of the given files. Missing files are skipped"""
+    contents = []
+    root = os.path.realpath(root_dir)
+    for filename in filenames:
+        path = os.path.realpath(os.path.join(root, filename))
+        if os.path.commonprefix([path, root + os.sep]) != root + os.sep:
+            raise _Unresolvable("'%s' is outside of the source tree" %
+                                filename)
+        if not os.path.isfile(path):
+            continue
+        try:
+            with io.open(path, 'r', encoding='utf-8') as f:
+                contents.append(f.read())
+        except (IOError, OSError, UnicodeDecodeError):
+            raise _Unresolvable("can not read '%s'" % filename)
+    return "\n".join(contents)
+
+
+class _Function(object):
+    """a function defined at module level in the parsed file"""
+
+    def __init__(self, module, node):
+        self.module = module
+        self.node = node
+
+
+def _is_main_guard(test):
+    """check for ``if __name__ == '__main__':``"""
+    if not isinstance(test, ast.Compare) or len(test.ops) != 1:
+        return False
+    left, right = test.left, test.comparators[0]
+    return all([isinstance(left, ast.Name), isinstance(test.ops[0], ast.Eq),
+                isinstance(right, ast.Constant)]) and \
+        (left.id, right.value) == ('__name__', '__main__')
+
+
+def _target_names(target):
+    """all names which are (re)bound by an assignment target"""
+    for node in ast.walk(target):
+        if isinstance(node, ast.Name):
+            yield node.id
+
+
+class _Module(object):
+    """the statically known namespace of a parsed python file"""
+
+    def __init__(self, root_dir, filename, source=None):
+        self.root_dir = root_dir
+        self.filename = filename
+        if source is None:
+            try:
+                with open(filename, 'rb') as f:
+                    source = f.read()
+            except (IOError, OSError):
+                raise _Unresolvable("can not read '%s'" % filename)
+        try:
+            self.tree = ast.parse(source, filename)
+        except (SyntaxError, ValueError):
+            raise _Unresolvable("can not parse '%s'" % filename)
+        self.assignments = {}
+        self.imports = {}
+        self.functions = {}
+        self.execs = []
+        self.unsafe = set()
+        self.setup_calls = []
+        self._withs = {}
+        self._values = {}
+        self._resolving = set()
+        self._collect(self.tree.body, conditional=False)
+        self._collect_mutations()
+
+    def _bind(self, name, node, conditional, withs):
+        if conditional or name in self.assignments:
+            self.unsafe.add(name)
+        else:
+            self.assignments[name] = node
+            self._withs[name] = withs
+
+    def _collect(self, stmts, conditional, withs=None):
+        """collect the module level names. ``withs`` are the names bound by
+        the enclosing ``with ... as name:`` statements"""
+        withs = withs or {}
+        for stmt in stmts:
+            if isinstance(stmt, ast.Import):
+                for alias in stmt.names:
+                    if alias.asname:
+                        self.imports.setdefault(alias.asname, alias.name)
+                    else:
+                        name = alias.name.split('.')[0]
+                        self.imports.setdefault(name, name)
+            elif isinstance(stmt, ast.ImportFrom):
+                if stmt.level or not stmt.module:
+                    continue
+                for alias in stmt.names:
+                    self.imports.setdefault(
+                        alias.asname or alias.name,
+                        "%s.%s" % (stmt.module, alias.name))
+            elif isinstance(stmt, (ast.Assign, ast.AnnAssign)):
+                targets = getattr(stmt, 'targets', None) or [stmt.target]
+                for target in targets:
+                    if isinstance(target, ast.Name) and stmt.value:
+                        self._bind(target.id, stmt.value, conditional,
+                                   withs)
+                    else:
+                        self.unsafe.update(_target_names(target))
+            elif isinstance(stmt, ast.FunctionDef):
+                if conditional or stmt.name in self.functions:
+                    self.unsafe.add(stmt.name)
+                self.functions[stmt.name] = stmt
+            elif isinstance(stmt, ast.With):
+                inner = dict(withs)
+                unpacked = False
+                for item in stmt.items:
+                    if isinstance(item.optional_vars, ast.Name):
+                        inner[item.optional_vars.id] = item.context_expr
+                    elif item.optional_vars is not None:
+                        unpacked = True
+                self._collect(stmt.body, conditional or unpacked, inner)
+            elif isinstance(stmt, ast.If):
+                if _is_main_guard(stmt.test):
+                    self._collect(stmt.body, conditional, withs)
+                else:
+                    self._collect(stmt.body, True, withs)
+                    self._collect(stmt.orelse, True, withs)
+            elif isinstance(stmt, ast.Try):
+                # the common "try: import setuptools except: distutils"
+                # pattern. Imports from the try block win
+                self._collect(stmt.body, conditional, withs)
+                for handler in stmt.handlers:
+                    self._collect(handler.body, True, withs)
+                self._collect(stmt.orelse, True, withs)
+                self._collect(stmt.finalbody, conditional, withs)
+            elif isinstance(stmt, (ast.For, ast.While)):
+                self._collect(stmt.body, True, withs)
+                self._collect(stmt.orelse, True, withs)
+            elif isinstance(stmt, ast.Expr) and \
+                    isinstance(stmt.value, ast.Call):
+                func = stmt.value.func
+                if isinstance(func, ast.Name) and func.id == 'exec':
+                    if conditional:
+                        raise _Unresolvable("conditional exec()")
+                    self.execs.append(stmt.value)
+                elif not conditional:
+                    self.setup_calls.append(stmt.value)
+
+    def _collect_mutations(self):
+        for node in ast.walk(self.tree):
+            if isinstance(node, ast.AugAssign):
+                self.unsafe.update(_target_names(node.target))
+            elif isinstance(node, (ast.Assign, ast.Delete)):
+                for target in node.targets:
+                    if not isinstance(target, ast.Name):
+                        self.unsafe.update(_target_names(target))
+            elif isinstance(node, ast.Global):
+                self.unsafe.update(node.names)
+            elif isinstance(node, ast.Call) and \
+                    isinstance(node.func, ast.Attribute) and \
+                    node.func.attr in _MUTATING_METHODS:
+                self.unsafe.update(_target_names(node.func.value))
+
+    def lookup(self, name):
+        """the value of the module level name"""
+        if name in self.unsafe:
+            raise _Unresolvable("'%s' is modified" % name)
+        if name in self._values:
+            return self._values[name]
+        if name in self._resolving:
+            raise _Unresolvable("recursive definition of '%s'" % name)
+        self._resolving.add(name)
+        try:
+            if name in self.assignments:
+                scope = {}
+                for var, node in self._withs[name].items():
+                    scope[var] = _Evaluator(self, scope).evaluate(node)
+                value = _Evaluator(self, scope).evaluate(
+                    self.assignments[name])
+            elif name in self.functions:
+                value = _Function(self, self.functions[name])
+            elif name in self.imports:
+                value = _Dotted(self.imports[name])
+            elif name == '__file__':
+                value = self.filename
+            else:
+                value = self._lookup_exec(name)
+        finally:
+            self._resolving.discard(name)
+        self._values[name] = value
+        return value
+
+    def _lookup_exec(self, name):
+        """names defined via ``exec(open('pkg/version.py').read())``"""
+        for call in self.execs:
+            if len(call.args) != 1:
+                raise _Unresolvable("unsupported exec() call")
+            source = _Evaluator(self).value(call.args[0])
+            if not isinstance(source, str):
+                raise _Unresolvable("unsupported exec() call")
+            module = _Module(self.root_dir, self.filename, source)
+            if name in module.assignments:
+                return module.lookup(name)
+        if name in ('open', 'dict', 'list', 'tuple', 'str'):
+            return _Dotted(name)
+        raise _Unresolvable("unknown name '%s'" % name)
+
+
+def _find_project_module(root_dir, dotted):
+    """find the file for a module of the project itself"""
+    parts = dotted.split('.')
+    for base in (root_dir, os.path.join(root_dir, 'src')):
+        path = os.path.join(base, *parts)
+        for candidate in (os.path.join(path, '__init__.py'), path + '.py'):
+            if os.path.isfile(candidate):
+                return candidate
+    return None
+
+
+class _Evaluator(object):
+    """evaluate expression nodes of a module with an optional local scope"""
+
+    def __init__(self, module, scope=None):
+        self.module = module
+        self.scope = scope or {}
+
+    def value(self, node):
+        """evaluate node and make sure the result is a plain python value"""
+        return self._concrete(self.evaluate(node))
+
+    def _concrete(self, value):
+        if isinstance(value, _Dotted):
+            return self._import_value(value.name)
+        if isinstance(value, (_File, _Function)):
+            raise _Unresolvable("not a value")
+        return value
+
+    def _import_value(self, dotted):
+        """``from pkg import __version__`` and friends. The value is looked
+        up statically in the project's own module"""
+        if '.' not in dotted:
+            raise _Unresolvable("can not use module '%s'" % dotted)
+        module_name, name = dotted.rsplit('.', 1)
+        filename = _find_project_module(self.module.root_dir, module_name)
+        if filename is None:
+            # maybe a submodule (from pkg import version; version.x)
+            raise _Unresolvable("unknown module '%s'" % module_name)
+        module = _Module(self.module.root_dir, filename)
+        return self._concrete(module.lookup(name))
+
+    def evaluate(self, node):
+        method = getattr(self, '_eval_' + node.__class__.__name__, None)
+        if method is None:
+            raise _Unresolvable("unsupported node '%s'" %
+                                node.__class__.__name__)
+        return method(node)
+
+    def _eval_Constant(self, node):
+        return node.value
+
+    def _eval_List(self, node):
+        if any(isinstance(e, ast.Starred) for e in node.elts):
+            raise _Unresolvable("unsupported starred expression")
+        return [self.value(e) for e in node.elts]
+
+    def _eval_Tuple(self, node):
+        return tuple(self._eval_List(node))
+
+    def _eval_Dict(self, node):
+        result = {}
+        for key, value in zip(node.keys, node.values):
+            if key is None:
+                merge = self.value(value)
+                if not isinstance(merge, dict):
+                    raise _Unresolvable("unsupported ** expression")
+                result.update(merge)
+            else:
+                try:
+                    result[self.value(key)] = self.value(value)
+                except TypeError:
+                    raise _Unresolvable("unhashable dict key")
+        return result
+
+    def _eval_Name(self, node):
+        if node.id in self.scope:
+            return self.scope[node.id]
+        return self.module.lookup(node.id)
+
+    def _eval_Attribute(self, node):
+        value = self.evaluate(node.value)
+        if isinstance(value, _Dotted):
+            return _Dotted("%s.%s" % (value.name, node.attr))
+        raise _Unresolvable("unsupported attribute '%s'" % node.attr)
+
+    def _eval_JoinedStr(self, node):
+        parts = []
+        for value in node.values:
+            if isinstance(value, ast.FormattedValue):
+                if value.conversion != -1 or value.format_spec:
+                    raise _Unresolvable("unsupported f-string")
+                parts.append(str(self.value(value.value)))
+            else:
+                parts.append(self.value(value))
+        return ''.join(parts)
+
+    def _eval_BinOp(self, node):
+        left = self.value(node.left)
+        right = self.value(node.right)
+        if isinstance(node.op, ast.Add) and type(left) is type(right) and \
+                isinstance(left, (str, list, tuple)):
+            return left + right
+        if isinstance(node.op, ast.Mod) and isinstance(left, str):
+            try:
+                return left % right
+            except (TypeError, ValueError, KeyError):
+                raise _Unresolvable("invalid string formatting")
+        raise _Unresolvable("unsupported binary operation")
+
+    def _eval_BoolOp(self, node):
+        is_and = isinstance(node.op, ast.And)
+        value = None
+        for expr in node.values:
+            value = self.value(expr)
+            if bool(value) != is_and:
+                return value
+        return value
+
+    def _eval_UnaryOp(self, node):
+        if isinstance(node.op, ast.Not):
+            return not self.value(node.operand)
+        raise _Unresolvable("unsupported unary operation")
+
+    def _eval_Compare(self, node):
+        left = self.value(node.left)
+        for op, comparator in zip(node.ops, node.comparators):
+            right = self.value(comparator)
+            func = _COMPARE_OPS.get(op.__class__)
+            if func is None:
+                raise _Unresolvable("unsupported comparison")
+            try:
+                if not func(left, right):
+                    return False
+            except TypeError:
+                raise _Unresolvable("unsupported comparison")
+            left = right
+        return True
+
+    def _eval_IfExp(self, node):
+        if self.value(node.test):
+            return self.value(node.body)
+        return self.value(node.orelse)
+
+    def _eval_Subscript(self, node):
+        value = self.value(node.value)
+        index = node.slice
+        if isinstance(index, _AST_INDEX):
+            # python < 3.9 wraps the subscript
+            index = index.value
+        if isinstance(index, ast.Slice):
+            key = slice(*[self.value(n) if n is not None else None
+                          for n in (index.lower, index.upper, index.step)])
+        else:
+            key = self.value(index)
+        try:
+            return value[key]
+        except (TypeError, ValueError, KeyError, IndexError):
+            raise _Unresolvable("unsupported subscript")
+
+    def _eval_ListComp(self, node):
+        if len(node.generators) != 1:
+            raise _Unresolvable("unsupported list comprehension")
+        generator = node.generators[0]
+        if not isinstance(generator.target, ast.Name):
+            raise _Unresolvable("unsupported list comprehension")
+        iterable = self.evaluate(generator.iter)
+        if isinstance(iterable, _File):
+            iterable = iterable.readlines()
+        iterable = self._concrete(iterable)
+        if not isinstance(iterable, (list, tuple)):
+            raise _Unresolvable("unsupported list comprehension")
+        result = []
+        for item in iterable:
+            scope = dict(self.scope)
+            scope[generator.target.id] = item
+            evaluator = _Evaluator(self.module, scope)
+            if all(evaluator.value(cond) for cond in generator.ifs):
+                result.append(evaluator.value(node.elt))
+        return result
+
+    def _eval_Call(self, node):
+        if any(isinstance(a, ast.Starred) for a in node.args) or \
+                any(kw.arg is None for kw in node.keywords):
+            raise _Unresolvable("unsupported call")
+        func = node.func
+        if isinstance(func, ast.Attribute):
+            target = self.evaluate(func.value)
+            if not isinstance(target, _Dotted):
+                return self._call_method(target, func.attr, node)
+            func = _Dotted("%s.%s" % (target.name, func.attr))
+        else:
+            func = self.evaluate(func)
+        args = [self.value(a) for a in node.args]
+        kwargs = dict((kw.arg, self.value(kw.value)) for kw in node.keywords)
+        if isinstance(func, _Function):
+            return self._call_function(func, args, kwargs)
+        if not isinstance(func, _Dotted):
+            raise _Unresolvable("unsupported call")
+        return self._call_builtin(func.name, args, kwargs)
+
+    def _call_method(self, target, method, node):
+        args = [self.value(a) for a in node.args]
+        kwargs = dict((kw.arg, self.value(kw.value)) for kw in node.keywords)
+        if isinstance(target, _File) and method in ('read', 'readlines'):
+            if args or kwargs:
+                raise _Unresolvable("unsupported file read")
+            return getattr(target, method)()
+        if isinstance(target, str) and method in _STR_METHODS:
+            try:
+                return getattr(target, method)(*args, **kwargs)
+            except (TypeError, ValueError, KeyError, IndexError):
+                raise _Unresolvable("unsupported str.%s() call" % method)
+        raise _Unresolvable("unsupported method '%s'" % method)
+
+    def _path(self, path):
+        """only files inside of the source tree can be read"""
+        root = os.path.realpath(self.module.root_dir)
+        path = os.path.realpath(os.path.join(root, path))
+        if os.path.commonprefix([path, root + os.sep]) != root + os.sep:
+            raise _Unresolvable("'%s' is outside of the source tree" % path)
+        return path
+
+    def _call_builtin(self, name, args, kwargs):
+        root_dir = self.module.root_dir
+        try:
+            if name in ('open', 'io.open', 'codecs.open'):
+                mode = args[1] if len(args) > 1 else kwargs.get('mode', 'r')
+                if 'w' in mode or 'a' in mode or '+' in mode:
+                    raise _Unresolvable("files can only be read")
+                encoding = kwargs.get('encoding')
+                if encoding is None and len(args) > 2 and name != 'open':
+                    encoding = args[2]
+                return _File(self._path(args[0]), encoding)
+            if name == 'os.path.join':
+                return os.path.join(*args)
+            if name in ('os.path.dirname', 'os.path.basename',
+                        'os.path.normpath'):
+                return getattr(os.path, name.rsplit('.', 1)[1])(*args)
+            if name in ('os.path.abspath', 'os.path.realpath'):
+                return os.path.normpath(os.path.join(root_dir, *args))
+            if name == 'os.getcwd':
+                return root_dir
+            if name == 'dict':
+                return dict(*args, **kwargs)
+            if name in ('list', 'tuple') and not kwargs:
+                if args and isinstance(args[0], _File):
+                    args = [args[0].readlines()]
+                return list(*args) if name == 'list' else tuple(*args)
+            if name == 'str' and not kwargs and len(args) == 1:
+                return str(args[0])
+        except (TypeError, ValueError, IndexError):
+            pass
+        raise _Unresolvable("unsupported call '%s'" % name)
+
+    def _call_function(self, func, args, kwargs):
+        """inline a simple helper function like
+        ``def read(fname): return open(fname).read()``"""
+        node = func.node
+        params = node.args
+        if params.vararg or params.kwarg or params.kwonlyargs or \
+                getattr(params, 'posonlyargs', None) or node.decorator_list:
+            raise _Unresolvable("unsupported function '%s'" % node.name)
+        names = [a.arg for a in params.args]
+        if len(args) > len(names):
+            raise _Unresolvable("too many arguments for '%s'" % node.name)
+        scope = dict(zip(names, args))
+        defaults = dict(zip(names[len(names) - len(params.defaults):],
+                            params.defaults))
+        for name in names[len(args):]:
+            if name in kwargs:
+                scope[name] = kwargs.pop(name)
+            elif name in defaults:
+                scope[name] = _Evaluator(func.module).value(defaults[name])
+            else:
+                raise _Unresolvable("missing argument for '%s'" % node.name)
+        if kwargs:
+            raise _Unresolvable("unknown arguments for '%s'" % node.name)
+        return _Evaluator(func.module, scope)._run_body(node.body)
+
+    def _run_body(self, stmts):
+        for stmt in stmts:
+            if isinstance(stmt, ast.Return):
+                return self.value(stmt.value) if stmt.value else None
+            elif isinstance(stmt, ast.Expr) and \
+                    isinstance(stmt.value, ast.Constant):
+                # a docstring
+                continue
+            elif isinstance(stmt, ast.Assign) and len(stmt.targets) == 1 \
+                    and isinstance(stmt.targets[0], ast.Name):
+                self.scope[stmt.targets[0].id] = self.evaluate(stmt.value)
+            elif isinstance(stmt, ast.With):
+                for item in stmt.items:
+                    value = self.evaluate(item.context_expr)
+                    if isinstance(item.optional_vars, ast.Name):
+                        self.scope[item.optional_vars.id] = value
+                    elif item.optional_vars is not None:
+                        raise _Unresolvable("unsupported with statement")
+                result = self._run_body(stmt.body)
+                if result is not None:
+                    return result
+            else:
+                raise _Unresolvable("unsupported statement in function")
+        return None
+
+
+###############################################################################
+def _yield_requirement_lines(value):
+    """the same as pkg_resources.yield_lines() and drop comments"""
+    if isinstance(value, str):
+        lines = value.splitlines()
+    else:
+        lines = []
+        for item in value:
+            lines.extend(_yield_requirement_lines(item))
+    for line in lines:
+        line = line.split(' #', 1)[0].strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+def _parse_requirements(value):
+    try:
+        return [Requirement(line) for line in
+                _yield_requirement_lines(value)]
+    except (InvalidRequirement, TypeError):
+        raise _Unresolvable("invalid requirement")
+
+
+def _clean_requirement(req):
+    req.marker = None
+    return str(req)
+
+
+def _finalize_requires(install_requires, extras_require):
+    """do what setuptools does when finalizing the distribution: normalize
+    the requirements and move the requirements with environment markers
+    from install_requires to extras_require"""
+    extras = {}
+    order = []
+
+    def _add(section, req=None):
+        if section not in extras:
+            extras[section] = []
+            order.append(section)
+        if req is not None:
+            extras[section].append(req)
+
+    extras_require = extras_require or {}
+    if not isinstance(extras_require, dict) or \
+            not all(isinstance(k, str) for k in extras_require):
+        raise _Unresolvable("invalid extras_require")
+    for section, value in extras_require.items():
+        _add(section)
+        for req in _parse_requirements(value):
+            suffix = ':' + str(req.marker) if req.marker else ''
+            _add(section + suffix, req)
+    simple = []
+    for req in _parse_requirements(install_requires or ()):
+        if req.marker:
+            _add(':' + str(req.marker), req)
+        else:
+            simple.append(str(req))
+    return simple, dict((section, [_clean_requirement(r)
+                                   for r in extras[section]])
+                        for section in order)
+
+
+def _normalize_version(version):
+    if version is None:
+        return "0.0.0"
+    version = str(version)
+    try:
+        return str(Version(version))
+    except InvalidVersion:
+        return version
+
+
+def _has_tests_require():
+    """setuptools >= 72 removed the tests_require attribute"""
+    global _HAS_TESTS_REQUIRE
+    if _HAS_TESTS_REQUIRE is None:
+        try:
+            import setuptools
+            _HAS_TESTS_REQUIRE = hasattr(setuptools.Distribution({}),
+                                         'tests_require')
+        except ImportError:
+            _HAS_TESTS_REQUIRE = True
+    return _HAS_TESTS_REQUIRE
+
+
+_HAS_TESTS_REQUIRE = None
+
+
+def _setup_kwargs_to_data(kwargs):
+    install_requires, extras_require = _finalize_requires(
+        kwargs.get('install_requires'), kwargs.get('extras_require'))
+    name = kwargs.get('name') or "UNKNOWN"
+    version = _normalize_version(kwargs.get('version'))
+    keywords = kwargs.get('keywords') or []
+    if isinstance(keywords, str):
+        keywords = [k.strip() for k in keywords.split(',')]
+    ext_modules = kwargs.get('ext_modules')
+    author = kwargs.get('author')
+    author_email = kwargs.get('author_email')
+    data = {
+        'data_files': kwargs.get('data_files'),
+        'entry_points': kwargs.get('entry_points'),
+        'extras_require': extras_require,
+        'install_requires': install_requires,
+        'python_requires': kwargs.get('python_requires'),
+        'setup_requires': kwargs.get('setup_requires') or [],
+        'scripts': kwargs.get('scripts'),
+        'author': author,
+        'author_email': author_email,
+        'classifiers': list(kwargs.get('classifiers') or []),
+        'contact': kwargs.get('maintainer') or author,
+        'contact_email': kwargs.get('maintainer_email') or author_email,
+        'description': kwargs.get('description'),
+        'download_url': kwargs.get('download_url'),
+        'fullname': "%s-%s" % (name, version),
+        'keywords': list(keywords),
+        'license': kwargs.get('license'),
+        'long_description': kwargs.get('long_description'),
+        'maintainer_email': kwargs.get('maintainer_email'),
+        'name': name,
+        'url': kwargs.get('url'),
+        'version': version,
+        'has_ext_modules': ext_modules and len(ext_modules) > 0,
+    }
+    if _has_tests_require():
+        data['tests_require'] = kwargs.get('tests_require')
+    # the command output is json, so make sure tuples become lists
+    return json.loads(json.dumps(data, default=str))
+
+
+def setup_kwargs_to_data(kwargs):
+    """convert the keyword arguments of a setup() call into the same data
+    which the metaextract distutils command collects
+
+    :param kwargs: a dict with setup() keyword arguments. ``ext_modules``
+                   only needs to have the correct length
+
+    :returns: the metadata dict (the 'data' part of the json blob)
+    """
+    if Requirement is None:
+        raise _Unresolvable("the packaging module is not available")
+    try:
+        return _setup_kwargs_to_data(kwargs)
+    except (TypeError, ValueError, AttributeError):
+        # i.e. classifiers=1. setuptools decides what happens with that
+        raise _Unresolvable("unsupported setup() keyword values")
+
+
+def _sequence_length(module, node):
+    """the length of a list or tuple node (the elements themselves are not
+    needed and usually can't be resolved, i.e. Extension() instances)"""
+    if isinstance(node, (ast.List, ast.Tuple)):
+        if any(isinstance(e, ast.Starred) for e in node.elts):
+            raise _Unresolvable("unsupported starred expression")
+        return len(node.elts)
+    if isinstance(node, ast.Name) and node.id not in module.unsafe and \
+            node.id in module.assignments:
+        return _sequence_length(module, module.assignments[node.id])
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        left = _sequence_length(module, node.left)
+        return left + _sequence_length(module, node.right)
+    if isinstance(node, ast.Constant) and node.value is None:
+        return None
+    raise _Unresolvable("unsupported ext_modules")
+
+
+def _setup_kwarg_nodes(module, call):
+    """the keyword nodes of the setup() call. ``**kwargs`` dicts are
+    expanded without evaluating the values"""
+    if call.args:
+        raise _Unresolvable("positional arguments for setup()")
+    nodes = {}
+    for kw in call.keywords:
+        if kw.arg is not None:
+            nodes[kw.arg] = kw.value
+            continue
+        value = kw.value
+        if isinstance(value, ast.Name) and value.id not in module.unsafe:
+            value = module.assignments.get(value.id)
+        if isinstance(value, ast.Dict) and None not in value.keys:
+            for key, node in zip(value.keys, value.values):
+                nodes[_Evaluator(module).value(key)] = node
+        elif isinstance(value, ast.Call) and \
+                isinstance(value.func, ast.Name) and \
+                value.func.id == 'dict' and not value.args:
+            for keyword in value.keywords:
+                if keyword.arg is None:
+                    raise _Unresolvable("unsupported ** expression")
+                nodes[keyword.arg] = keyword.value
+        else:
+            raise _Unresolvable("unsupported ** expression")
+    return nodes
+
+
+def _find_setup_call(module):
+    evaluator = _Evaluator(module)
+    calls = []
+    for call in module.setup_calls:
+        try:
+            func = evaluator.evaluate(call.func)
+        except _Unresolvable:
+            continue
+        if isinstance(func, _Dotted) and func.name in _SETUP_FUNCS:
+            calls.append(call)
+    if len(calls) != 1:
+        raise _Unresolvable("no single setup() call found")
+    return calls[0]
+
+
+def _has_setup_cfg_metadata(root_dir):
+    """check if there is a setup.cfg with declarative metadata"""
+    setup_cfg = os.path.join(root_dir, 'setup.cfg')
+    if not os.path.exists(setup_cfg):
+        return False
+    parser = configparser.RawConfigParser()
+    try:
+        parser.read(setup_cfg)
+    except configparser.Error:
+        return True
+    for section in parser.sections():
+        if section == 'metadata' or section.startswith('options'):
+            return True
+    return False
+
+
+def _has_pyproject_metadata(root_dir):
+    """check if there is a pyproject.toml with metadata for setuptools"""
+    pyproject = os.path.join(root_dir, 'pyproject.toml')
+    if not os.path.exists(pyproject):
+        return False
+    with io.open(pyproject, 'r', encoding='utf-8', errors='replace') as f:
+        return re.search(r'^\s*\[(project|tool\.setuptools)', f.read(),
+                         re.MULTILINE) is not None
+
+
+def _has_declarative_config(root_dir):
+    """setuptools also reads metadata from setup.cfg and pyproject.toml.
+    Those are merged into the setup() keywords and are not handled here"""
+    return _has_setup_cfg_metadata(root_dir) or \
+        _has_pyproject_metadata(root_dir)
+
+
+def _from_dir(root_dir):
+    if Requirement is None:
+        raise _Unresolvable("the packaging module is not available")
+    setup_py = os.path.join(root_dir, 'setup.py')
+    if not os.path.exists(setup_py):
+        raise _Unresolvable("no setup.py")
+    if _has_declarative_config(root_dir):
+        raise _Unresolvable("declarative config found")
+    module = _Module(root_dir, setup_py)
+    call = _find_setup_call(module)
+    nodes = _setup_kwarg_nodes(module, call)
+    kwargs = {}
+    evaluator = _Evaluator(module)
+    for key, node in nodes.items():
+        if key in _IGNORED_KWARGS:
+            continue
+        if key not in _HANDLED_KWARGS:
+            raise _Unresolvable("unsupported setup() keyword '%s'" % key)
+        if key == 'ext_modules':
+            length = _sequence_length(module, node)
+            kwargs[key] = None if length is None else [None] * length
+        else:
+            kwargs[key] = evaluator.value(node)
+    return {
+        'version': DATA_VERSION,
+        'data': setup_kwargs_to_data(kwargs),
+        'engine': ENGINE,
+    }
+
+
+###############################################################################
+def from_dir(root_dir):
+    """extract metadata from the setup.py in root_dir without executing it
+
+    The setup.py is parsed with :mod:`ast` and the keyword arguments of the
+    ``setup()`` call are resolved statically. Only literals, module level
+    assignments, reading files from the source tree, simple helper functions
+    and ``__version__`` lookups in the project's own modules are understood.
+
+    :param root_dir: the directory which contains the setup.py
+
+    :returns: a json blob with metadata in the same format which the
+              metaextract command produces or None if the setup.py can not
+              be handled statically
+    """
+    try:
+        return _from_dir(root_dir)
+    except (_Unresolvable, RecursionError):
+        return None
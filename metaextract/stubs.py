@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016, Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""lightweight stub modules for build time dependencies of setup.py files
+
+Many setup.py files import numpy, Cython, pybind11 or cffi only to compute
+include directories or the extension modules. With the stubs installed, a
+meta path hook serves cheap replacements for these packages (and their
+submodules), so the setup.py neither fails when they are missing nor pays
+for importing them. The stubs cover the usual helpers (i.e.
+``numpy.get_include()``, ``Cython.Build.cythonize()`` or
+``pybind11.setup_helpers.Pybind11Extension``). Everything else resolves to
+a permissive placeholder object.
+"""
+
+from __future__ import print_function
+
+import glob
+import importlib.abc
+import importlib.util
+import os
+import sys
+
+
+__all__ = [
+    "DEFAULT_STUBS",
+    "install",
+]
+
+
+# the packages which are stubbed by default
+DEFAULT_STUBS = ('numpy', 'Cython', 'pybind11', 'cffi')
+
+# the directory the stubbed get_include() functions return
+_INCLUDE_DIR = os.path.join(sys.prefix, 'include', 'metaextract-stub')
+
+
+class _Placeholder(object):
+    """an object which can be called, iterated, indexed and has every
+    attribute. Everything returns another placeholder or nothing"""
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return _Placeholder('%s.%s' % (self._name, name))
+
+    def __call__(self, *args, **kwargs):
+        return _Placeholder('%s()' % self._name)
+
+    def __getitem__(self, key):
+        return _Placeholder('%s[]' % self._name)
+
+    def __iter__(self):
+        return iter(())
+
+    def __len__(self):
+        return 0
+
+    def __bool__(self):
+        return False
+
+    __nonzero__ = __bool__
+
+    def __str__(self):
+        return self._name
+
+    def __repr__(self):
+        return '<stub %s>' % self._name
+
+    def __fspath__(self):
+        return _INCLUDE_DIR
+
+
+def _module_getattr(module):
+    """a PEP 562 module __getattr__ which returns placeholders"""
+    def __getattr__(name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return _Placeholder('%s.%s' % (module.__name__, name))
+    return __getattr__
+
+
+def _extension_class():
+    """the Extension class the setup.py would get. setuptools is only
+    imported if the setup.py already uses it"""
+    if 'setuptools' not in sys.modules:
+        try:
+            from distutils.core import Extension
+            return Extension
+        except ImportError:
+            pass
+    from setuptools import Extension
+    return Extension
+
+
+def _build_ext_class():
+    if 'setuptools' not in sys.modules:
+        try:
+            from distutils.command.build_ext import build_ext
+            return build_ext
+        except ImportError:
+            pass
+    from setuptools.command.build_ext import build_ext
+    return build_ext
+
+
+def _get_include(*args, **kwargs):
+    return _INCLUDE_DIR
+
+
+def _module_name(path, strip=None):
+    """the dotted module name for the source file path"""
+    name = os.path.splitext(os.path.normpath(path))[0]
+    if strip and name.startswith(strip.rstrip(os.sep) + os.sep):
+        name = name[len(strip.rstrip(os.sep)) + 1:]
+    return name.replace(os.sep, '.')
+
+
+def _cythonize(module_list, *args, **kwargs):
+    """the extensions cythonize() would return. The sources are not
+    translated"""
+    if isinstance(module_list, (str, _extension_class())):
+        module_list = [module_list]
+    extension = _extension_class()
+    extensions = []
+    for module in module_list:
+        if isinstance(module, str):
+            for path in sorted(glob.glob(module, recursive=True)):
+                extensions.append(extension(_module_name(path), [path]))
+        else:
+            extensions.append(module)
+    return extensions
+
+
+def _pybind11_extension(*args, **kwargs):
+    for key in ('cxx_std', 'include_pybind11'):
+        kwargs.pop(key, None)
+    return _extension_class()(*args, **kwargs)
+
+
+def _intree_extensions(paths, package_dir=None):
+    strip = None
+    if package_dir:
+        strip = package_dir.get('', None)
+    return [_pybind11_extension(_module_name(path, strip), [path])
+            for path in paths]
+
+
+class _ParallelCompile(object):
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def install(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+def _setup(**attrs):
+    """numpy.distutils.core.setup. Looked up at call time, so a replaced
+    setup() (see :mod:`metaextract.capture`) is used"""
+    if 'setuptools' in sys.modules:
+        import setuptools
+        return setuptools.setup(**attrs)
+    import distutils.core
+    return distutils.core.setup(**attrs)
+
+
+def _lazy(factory):
+    """a module attribute which is created on first access"""
+    factory._stub_lazy = True
+    return factory
+
+
+# the attributes of the known (sub)modules
+_MODULES = {
+    'numpy': {
+        '__version__': '1.26.4',
+        'get_include': _get_include,
+        'get_numpy_include': _get_include,
+    },
+    'numpy.distutils.core': {
+        'setup': _setup,
+        'Extension': _lazy(_extension_class),
+    },
+    'numpy.distutils.misc_util': {
+        'get_numpy_include_dirs': lambda: [_INCLUDE_DIR],
+    },
+    'Cython': {
+        '__version__': '3.0.10',
+    },
+    'Cython.Build': {
+        'cythonize': _cythonize,
+        'build_ext': _lazy(_build_ext_class),
+    },
+    'Cython.Distutils': {
+        'build_ext': _lazy(_build_ext_class),
+        'Extension': _lazy(_extension_class),
+    },
+    'pybind11': {
+        '__version__': '2.12.0',
+        'get_include': _get_include,
+        'get_cmake_dir': _get_include,
+    },
+    'pybind11.setup_helpers': {
+        'Pybind11Extension': _pybind11_extension,
+        'build_ext': _lazy(_build_ext_class),
+        'intree_extensions': _intree_extensions,
+        'ParallelCompile': _ParallelCompile,
+        'naive_recompile': lambda *args, **kwargs: True,
+        'no_recompile': lambda *args, **kwargs: True,
+    },
+    'cffi': {
+        '__version__': '1.16.0',
+        '__version_info__': (1, 16, 0),
+    },
+}
+
+
+class _StubLoader(importlib.abc.Loader):
+    def create_module(self, spec):
+        return None
+
+    def exec_module(self, module):
+        # every stub is a package, so any submodule can be imported
+        module.__path__ = []
+        module.__file__ = '<metaextract stub>'
+        getattr_ = _module_getattr(module)
+        for name, value in _MODULES.get(module.__name__, {}).items():
+            if getattr(value, '_stub_lazy', False):
+                continue
+            setattr(module, name, value)
+        lazy = dict((name, value) for name, value in
+                    _MODULES.get(module.__name__, {}).items()
+                    if getattr(value, '_stub_lazy', False))
+
+        def __getattr__(name):
+            if name in lazy:
+                return lazy[name]()
+            return getattr_(name)
+        module.__getattr__ = __getattr__
+
+
+class StubFinder(importlib.abc.MetaPathFinder):
+    """a meta path finder which serves stub modules for the given top level
+    packages and all their submodules"""
+    def __init__(self, names):
+        self.names = frozenset(names)
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname.split('.', 1)[0] not in self.names:
+            return None
+        return importlib.util.spec_from_loader(fullname, _StubLoader(),
+                                               is_package=True)
+
+
+###############################################################################
+def install(names=DEFAULT_STUBS):
+    """serve stub modules for the given top level packages in this process.
+    Already imported modules are not replaced
+
+    :param names: the names of the top level packages (i.e. ``numpy``)
+    """
+    sys.meta_path.insert(0, StubFinder(names))
@@ -15,15 +15,43 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+from concurrent import futures
+import io
+import json
 import os
+import pickle
 import pytest
 import shutil
+import socket
+import subprocess
 import sys
 import tarfile
+import threading
+import time
+import zipfile
 
 import setuptools
 
+from metaextract import aio as meta_aio
+from metaextract import archive as meta_archive
+from metaextract import batch as meta_batch
+from metaextract import cache as meta_cache
+from metaextract import capture as meta_capture
+from metaextract import forkserver as meta_forkserver
+from metaextract import index as meta_index
+from metaextract import limits as meta_limits
+from metaextract import pkginfo as meta_pkginfo
+from metaextract import pyproject as meta_pyproject
+from metaextract import result as meta_result
+from metaextract import server as meta_server
+from metaextract import setupcfg as meta_setupcfg
+from metaextract import sparse as meta_sparse
+from metaextract import static as meta_static
+from metaextract import stubs as meta_stubs
 from metaextract import utils as meta_utils
+from metaextract import wheel as meta_wheel
+from metaextract import workdir as meta_workdir
 
 
 base_dir = os.path.dirname(__file__)
@@ -75,6 +103,34 @@ def ziparchive(tmpdir):
     return zipfile_name + ".zip", files
 
 
+def _make_tar(filename, members):
+    """create a tar.gz archive from a dict with member names and content"""
+    with tarfile.open(filename, "w:gz") as tar:
+        for name, content in sorted(members.items()):
+            content = content.encode('utf-8')
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return filename
+
+
+_PKG_INFO = """Metadata-Version: 2.2
+Name: testpkg
+Version: 1.2.3
+Summary: desc
+Author: Test Author
+Keywords: test,pkg
+Classifier: Intended Audience :: Developers
+Requires-Python: >=3.6
+Provides-Extra: extra1
+Requires-Dist: foo
+Requires-Dist: bar>=1.0; python_version < "3.8"
+Requires-Dist: ex11; extra == "extra1"
+%s
+long desc
+"""
+
+
 class TestMetaExtract(object):
     def test__extract_to_tempdir_no_file(self):
         with pytest.raises(Exception) as e_info:
@@ -86,9 +142,9 @@ class TestMetaExtract(object):
         tarball_name, tarball_files = tararchive
         current_cwd = os.getcwd()
         with meta_utils._extract_to_tempdir(tarball_name) as tempdir:
-            assert sorted(os.listdir(".")) == tarball_files
-        # back in the original working dir
-        assert current_cwd == os.getcwd()
+            assert sorted(os.listdir(tempdir)) == tarball_files
+            # the cwd is not changed
+            assert current_cwd == os.getcwd()
         # tempdir no longer exists
         assert os.path.exists(tempdir) is False
 
@@ -96,53 +152,163 @@ class TestMetaExtract(object):
         zip_name, zip_files = ziparchive
         current_cwd = os.getcwd()
         with meta_utils._extract_to_tempdir(zip_name) as tempdir:
-            assert sorted(os.listdir(".")) == zip_files
-        # back in the original working dir
-        assert current_cwd == os.getcwd()
+            assert sorted(os.listdir(tempdir)) == zip_files
+            # the cwd is not changed
+            assert current_cwd == os.getcwd()
         # tempdir no longer exists
         assert os.path.exists(tempdir) is False
 
-    def test__enter_single_subdir_0_dir(self, tmpdir):
-        current_cwd = os.getcwd()
-        with meta_utils._enter_single_subdir(tmpdir.strpath) as dest_dir:
-            assert dest_dir == tmpdir.strpath
-        # back in the original working dir
-        assert current_cwd == os.getcwd()
+    def test__single_subdir_0_dir(self, tmpdir):
+        assert meta_utils._single_subdir(tmpdir.strpath) == tmpdir.strpath
 
-    def test__enter_single_subdir_1_dir(self, tmpdir):
-        current_cwd = os.getcwd()
+    def test__single_subdir_1_dir(self, tmpdir):
         d1 = os.path.join(tmpdir.strpath, "dir1")
         os.mkdir(d1)
-        with meta_utils._enter_single_subdir(tmpdir.strpath) as dest_dir:
-            assert dest_dir == d1
-        # back in the original working dir
-        assert current_cwd == os.getcwd()
+        assert meta_utils._single_subdir(tmpdir.strpath) == d1
 
-    def test__enter_single_subdir_2_dirs(self, tmpdir):
-        current_cwd = os.getcwd()
+    def test__single_subdir_2_dirs(self, tmpdir):
         d1 = os.path.join(tmpdir.strpath, "dir1")
         d2 = os.path.join(tmpdir.strpath, "dir2")
         os.mkdir(d1)
         os.mkdir(d2)
-        with meta_utils._enter_single_subdir(tmpdir.strpath) as dest_dir:
-            assert dest_dir == tmpdir.strpath
-        # back in the original working dir
-        assert current_cwd == os.getcwd()
+        assert meta_utils._single_subdir(tmpdir.strpath) == tmpdir.strpath
+
+    @pytest.mark.parametrize("source,expected", [
+        (b"import os\n", None),
+        (b"\xef\xbb\xbfname = '\xc3\xa4'\n", None),
+        (b"#!/usr/bin/python\n# coding: latin-1\nname = '\xe4'\n", None),
+        (b"name = '\xc3\xa4'\n", "utf-8"),
+        (b"name = '\xe4'\n", "latin-1"),
+    ])
+    def test__source_encoding(self, source, expected):
+        assert meta_utils._source_encoding(source) == expected
+
+    def test__set_file_encoding_shebang(self, tmpdir):
+        testfile = tmpdir.join("setup.py")
+        testfile.write_binary(b"#!/usr/bin/python\nname = '\xe4'\n")
+        meta_utils._set_file_encoding(testfile.strpath, "latin-1")
+        assert testfile.read_binary() == \
+            b"#!/usr/bin/python\n# -*- coding: latin-1 -*-\nname = '\xe4'\n"
+
+    def test_setup_py_latin1(self, tmpdir):
+        tmpdir.join("setup.py").write_binary(
+            b"from setuptools import setup\n"
+            b"setup(name='latin', version='1.0', author='J\xf6rg')\n")
+        data = meta_utils._setup_py_run_from_dir(tmpdir.strpath,
+                                                 sys.executable)
+        assert data['data']['author'] == u'J\xf6rg'
 
-    def test__set_file_encoding_utf8(self, tmpdir):
-        testfile = tmpdir.mkdir("encoding").join("setup.py")
-        firstline = "the first line of the file"
-        with open(testfile.strpath, "a") as f:
-            f.write(firstline)
-        meta_utils._set_file_encoding_utf8(testfile.strpath)
-        with open(testfile.strpath, 'r') as f:
-            assert f.read() == "# -*- coding: utf-8 -*-\n" + firstline
+    def test_setup_py_broken_runs_once(self, tmpdir, monkeypatch):
+        tmpdir.join("setup.py").write("raise RuntimeError('broken')\n")
+        calls = []
+        check_output = meta_utils._check_output
+
+        def _counting_check_output(*args, **kwargs):
+            calls.append(args)
+            return check_output(*args, **kwargs)
+
+        monkeypatch.setattr(meta_utils, "_check_output",
+                            _counting_check_output)
+        with pytest.raises(subprocess.CalledProcessError):
+            meta_utils._setup_py_run_from_dir(tmpdir.strpath, sys.executable)
+        assert len(calls) == 1
+
+    def test_setup_py_python2_unchanged(self, tmpdir):
+        setup_py = tmpdir.join("setup.py")
+        setup_py.write("print 'python 2'\n")
+        with pytest.raises(subprocess.CalledProcessError):
+            meta_utils._setup_py_run_from_dir(tmpdir.strpath, sys.executable)
+        assert setup_py.read() == "print 'python 2'\n"
 
     def test_from_archive(self, tararchive):
         tar_name, tar_files = tararchive
         data = meta_utils.from_archive(tar_name)
         assert data["data"]["install_requires"] == ['bar', 'foo']
 
+    def test_from_archive_threads(self, tmpdir):
+        # many concurrent calls must not influence each other
+        archives = []
+        for i in range(8):
+            archive = tmpdir.join("testpkg%d-1.0.tar.gz" % i).strpath
+            _make_tar(archive, {
+                "testpkg%d-1.0/setup.py" % i:
+                "from setuptools import setup\n"
+                "setup(name='testpkg%d', version='1.0',\n"
+                "      install_requires=['dep%d'])\n" % (i, i),
+            })
+            archives.append(archive)
+        current_cwd = os.getcwd()
+        with futures.ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(meta_utils.from_archive,
+                                        archives * 3))
+        assert current_cwd == os.getcwd()
+        for i, data in enumerate(results):
+            assert data['data']['name'] == 'testpkg%d' % (i % 8)
+            assert data['data']['install_requires'] == ['dep%d' % (i % 8)]
+
+    @pytest.mark.parametrize("has_pass_fds", [True, False])
+    def test_setup_py_output_transport(self, tmpdir, monkeypatch,
+                                       has_pass_fds):
+        # noise on stdout must not end up in the metadata and a large
+        # output must not block the pipe
+        monkeypatch.setattr(meta_utils, "_HAS_PASS_FDS", has_pass_fds)
+        tmpdir.join("setup.py").write(
+            "from setuptools import setup\n"
+            "print('noise')\n"
+            "setup(name='noisy', version='1.0',\n"
+            "      long_description='x' * 200000)\n")
+        data = meta_utils._setup_py_run_from_dir(tmpdir.strpath,
+                                                 sys.executable)
+        assert data['data']['name'] == 'noisy'
+        assert data['data']['long_description'] == 'x' * 200000
+
+    @pytest.mark.parametrize("static", [False, True])
+    def test_from_archive_fields(self, tararchive, tmpdir, static):
+        tar_name, tar_files = tararchive
+        cache = meta_cache.ResultCache(tmpdir.join("cache").strpath)
+        fields = ['install_requires', 'python_requires']
+        for i in range(2):
+            data = meta_utils.from_archive(tar_name, cache=cache,
+                                           static=static, fields=fields)
+            assert sorted(data['data']) == fields
+            assert data['data']['install_requires'] == ['bar', 'foo']
+        # a different projection is not served from the cache
+        assert 'name' in meta_utils.from_archive(tar_name, cache=cache,
+                                                 static=static)['data']
+
+    def test_invalid_fields(self, tararchive, tmpdir):
+        tar_name, tar_files = tararchive
+        probe = tmpdir.join("probe")
+        with pytest.raises(Exception) as e_info:
+            meta_utils.from_archive(
+                tar_name, fields=['name;touch %s;echo' % probe.strpath])
+        assert 'Invalid field name' in str(e_info.value)
+        assert not probe.exists()
+
+    def test_interpreter_with_space(self, tmpdir):
+        tmpdir.join("setup.py").write(
+            "from setuptools import setup\nsetup(name='testpkg')\n")
+        py_dir = tmpdir.mkdir("python dir")
+        py = py_dir.join("python")
+        py.mksymlinkto(sys.executable)
+        data = meta_utils._setup_py_run_from_dir(tmpdir.strpath, py.strpath)
+        assert data['data']['name'] == 'testpkg'
+
+    def test_command_fields(self, tmpdir):
+        tmpdir.join("setup.py").write(
+            "from setuptools import setup\n"
+            "setup(name='fields', version='1.0', long_description='x',\n"
+            "      install_requires=['foo'])\n")
+        output = tmpdir.join("output.json")
+        subprocess.check_call(
+            [sys.executable, "setup.py", "-q", "--command-packages",
+             "metaextract", "metaextract", "--fields",
+             "install_requires,name", "-o", output.strpath],
+            cwd=tmpdir.strpath)
+        data = json.loads(output.read())
+        assert data['data'] == {'install_requires': ['foo'],
+                                'name': 'fields'}
+
     def test_no_setup_py(self, tmpdir):
         with pytest.raises(Exception) as e_info:
             meta_utils._setup_py_run_from_dir(tmpdir.strpath, sys.executable)
@@ -290,3 +456,1462 @@ class TestMetaExtract(object):
         if _HAS_TESTS_REQUIRE:
             assert data['data'].get('tests_require') == \
                 expected_tests_require
+
+
+class TestBatch(object):
+    def test_iter_archive_list(self):
+        lines = ["a.tar.gz\n", "\n", "  b.zip  \n"]
+        assert list(meta_batch.iter_archive_list(lines)) == [
+            "a.tar.gz", "b.zip"]
+
+    def test_iter_from_archives(self, tararchive, tmpdir):
+        tar_name, tar_files = tararchive
+        missing = tmpdir.join("missing.tar.gz").strpath
+        records = list(meta_batch.iter_from_archives(
+            [tar_name, missing, tar_name], jobs=2))
+        assert len(records) == 3
+        by_archive = {}
+        for record in records:
+            by_archive.setdefault(record['archive'], []).append(record)
+        assert len(by_archive[tar_name]) == 2
+        for record in by_archive[tar_name]:
+            assert record['data']['install_requires'] == ['bar', 'foo']
+        assert 'data' not in by_archive[missing][0]
+        assert by_archive[missing][0]['error']['type'] == 'Exception'
+        assert missing in by_archive[missing][0]['error']['message']
+
+
+class TestResultCache(object):
+    def test_key(self, tararchive, ziparchive):
+        tar_name, tar_files = tararchive
+        zip_name, zip_files = ziparchive
+        cache = meta_cache.ResultCache("unused")
+        key = cache.key(tar_name, sys.executable)
+        assert key == cache.key(tar_name, sys.executable)
+        assert key != cache.key(zip_name, sys.executable)
+        assert key != cache.key(tar_name, sys.executable, {'foo': 'bar'})
+
+    def test_get_put(self, tmpdir):
+        cache = meta_cache.ResultCache(tmpdir.strpath)
+        assert cache.get("abcdef") is None
+        cache.put("abcdef", {'version': 1, 'data': {'name': 'foo'}})
+        assert cache.get("abcdef") == {'version': 1, 'data': {'name': 'foo'}}
+
+    def test_max_age(self, tmpdir):
+        cache = meta_cache.ResultCache(tmpdir.strpath, max_age=60)
+        cache.put("abcdef", {'version': 1, 'data': {}})
+        path = tmpdir.join("ab", "abcdef.json").strpath
+        old = time.time() - 120
+        os.utime(path, (old, old))
+        assert cache.get("abcdef") is None
+        assert os.path.exists(path) is False
+
+    def test_prune_max_size(self, tmpdir):
+        cache = meta_cache.ResultCache(tmpdir.strpath, max_size=1,
+                                       prune_interval=0)
+        for i, key in enumerate(["aa1", "bb2", "cc3"]):
+            cache.put(key, {'version': 1, 'data': {'name': key}})
+            path = tmpdir.join(key[:2], key + ".json").strpath
+            os.utime(path, (i, time.time()))
+        size = os.path.getsize(tmpdir.join("cc", "cc3.json").strpath)
+        cache.max_size = size
+        cache.prune()
+        assert cache.get("aa1") is None
+        assert cache.get("bb2") is None
+        assert cache.get("cc3") is not None
+
+    def test_batch_prune(self, tmpdir):
+        archives = [_make_tar(tmpdir.join("pkg%d.tar.gz" % i).strpath, {
+            "pkg/setup.py": "from setuptools import setup\n"
+                            "setup(name='pkg%d')\n" % i}) for i in range(4)]
+        cache_dir = tmpdir.join("cache")
+        cache = meta_cache.ResultCache(cache_dir.strpath, max_size=1,
+                                       prune_interval=2)
+        records = list(meta_batch.iter_from_archives(archives, jobs=2,
+                                                     cache=cache))
+        assert len(records) == 4
+        assert not list(cache._entries())
+
+    def test_interpreter_identity_venv(self, tmpdir):
+        venv_dir = tmpdir.join("venv")
+        subprocess.check_call([sys.executable, "-m", "venv",
+                               "--without-pip", venv_dir.strpath])
+        venv_python = venv_dir.join("bin", "python").strpath
+        assert meta_cache._binary_identity(venv_python) == \
+            meta_cache._binary_identity(sys.executable)
+        assert meta_cache._interpreter_identity(venv_python) != \
+            meta_cache._interpreter_identity(sys.executable)
+        assert meta_cache._interpreter_identity(venv_python)[1] == \
+            os.path.realpath(venv_dir.strpath)
+
+    def test_from_archive_cached(self, tararchive, tmpdir, monkeypatch):
+        tar_name, tar_files = tararchive
+        cache = meta_cache.ResultCache(tmpdir.join("cache").strpath)
+        data = meta_utils.from_archive(tar_name, cache=cache)
+
+        def _fail(*args, **kwargs):
+            raise AssertionError("archive extracted again")
+
+        monkeypatch.setattr(meta_utils, "_extract_to_tempdir", _fail)
+        assert meta_utils.from_archive(tar_name, cache=cache) == data
+
+
+class TestStatic(object):
+    def _copy_fixture(self, tmpdir, fixture_name):
+        fixture_dir = os.path.join(fixtures_base_dir, fixture_name)
+        dest_dir = os.path.join(tmpdir.strpath, fixture_name)
+        shutil.copytree(fixture_dir, dest_dir)
+        return dest_dir
+
+    @pytest.mark.parametrize("fixture_name", [
+        "setuptools_simple",
+        "setuptools_simple_unicode",
+        "setuptools_simple_unicode_and_header",
+        "setuptools_full",
+        "distutils_simple",
+        "distutils_with_extension",
+    ])
+    def test_same_as_execute(self, tmpdir, fixture_name):
+        static_dir = self._copy_fixture(tmpdir.mkdir("static"),
+                                        fixture_name)
+        execute_dir = self._copy_fixture(tmpdir.mkdir("execute"),
+                                         fixture_name)
+        static_data = meta_utils._static_run_from_dir(static_dir)
+        execute_data = meta_utils._setup_py_run_from_dir(execute_dir,
+                                                         sys.executable)
+        assert static_data['engine'] == 'ast'
+        assert execute_data['engine'] == 'execute'
+        assert static_data['version'] == execute_data['version']
+        assert static_data['data'] == execute_data['data']
+
+    @pytest.mark.parametrize("fixture_name", ["pbr_simple", "pyproject"])
+    def test_not_static(self, tmpdir, fixture_name):
+        dest_dir = self._copy_fixture(tmpdir, fixture_name)
+        assert meta_static.from_dir(dest_dir) is None
+
+    def test_pyproject_same_as_execute(self, tmpdir):
+        static_dir = self._copy_fixture(tmpdir.mkdir("static"), "pyproject")
+        execute_dir = self._copy_fixture(tmpdir.mkdir("execute"),
+                                         "pyproject")
+        static_data = meta_utils._static_run_from_dir(static_dir)
+        execute_data = meta_utils._setup_py_run_from_dir(execute_dir,
+                                                         sys.executable)
+        assert static_data['engine'] == 'pyproject'
+        assert static_data['data'] == execute_data['data']
+
+    def test_setupcfg_same_as_execute(self, tmpdir):
+        static_dir = self._copy_fixture(tmpdir.mkdir("static"),
+                                        "setupcfg_declarative")
+        execute_dir = self._copy_fixture(tmpdir.mkdir("execute"),
+                                         "setupcfg_declarative")
+        static_data = meta_utils._static_run_from_dir(static_dir)
+        execute_data = meta_utils._setup_py_run_from_dir(execute_dir,
+                                                         sys.executable)
+        assert static_data['engine'] == 'setup.cfg'
+        assert static_data['data']['version'] == '1.2.3'
+        assert static_data['data'] == execute_data['data']
+
+    def test_setupcfg_not_trivial(self, tmpdir):
+        dest_dir = self._copy_fixture(tmpdir, "setupcfg_declarative")
+        with open(os.path.join(dest_dir, "setup.py"), "w") as f:
+            f.write("import setuptools\nsetuptools.setup(version='1.0')\n")
+        assert meta_setupcfg.from_dir(dest_dir) is None
+
+    def test_pyproject_dynamic(self, tmpdir):
+        dest_dir = self._copy_fixture(tmpdir, "pyproject")
+        pyproject = os.path.join(dest_dir, "pyproject.toml")
+        with open(pyproject) as f:
+            content = f.read()
+        with open(pyproject, "w") as f:
+            f.write(content.replace('version= "1.2.3"',
+                                    'dynamic = ["version"]'))
+        assert meta_pyproject.from_dir(dest_dir) is None
+
+    def test_resolve(self, tmpdir):
+        tmpdir.join("requirements.txt").write("foo>=1.0\n# comment\nbar\n")
+        tmpdir.join("README").write("long desc")
+        pkg = tmpdir.mkdir("pkg")
+        pkg.join("__init__.py").write("__version__ = '2.0'\n")
+        tmpdir.join("setup.py").write("""
+import os
+from setuptools import setup, find_packages
+from pkg import __version__
+
+here = os.path.abspath(os.path.dirname(__file__))
+
+
+def read(fname):
+    with open(os.path.join(here, fname)) as f:
+        return f.read()
+
+
+with open('requirements.txt') as f:
+    requires = [l.strip() for l in f if l.strip() and not l.startswith('#')]
+
+setup(
+    name='pkg',
+    version=__version__,
+    long_description=read('README'),
+    packages=find_packages(),
+    install_requires=requires,
+    extras_require=dict(test=['pytest']),
+    keywords='a, b',
+)
+""")
+        data = meta_static.from_dir(tmpdir.strpath)
+        assert data['engine'] == 'ast'
+        assert data['data']['version'] == '2.0'
+        assert data['data']['fullname'] == 'pkg-2.0'
+        assert data['data']['long_description'] == 'long desc'
+        assert data['data']['install_requires'] == ['foo>=1.0', 'bar']
+        assert data['data']['extras_require'] == {'test': ['pytest']}
+        assert data['data']['keywords'] == ['a', 'b']
+
+    @pytest.mark.parametrize("setup_py", [
+        # modified after the assignment
+        "import setuptools\nreqs = ['foo']\nreqs.append('bar')\n"
+        "setuptools.setup(name='x', install_requires=reqs)\n",
+        # conditional assignment
+        "import sys, setuptools\nif sys.version_info < (3,):\n"
+        "    reqs = ['foo']\nelse:\n    reqs = []\n"
+        "setuptools.setup(name='x', install_requires=reqs)\n",
+        # unknown setup() keyword which may change the metadata
+        "import setuptools\nsetuptools.setup(name='x', pbr=True)\n",
+        # not setuptools
+        "from skbuild import setup\nsetup(name='x')\n",
+        # file outside of the source tree
+        "import setuptools\n"
+        "setuptools.setup(long_description=open('/etc/hosts').read())\n",
+    ])
+    def test_unresolvable(self, tmpdir, setup_py):
+        tmpdir.join("setup.py").write(setup_py)
+        assert meta_static.from_dir(tmpdir.strpath) is None
+
+    def test_subscript(self, tmpdir):
+        tmpdir.join("setup.py").write(
+            "import setuptools\n"
+            "meta = {'name': 'pkg', 'version': 'v2.0'}\n"
+            "reqs = ['foo', 'bar', 'baz']\n"
+            "setuptools.setup(name=meta['name'],\n"
+            "                 version=meta['version'][1:],\n"
+            "                 install_requires=reqs[0:2] + [reqs[2]])\n")
+        data = meta_static.from_dir(tmpdir.strpath)
+        assert data['data']['fullname'] == 'pkg-2.0'
+        assert data['data']['install_requires'] == ['foo', 'bar', 'baz']
+
+    @pytest.mark.parametrize("kwargs", [
+        "classifiers=1",
+        "keywords=5",
+        "extras_require=['a']",
+        "extras_require={1: ['foo']}",
+        "extras_require={['a']: 1}",
+        "version='x'[::0]",
+    ])
+    def test_invalid_values(self, tmpdir, kwargs):
+        tmpdir.join("setup.py").write(
+            "import setuptools\nsetuptools.setup(name='x', %s)\n" % kwargs)
+        assert meta_static.from_dir(tmpdir.strpath) is None
+
+    def test_from_archive_static(self, tararchive):
+        tar_name, tar_files = tararchive
+        data = meta_utils.from_archive(tar_name, static=True)
+        assert data['engine'] == 'ast'
+        assert data['data']['install_requires'] == ['bar', 'foo']
+
+
+class TestPkgInfo(object):
+    def _archive(self, tmpdir, pkg_info):
+        return _make_tar(tmpdir.join("testpkg-1.2.3.tar.gz").strpath, {
+            "testpkg-1.2.3/PKG-INFO": pkg_info,
+            "testpkg-1.2.3/setup.py": "raise SystemExit(1)\n",
+            "testpkg-1.2.3/testpkg.egg-info/entry_points.txt":
+                "[console_scripts]\ntestpkgp1 = testpkg:main\n",
+        })
+
+    def test_from_archive(self, tmpdir):
+        archive = self._archive(tmpdir, _PKG_INFO % "")
+        data = meta_pkginfo.from_archive(archive)
+        assert data['engine'] == 'pkg-info'
+        assert data['data']['name'] == 'testpkg'
+        assert data['data']['version'] == '1.2.3'
+        assert data['data']['fullname'] == 'testpkg-1.2.3'
+        assert data['data']['author'] == 'Test Author'
+        assert data['data']['keywords'] == ['test', 'pkg']
+        assert data['data']['long_description'] == 'long desc\n'
+        assert data['data']['python_requires'] == '>=3.6'
+        assert data['data']['install_requires'] == ['foo']
+        assert data['data']['extras_require'] == {
+            'extra1': ['ex11'],
+            ':python_version < "3.8"': ['bar>=1.0'],
+        }
+        assert data['data']['entry_points'] == {
+            'console_scripts': ['testpkgp1 = testpkg:main']}
+        assert 'setup_requires' not in data['data']
+
+    def test_from_archive_utils(self, tmpdir):
+        archive = self._archive(tmpdir, _PKG_INFO % "")
+        data = meta_utils.from_archive(archive, static=True)
+        assert data['engine'] == 'pkg-info'
+
+    @pytest.mark.parametrize("pkg_info", [
+        _PKG_INFO % "Dynamic: Requires-Dist",
+        (_PKG_INFO % "").replace("Metadata-Version: 2.2",
+                                 "Metadata-Version: 2.1"),
+    ])
+    def test_not_usable(self, tmpdir, pkg_info):
+        archive = self._archive(tmpdir, pkg_info)
+        assert meta_pkginfo.from_archive(archive) is None
+
+    def test_not_usable_stops_early(self, tmpdir, monkeypatch):
+        archive = self._archive(tmpdir, _PKG_INFO % "Dynamic: Version")
+        seen = []
+        member_kind = meta_pkginfo._member_kind
+
+        def _recording_member_kind(name):
+            seen.append(name)
+            return member_kind(name)
+
+        monkeypatch.setattr(meta_pkginfo, "_member_kind",
+                            _recording_member_kind)
+        assert meta_pkginfo.from_archive(archive) is None
+        assert seen == ["testpkg-1.2.3/PKG-INFO"]
+
+    def test_max_members(self, tmpdir):
+        archive = self._archive(tmpdir, _PKG_INFO % "")
+        with pytest.raises(meta_limits.LimitExceeded) as e:
+            meta_pkginfo.from_archive(
+                archive, meta_limits.ExtractionLimits(max_members=2))
+        assert e.value.limit == 'max_members'
+
+    def test_member_too_large(self, tmpdir, monkeypatch):
+        archive = self._archive(tmpdir, _PKG_INFO % "")
+        monkeypatch.setattr(meta_pkginfo, '_MAX_MEMBER_SIZE', 64)
+        assert meta_pkginfo.from_archive(archive) is None
+
+    def test_requires_dist_to_kwargs(self):
+        assert meta_pkginfo.requires_dist_to_kwargs(
+            ['foo', 'bar; os_name == "nt"', 'baz; extra == "x"',
+             'qux; (os_name == "nt") and extra == "x"'], ['x', 'y']) == (
+            ['foo', 'bar; os_name == "nt"'],
+            {'x': ['baz'], 'x:os_name == "nt"': ['qux'], 'y': []})
+
+    def test_requires_dist_multiple_extras(self):
+        assert meta_pkginfo.requires_dist_to_kwargs(
+            ['pytest; extra == "test" or extra == "dev"',
+             'mock; (extra == "test" or extra == "dev") and '
+             'python_version < "3.8"',
+             'six; extra == "dev" or python_version < "3"'], []) == (
+            ['six; python_version < "3"'],
+            {'test': ['pytest'], 'dev': ['pytest', 'six'],
+             'test:python_version < "3.8"': ['mock'],
+             'dev:python_version < "3.8"': ['mock']})
+
+
+class TestWheel(object):
+    def _wheel(self, tmpdir, purelib="true", metadata=None,
+               compression=zipfile.ZIP_STORED):
+        wheel_name = tmpdir.join("testpkg-1.2.3-py3-none-any.whl").strpath
+        with zipfile.ZipFile(wheel_name, "w", compression) as zf:
+            zf.writestr("testpkg/__init__.py", "")
+            if metadata is None:
+                metadata = (_PKG_INFO % "").replace("2.2", "2.1")
+            zf.writestr("testpkg-1.2.3.dist-info/METADATA", metadata)
+            zf.writestr("testpkg-1.2.3.dist-info/entry_points.txt",
+                        "[console_scripts]\ntestpkgp1 = testpkg:main\n")
+            zf.writestr("testpkg-1.2.3.dist-info/WHEEL",
+                        "Wheel-Version: 1.0\nRoot-Is-Purelib: %s\n" %
+                        purelib)
+        return wheel_name
+
+    def test_is_wheel(self, tmpdir, tararchive):
+        tar_name, tar_files = tararchive
+        assert meta_wheel.is_wheel(self._wheel(tmpdir)) is True
+        assert meta_wheel.is_wheel(tar_name) is False
+
+    def test_from_archive(self, tmpdir):
+        data = meta_utils.from_archive(self._wheel(tmpdir))
+        assert data['engine'] == 'wheel'
+        assert data['data']['fullname'] == 'testpkg-1.2.3'
+        assert data['data']['install_requires'] == ['foo']
+        assert data['data']['extras_require'] == {
+            'extra1': ['ex11'],
+            ':python_version < "3.8"': ['bar>=1.0'],
+        }
+        assert data['data']['entry_points'] == {
+            'console_scripts': ['testpkgp1 = testpkg:main']}
+        assert data['data']['has_ext_modules'] is False
+
+    def test_from_bytes(self, tmpdir):
+        with open(self._wheel(tmpdir), "rb") as f:
+            content = f.read()
+        assert meta_wheel.is_wheel(io.BytesIO(content)) is True
+        data = meta_utils.from_bytes(memoryview(content))
+        assert data['engine'] == 'wheel'
+        assert data['data']['fullname'] == 'testpkg-1.2.3'
+
+    def test_multiple_extras(self, tmpdir):
+        metadata = (_PKG_INFO % "").replace(
+            'Requires-Dist: ex11; extra == "extra1"',
+            'Requires-Dist: ex11; extra == "extra1" or extra == "dev"')
+        wheel_name = self._wheel(tmpdir, metadata=metadata)
+        data = meta_utils.from_archive(wheel_name)
+        assert data['data']['extras_require']['extra1'] == ['ex11']
+        assert data['data']['extras_require']['dev'] == ['ex11']
+
+    def test_invalid_marker(self, tmpdir):
+        metadata = (_PKG_INFO % "").replace(
+            'extra == "extra1"', 'extra == "extra1" and or')
+        with pytest.raises(Exception) as e_info:
+            meta_utils.from_archive(self._wheel(tmpdir, metadata=metadata))
+        assert e_info.type is Exception
+        assert "Can not read the metadata" in str(e_info.value)
+
+    def test_bomb(self, tmpdir):
+        metadata = (_PKG_INFO % "") + " " * 8 * 1024 ** 2
+        wheel_name = self._wheel(tmpdir, metadata=metadata,
+                                 compression=zipfile.ZIP_DEFLATED)
+        data = meta_utils.from_archive(
+            wheel_name, extraction_limits=meta_limits.ExtractionLimits(
+                max_ratio=100))
+        assert data['error']['type'] == 'LimitExceeded'
+        assert data['error']['limit'] == 'max_ratio'
+
+    def test_max_members(self, tmpdir):
+        data = meta_utils.from_archive(
+            self._wheel(tmpdir),
+            extraction_limits=meta_limits.ExtractionLimits(max_members=2))
+        assert data['error']['limit'] == 'max_members'
+
+    def test_member_too_large(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(meta_pkginfo, '_MAX_MEMBER_SIZE', 64)
+        data = meta_utils.from_archive(self._wheel(tmpdir))
+        assert data['error']['limit'] == 'max_member_size'
+
+    def test_from_wheel_platlib(self, tmpdir):
+        data = meta_wheel.from_wheel(self._wheel(tmpdir, purelib="false"))
+        assert data['data']['has_ext_modules'] is True
+
+
+class TestWorkerPool(object):
+    def _copy_fixture(self, tmpdir, fixture_name):
+        fixture_dir = os.path.join(fixtures_base_dir, fixture_name)
+        dest_dir = os.path.join(tmpdir.strpath, fixture_name)
+        shutil.copytree(fixture_dir, dest_dir)
+        return dest_dir
+
+    @pytest.mark.parametrize("fixture_name", [
+        "distutils_simple", "setuptools_full",
+        "setuptools_simple_unicode",
+    ])
+    def test_same_as_execute(self, tmpdir, fixture_name):
+        warm_dir = self._copy_fixture(tmpdir.mkdir("warm"), fixture_name)
+        execute_dir = self._copy_fixture(tmpdir.mkdir("execute"),
+                                         fixture_name)
+        with meta_forkserver.WorkerPool() as pool:
+            assert meta_utils._setup_py_run_from_dir(
+                warm_dir, sys.executable, pool) == \
+                meta_utils._setup_py_run_from_dir(execute_dir, sys.executable)
+
+    def test_reuse_and_recycle(self, tmpdir):
+        with meta_forkserver.WorkerPool(max_jobs=2) as pool:
+            pids = []
+            for i in range(3):
+                dest_dir = self._copy_fixture(tmpdir.mkdir(str(i)),
+                                              "setuptools_simple")
+                meta_utils._setup_py_run_from_dir(dest_dir, sys.executable,
+                                                  pool)
+                pids.append(
+                    [w.process.pid for w in pool._idle[sys.executable]])
+        # the worker is stopped after 2 jobs and a new one is started
+        assert len(pids[0]) == 1
+        assert pids[1] == []
+        assert len(pids[2]) == 1
+        assert pids[2] != pids[0]
+
+    def test_failure(self, tmpdir):
+        tmpdir.join("setup.py").write("import sys\nsys.exit(3)\n")
+        with meta_forkserver.WorkerPool() as pool:
+            with pytest.raises(subprocess.CalledProcessError) as e:
+                pool.check_output(sys.executable, tmpdir.strpath, [])
+        assert e.value.returncode == 3
+
+
+class TestAio(object):
+    def test_async_from_archive(self, tararchive):
+        tar_name, tar_files = tararchive
+        data = asyncio.run(meta_aio.async_from_archive(tar_name))
+        assert data == meta_utils.from_archive(tar_name)
+
+    def test_gather_from_archives(self, tararchive, tmpdir):
+        tar_name, tar_files = tararchive
+        missing = tmpdir.join("missing.tar.gz").strpath
+        results = asyncio.run(meta_aio.gather_from_archives(
+            [tar_name, missing, tar_name], limit=2, return_exceptions=True))
+        assert results[0]["data"]["install_requires"] == ['bar', 'foo']
+        assert isinstance(results[1], Exception)
+        assert results[2] == results[0]
+
+    def test_cancel(self, tmpdir):
+        started = tmpdir.join("started")
+        archive = _make_tar(tmpdir.join("slow-1.0.tar.gz").strpath, {
+            "slow-1.0/setup.py":
+            "import os, time\n"
+            "with open(%r, 'w') as f:\n"
+            "    f.write('%%d %%s' %% (os.getpid(), os.getcwd()))\n"
+            "time.sleep(60)\n" % started.strpath,
+        })
+
+        async def _run():
+            task = asyncio.ensure_future(
+                meta_aio.async_from_archive(archive))
+            while not started.check() or not started.read():
+                await asyncio.sleep(0.05)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        start = time.time()
+        asyncio.run(_run())
+        assert time.time() - start < 30
+        pid, cwd = started.read().split(" ", 1)
+        # the child was killed and the extracted files are removed
+        with pytest.raises(OSError):
+            os.kill(int(pid), 0)
+        assert not os.path.exists(cwd)
+
+
+class TestLimits(object):
+    def _archive(self, tmpdir, setup_py):
+        return _make_tar(tmpdir.join("limited-1.0.tar.gz").strpath, {
+            "limited-1.0/setup.py": setup_py,
+        })
+
+    def _sleeping_archive(self, tmpdir):
+        # setup.py starts a child which must be killed, too
+        pid_file = tmpdir.join("pid")
+        archive = self._archive(tmpdir, (
+            "import subprocess, sys, time\n"
+            "p = subprocess.Popen([sys.executable, '-c',\n"
+            "                      'import time; time.sleep(60)'])\n"
+            "with open(%r, 'w') as f:\n"
+            "    f.write(str(p.pid))\n"
+            "time.sleep(60)\n") % pid_file.strpath)
+        return archive, pid_file
+
+    def _assert_killed(self, pid_file):
+        pid = int(pid_file.read())
+        for i in range(100):
+            try:
+                os.kill(pid, 0)
+            except OSError:
+                return
+            time.sleep(0.05)
+        pytest.fail("process %d is still running" % pid)
+
+    @pytest.mark.skipif(not meta_limits._HAS_WAITID,
+                        reason="needs os.waitid()")
+    def test_wait_exited_keeps_pid(self):
+        process = subprocess.Popen([sys.executable, '-c', 'pass'],
+                                   start_new_session=True)
+        assert meta_limits.wait_exited(process.pid, 60) is True
+        # not reaped yet, so the pid (and the group id) is still reserved
+        assert os.waitid(os.P_PID, process.pid,
+                         os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None
+        meta_limits.kill_group(process.pid)
+        assert meta_limits.reap(process.pid) == 0
+        process.returncode = 0
+
+    @pytest.mark.parametrize("limits", [
+        None, meta_limits.Limits(timeout=60)])
+    def test_stdin_devnull(self, tmpdir, limits):
+        # input() must fail right away instead of waiting for the terminal
+        tmpdir.join("setup.py").write(
+            "import os, sys\n"
+            "devnull = os.path.samestat(os.fstat(0), os.stat(os.devnull))\n"
+            "sys.stdout.write(str(devnull))\n")
+        assert meta_utils._check_output(tmpdir.strpath, [], sys.executable,
+                                        None, limits) == b'True'
+
+    @pytest.mark.parametrize("warm", [False, True])
+    def test_timeout(self, tmpdir, warm):
+        archive, pid_file = self._sleeping_archive(tmpdir)
+        cache = meta_cache.ResultCache(tmpdir.join("cache").strpath)
+        start = time.time()
+        with meta_forkserver.WorkerPool() as pool:
+            data = meta_utils.from_archive(
+                archive, cache=cache, worker_pool=pool if warm else None,
+                limits=meta_limits.Limits(timeout=2))
+        assert time.time() - start < 30
+        assert data['error']['type'] == 'LimitExceeded'
+        assert data['error']['limit'] == 'timeout'
+        assert 'data' not in data
+        self._assert_killed(pid_file)
+        # errors are not cached
+        assert list(cache._entries()) == []
+
+    def test_timeout_aio(self, tmpdir):
+        archive, pid_file = self._sleeping_archive(tmpdir)
+        data = asyncio.run(meta_aio.async_from_archive(
+            archive, limits=meta_limits.Limits(timeout=2)))
+        assert data['error']['limit'] == 'timeout'
+        self._assert_killed(pid_file)
+
+    @pytest.mark.parametrize("warm", [False, True])
+    def test_max_output(self, tmpdir, warm):
+        archive = self._archive(tmpdir, (
+            "import sys\n"
+            "for i in range(10000):\n"
+            "    sys.stdout.write('x' * 1000)\n"
+            "from setuptools import setup\n"
+            "setup(name='limited')\n"))
+        with meta_forkserver.WorkerPool() as pool:
+            data = meta_utils.from_archive(
+                archive, worker_pool=pool if warm else None,
+                limits=meta_limits.Limits(max_output=100000))
+        assert data['error']['limit'] == 'max_output'
+
+    def test_cpu_time(self, tmpdir):
+        archive = self._archive(tmpdir, "while True:\n    pass\n")
+        data = meta_utils.from_archive(
+            archive, limits=meta_limits.Limits(cpu_time=1, timeout=30))
+        assert data['error']['limit'] == 'cpu_time'
+
+    def test_memory(self, tmpdir):
+        archive = self._archive(tmpdir, "x = bytearray(4 * 1024 ** 3)\n")
+        data = meta_utils.from_archive(
+            archive, limits=meta_limits.Limits(memory=1024 ** 3))
+        assert data['error']['limit'] == 'memory'
+
+    def test_within_limits(self, tararchive):
+        tar_name, tar_files = tararchive
+        limits = meta_limits.Limits(timeout=60, cpu_time=60,
+                                    memory=2 * 1024 ** 3,
+                                    max_output=1024 ** 2)
+        assert meta_utils.from_archive(tar_name, limits=limits) == \
+            meta_utils.from_archive(tar_name)
+
+
+class TestSparse(object):
+    _MEMBERS = {
+        "testpkg-1.0/setup.py":
+        "from setuptools import setup\nsetup(name='testpkg')\n",
+        "testpkg-1.0/README.rst": "r" * 500000,
+        "testpkg-1.0/data/big.csv": "x" * 500000,
+        "testpkg-1.0/data/small.csv": "x" * 10,
+        "testpkg-1.0/lib/native.so": "so",
+        "testpkg-1.0/tests/fixture.csv": "fixture",
+    }
+
+    @pytest.mark.parametrize("name,size,expected", [
+        ("pkg/setup.py", 10 ** 9, True),
+        ("./pkg/README", 10 ** 9, True),
+        ("pkg/data/big.csv", 10 ** 9, False),
+        ("pkg/data/small.csv", 10, True),
+        ("pkg/lib/native.so", 10, False),
+        ("pkg/tests/fixture.csv", 10, False),
+        ("pkg/.hidden", 10, True),
+    ])
+    def test_is_needed(self, name, size, expected):
+        sparse = meta_sparse.SparseExtraction(threshold=1024,
+                                              deny=["*/tests/*"])
+        assert sparse.is_needed(name, size) is expected
+
+    def _check(self, dest_dir):
+        root = os.path.join(dest_dir, "testpkg-1.0")
+        for name, content in self._MEMBERS.items():
+            path = os.path.join(dest_dir, name)
+            with open(path) as f:
+                extracted = f.read()
+            if name.endswith(("big.csv", ".so", "fixture.csv")):
+                assert extracted == ""
+            else:
+                assert extracted == content
+        assert os.path.isdir(os.path.join(root, "data"))
+
+    def test_extract_tar(self, tmpdir):
+        archive = _make_tar(tmpdir.join("testpkg-1.0.tar.gz").strpath,
+                            self._MEMBERS)
+        dest_dir = tmpdir.mkdir("dest").strpath
+        meta_utils._extract_archive(
+            archive, dest_dir,
+            meta_sparse.SparseExtraction(threshold=1024, deny=["*/tests/*"]))
+        self._check(dest_dir)
+
+    def test_extract_zip(self, tmpdir):
+        archive = tmpdir.join("testpkg-1.0.zip").strpath
+        with zipfile.ZipFile(archive, "w") as zf:
+            for name, content in self._MEMBERS.items():
+                zf.writestr(name, content)
+        dest_dir = tmpdir.mkdir("dest").strpath
+        meta_utils._extract_archive(
+            archive, dest_dir,
+            meta_sparse.SparseExtraction(threshold=1024, deny=["*/tests/*"]))
+        self._check(dest_dir)
+
+    def test_from_archive_retry(self, tmpdir):
+        # setup.py needs a file which is not extracted in sparse mode
+        archive = _make_tar(tmpdir.join("testpkg-1.0.tar.gz").strpath, {
+            "testpkg-1.0/setup.py":
+            "from setuptools import setup\n"
+            "with open('version.dat') as f:\n"
+            "    version = f.read().strip()\n"
+            "assert version\n"
+            "setup(name='testpkg', version=version)\n",
+            "testpkg-1.0/version.dat": "1.2.3\n",
+        })
+        data = meta_utils.from_archive(
+            archive, sparse=meta_sparse.SparseExtraction())
+        assert data['data']['version'] == '1.2.3'
+
+
+class TestArchive(object):
+    _SETUP_PY = ("from setuptools import setup\n"
+                 "setup(name='testpkg', version='1.0')\n")
+
+    def _tar(self, filename, mode):
+        content = self._SETUP_PY.encode('utf-8')
+        with tarfile.open(filename, mode) as tar:
+            info = tarfile.TarInfo("testpkg-1.0/setup.py")
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+            # a hardlink can't be extracted from a stream
+            link = tarfile.TarInfo("testpkg-1.0/setup_link.py")
+            link.type = tarfile.LNKTYPE
+            link.linkname = "testpkg-1.0/setup.py"
+            tar.addfile(link)
+        return filename
+
+    @pytest.mark.parametrize("name,mode,fmt", [
+        ("testpkg-1.0.tar", "w", "tar"),
+        ("testpkg-1.0.tgz", "w:gz", "gz"),
+        ("testpkg-1.0.tbz", "w:bz2", "bz2"),
+        ("testpkg-1.0.tar.xz", "w:xz", "xz"),
+        # the format is detected from the content, not the name
+        ("testpkg-1.0.zip", "w:gz", "gz"),
+    ])
+    def test_formats(self, tmpdir, name, mode, fmt):
+        archive = self._tar(tmpdir.join(name).strpath, mode)
+        with open(archive, "rb") as f:
+            assert meta_archive.detect_format(f.read(512)) == fmt
+        data = meta_utils.from_archive(archive)
+        assert data['data']['name'] == 'testpkg'
+        dest_dir = tmpdir.mkdir("dest").strpath
+        meta_utils._extract_archive(archive, dest_dir)
+        with open(os.path.join(dest_dir, "testpkg-1.0",
+                               "setup_link.py")) as f:
+            assert f.read() == self._SETUP_PY
+
+    def test_zip(self, ziparchive):
+        zip_name, zip_files = ziparchive
+        with open(zip_name, "rb") as f:
+            assert meta_archive.detect_format(f.read(512)) == "zip"
+
+    def test_zst(self, tmpdir):
+        zstandard = pytest.importorskip("zstandard")
+        tar_name = self._tar(tmpdir.join("testpkg-1.0.tar").strpath, "w")
+        archive = tmpdir.join("testpkg-1.0.tar.zst").strpath
+        with open(tar_name, "rb") as f:
+            with open(archive, "wb") as out:
+                out.write(zstandard.ZstdCompressor().compress(f.read()))
+        data = meta_utils.from_archive(archive)
+        assert data['data']['name'] == 'testpkg'
+
+    def test_unknown(self, tmpdir):
+        archive = tmpdir.join("testpkg-1.0.tar.gz")
+        archive.write("not an archive")
+        with pytest.raises(Exception) as e:
+            meta_utils.from_archive(archive.strpath)
+        assert "Not a tar or zip file" in str(e.value)
+
+    def test_is_archive_name(self):
+        assert meta_archive.is_archive_name("foo-1.0.tar.zst")
+        assert meta_archive.is_archive_name("foo-1.0.TGZ")
+        assert not meta_archive.is_archive_name("foo-1.0.txt")
+
+
+class TestExtractionLimits(object):
+    def test_check(self):
+        limits = meta_limits.ExtractionLimits(max_bytes=10 * 1024 ** 2,
+                                              max_members=3, max_ratio=10)
+        limits.check(3, 1024, 1)
+        for args, limit in [((4, 0, 1), 'max_members'),
+                            ((1, 11 * 1024 ** 2, 10 * 1024 ** 2),
+                             'max_bytes'),
+                            ((1, 2 * 1024 ** 2, 1024), 'max_ratio')]:
+            with pytest.raises(meta_limits.LimitExceeded) as e:
+                limits.check(*args)
+            assert e.value.limit == limit
+
+    def test_bomb_tar(self, tmpdir):
+        archive = tmpdir.join("bomb-1.0.tar.gz").strpath
+        with tarfile.open(archive, "w:gz") as tar:
+            for i in range(2):
+                info = tarfile.TarInfo("bomb-1.0/zeros%d" % i)
+                info.size = 8 * 1024 ** 2
+                tar.addfile(info, io.BytesIO(b"\0" * info.size))
+        dest_dir = tmpdir.mkdir("dest").strpath
+        with pytest.raises(meta_limits.LimitExceeded) as e:
+            meta_utils._extract_archive(
+                archive, dest_dir, extraction_limits=meta_limits.
+                ExtractionLimits(max_bytes=12 * 1024 ** 2, max_ratio=None))
+        assert e.value.limit == 'max_bytes'
+        # stopped before the second member was extracted
+        assert os.listdir(os.path.join(dest_dir, "bomb-1.0")) == ["zeros0"]
+        data = meta_utils.from_archive(
+            archive, extraction_limits=meta_limits.ExtractionLimits(
+                max_ratio=100))
+        assert data['error']['limit'] == 'max_ratio'
+
+    def test_bomb_zip(self, tmpdir):
+        archive = tmpdir.join("bomb-1.0.zip").strpath
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("bomb-1.0/zeros", b"\0" * 8 * 1024 ** 2)
+        data = meta_utils.from_archive(archive)
+        assert data['error'] == {
+            'type': 'LimitExceeded', 'limit': 'max_ratio',
+            'message': 'the archive has a compression ratio of more than '
+                       '1000'}
+        data = meta_utils.from_archive(
+            archive, extraction_limits=meta_limits.ExtractionLimits(
+                max_bytes=1024 ** 2, max_ratio=None))
+        assert data['error']['limit'] == 'max_bytes'
+
+    @pytest.mark.parametrize("static", [False, True])
+    def test_max_members(self, tmpdir, static):
+        archive = _make_tar(tmpdir.join("many-1.0.tar.gz").strpath, dict(
+            ("many-1.0/f%d.txt" % i, "") for i in range(10)))
+        extraction_limits = meta_limits.ExtractionLimits(max_members=5)
+        data = asyncio.run(meta_aio.async_from_archive(
+            archive, static=static, extraction_limits=extraction_limits))
+        assert data['error']['limit'] == 'max_members'
+        data = meta_utils.from_archive(
+            archive, static=static, extraction_limits=extraction_limits)
+        assert data['error']['limit'] == 'max_members'
+        data = meta_utils.from_archive_multi(
+            archive, [sys.executable], static=static,
+            extraction_limits=extraction_limits)
+        assert data[sys.executable]['error']['limit'] == 'max_members'
+
+    def test_unsafe_tar(self, tmpdir):
+        archive = tmpdir.join("unsafe-1.0.tar.gz").strpath
+        with tarfile.open(archive, "w:gz") as tar:
+            info = tarfile.TarInfo("../evil.py")
+            tar.addfile(info, io.BytesIO(b""))
+        data = meta_utils.from_archive(archive)
+        assert data['error']['type'] == 'UnsafeArchive'
+        assert not os.path.exists(tmpdir.join("evil.py").strpath)
+
+    def test_unsafe_zip(self, tmpdir):
+        archive = tmpdir.join("unsafe-1.0.zip").strpath
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("unsafe-1.0/../../evil.py", "")
+        dest_dir = tmpdir.mkdir("dest").strpath
+        with pytest.raises(meta_limits.UnsafeArchive):
+            meta_utils._extract_archive(archive, dest_dir)
+        assert os.listdir(dest_dir) == []
+
+
+class _Pipe(object):
+    """a file object which can only be read once"""
+    def __init__(self, content):
+        self._f = io.BytesIO(content)
+
+    def read(self, size=-1):
+        return self._f.read(size)
+
+    def seekable(self):
+        return False
+
+
+class TestFileobj(object):
+    def test_from_bytes(self, tararchive):
+        tar_name, tar_files = tararchive
+        with open(tar_name, "rb") as f:
+            content = f.read()
+        expected = meta_utils.from_archive(tar_name)
+        assert meta_utils.from_bytes(content) == expected
+        assert meta_utils.from_fileobj(_Pipe(content)) == expected
+
+    def test_from_fileobj_zip(self, tmpdir):
+        archive = tmpdir.join("testpkg-1.0.zip").strpath
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("testpkg-1.0/setup.py",
+                        "from setuptools import setup\n"
+                        "setup(name='testpkg', version='1.0')\n")
+        with open(archive, "rb") as f:
+            data = meta_utils.from_fileobj(f, static=True)
+        assert data['data']['version'] == '1.0'
+
+    def test_cache(self, tmpdir, tararchive):
+        tar_name, tar_files = tararchive
+        cache = meta_cache.ResultCache(tmpdir.join("cache").strpath)
+        with open(tar_name, "rb") as f:
+            content = f.read()
+        data = meta_utils.from_bytes(content, cache=cache)
+        assert cache.get(cache.key(io.BytesIO(content), sys.executable,
+                                   {'static': False})) == data
+        # the same content as a file has the same key
+        assert meta_utils.from_archive(tar_name, cache=cache) == data
+
+    def test_not_an_archive(self):
+        with pytest.raises(Exception) as e:
+            meta_utils.from_bytes(b"not an archive")
+        assert "'<file object>'" in str(e.value)
+
+    def test_stdin(self, tararchive):
+        tar_name, tar_files = tararchive
+        with open(tar_name, "rb") as f:
+            output = subprocess.check_output(
+                [sys.executable, "-m", "metaextract.cmds", "-"], stdin=f)
+        data = json.loads(output.decode("utf-8"))
+        assert data['data']['install_requires'] == ['bar', 'foo']
+
+
+class TestWorkdir(object):
+    _SETUP_PY = ("import os\n"
+                 "from setuptools import setup\n"
+                 "setup(name='testpkg', description=os.getcwd())\n")
+
+    def _archive(self, tmpdir):
+        return _make_tar(tmpdir.join("testpkg-1.0.tar.gz").strpath,
+                         {"testpkg-1.0/setup.py": self._SETUP_PY})
+
+    def test_workdir(self, tmpdir):
+        workdir = tmpdir.join("scratch").strpath
+        data = meta_utils.from_archive(self._archive(tmpdir),
+                                       workdir=workdir)
+        assert data['data']['description'].startswith(workdir + os.sep)
+        assert os.listdir(workdir) == []
+
+    def test_env(self, tmpdir, monkeypatch):
+        workdir = tmpdir.join("scratch").strpath
+        monkeypatch.setenv(meta_workdir.ENV_WORKDIR, workdir)
+        data = asyncio.run(meta_aio.async_from_archive(
+            self._archive(tmpdir), background_cleanup=True))
+        assert data['data']['description'].startswith(workdir + os.sep)
+        meta_workdir.wait_for_cleanup()
+        assert os.listdir(workdir) == []
+
+    def test_background_cleanup(self, tmpdir):
+        workdir = tmpdir.join("scratch").strpath
+        archive = self._archive(tmpdir)
+        for i in range(3):
+            meta_utils.from_archive(archive, workdir=workdir,
+                                    background_cleanup=True)
+        meta_workdir.wait_for_cleanup()
+        assert os.listdir(workdir) == []
+
+    def test_cmd(self, tmpdir):
+        workdir = tmpdir.join("scratch").strpath
+        output = subprocess.check_output(
+            [sys.executable, "-m", "metaextract.cmds", "--workdir", workdir,
+             "--background-cleanup", self._archive(tmpdir)])
+        data = json.loads(output.decode("utf-8"))
+        assert data['data']['description'].startswith(workdir + os.sep)
+        # the queued removals are done before the process exits
+        assert os.listdir(workdir) == []
+
+
+class TestIndex(object):
+    def _sdist(self, mirror_dir, name, version, requires):
+        fullname = "%s-%s" % (name, version)
+        project_dir = os.path.join(mirror_dir, name)
+        if not os.path.isdir(project_dir):
+            os.makedirs(project_dir)
+        return _make_tar(os.path.join(project_dir, fullname + ".tar.gz"), {
+            fullname + "/setup.py":
+            "from setuptools import setup\n"
+            "setup(name=%r, version=%r, install_requires=%r,\n"
+            "      extras_require={'test': ['pytest']})\n" % (
+                name, version, requires),
+        })
+
+    def test_normalize_name(self):
+        assert meta_index.normalize_name("Foo_Bar.baz") == "foo-bar-baz"
+
+    def test_update(self, tmpdir):
+        mirror_dir = tmpdir.mkdir("mirror").strpath
+        self._sdist(mirror_dir, "foo", "1.0", ["Bar_Baz>=1.0"])
+        bar = self._sdist(mirror_dir, "bar", "2.0", ["requests"])
+        with open(os.path.join(mirror_dir, "index.html"), "w") as f:
+            f.write("not an archive")
+        db = tmpdir.join("index.sqlite").strpath
+        with meta_index.MirrorIndex(db) as index:
+            assert index.update(mirror_dir, jobs=2) == {
+                'added': 2, 'updated': 0, 'unchanged': 0, 'removed': 0,
+                'failed': 0}
+            assert index.requires("bar-baz") == [{
+                'path': 'foo/foo-1.0.tar.gz', 'name': 'foo',
+                'version': '1.0', 'requirement': 'Bar_Baz>=1.0',
+                'extra': None}]
+            assert [r['path'] for r in index.requires("pytest")] == [
+                'bar/bar-2.0.tar.gz', 'foo/foo-1.0.tar.gz']
+        # a touched archive is hashed, but not processed again
+        os.utime(bar, (1, 1))
+        self._sdist(mirror_dir, "foo", "1.0", ["other"])
+        with meta_index.MirrorIndex(db) as index:
+            assert index.update(mirror_dir) == {
+                'added': 0, 'updated': 1, 'unchanged': 1, 'removed': 0,
+                'failed': 0}
+            assert index.requires("bar-baz") == []
+            assert index.get('foo/foo-1.0.tar.gz')['data'][
+                'install_requires'] == ['other']
+        os.remove(bar)
+        with meta_index.MirrorIndex(db) as index:
+            assert index.update(mirror_dir) == {
+                'added': 0, 'updated': 0, 'unchanged': 1, 'removed': 1,
+                'failed': 0}
+            assert index.get('bar/bar-2.0.tar.gz') is None
+            assert index.requires("requests") == []
+
+    def test_update_hashes_once(self, tmpdir, monkeypatch):
+        mirror_dir = tmpdir.mkdir("mirror").strpath
+        foo = self._sdist(mirror_dir, "foo", "1.0", ["bar"])
+        db = tmpdir.join("index.sqlite").strpath
+        with meta_index.MirrorIndex(db) as index:
+            index.update(mirror_dir, jobs=1)
+        self._sdist(mirror_dir, "foo", "1.0", ["baz"])
+        os.utime(foo, (1, 1))
+        hashed = []
+        file_sha256 = meta_cache._file_sha256
+
+        def _counting_file_sha256(path):
+            hashed.append(path)
+            return file_sha256(path)
+
+        # the archive is hashed before it is processed
+        hashed_before = []
+        iter_from_archives = meta_batch.iter_from_archives
+
+        def _recording_iter_from_archives(*args, **kwargs):
+            hashed_before.extend(hashed)
+            return iter_from_archives(*args, **kwargs)
+
+        monkeypatch.setattr(meta_cache, "_file_sha256",
+                            _counting_file_sha256)
+        monkeypatch.setattr(meta_batch, "iter_from_archives",
+                            _recording_iter_from_archives)
+        with meta_index.MirrorIndex(db) as index:
+            assert index.update(mirror_dir, jobs=1)['updated'] == 1
+            stored = index._db.execute(
+                "SELECT sha256 FROM archives").fetchone()[0]
+        assert hashed_before == hashed == [foo]
+        assert stored == file_sha256(foo)
+
+    def test_cmd(self, tmpdir):
+        mirror_dir = tmpdir.mkdir("mirror").strpath
+        self._sdist(mirror_dir, "foo", "1.0", ["bar"])
+        db = tmpdir.join("index.sqlite").strpath
+        output = subprocess.check_output(
+            [sys.executable, "-m", "metaextract.cmds", "index", "--db", db,
+             "--requires", "Bar", mirror_dir])
+        rows = [json.loads(line) for line in output.decode().splitlines()]
+        assert [r['path'] for r in rows] == ['foo/foo-1.0.tar.gz']
+
+
+class TestCapture(object):
+    def _copy_fixture(self, tmpdir, fixture_name):
+        fixture_dir = os.path.join(fixtures_base_dir, fixture_name)
+        dest_dir = os.path.join(tmpdir.strpath, fixture_name)
+        shutil.copytree(fixture_dir, dest_dir)
+        return dest_dir
+
+    def _run(self, tmpdir, fixture_name, **kwargs):
+        return meta_utils._setup_py_run_from_dir(
+            self._copy_fixture(tmpdir.mkdir("capture"), fixture_name),
+            sys.executable, capture=True, **kwargs)
+
+    def test_command_options(self):
+        assert meta_capture._command_options(
+            ['-q', '--command-packages', 'metaextract', 'metaextract',
+             '--fields', 'name,version', '--output-fd', '5']) == {
+            'output': None, 'output_fd': '5',
+            'fields': set(['name', 'version'])}
+        assert meta_capture._command_options(
+            ['--command-packages', 'metaextract', 'build']) is None
+
+    @pytest.mark.parametrize("fixture_name", [
+        "distutils_simple", "distutils_with_extension", "setuptools_full",
+        "setuptools_simple_unicode",
+    ])
+    def test_same_as_execute(self, tmpdir, fixture_name):
+        data = self._run(tmpdir, fixture_name)
+        execute_dir = self._copy_fixture(tmpdir.mkdir("execute"),
+                                         fixture_name)
+        expected = meta_utils._setup_py_run_from_dir(execute_dir,
+                                                     sys.executable)
+        assert data['engine'] == 'capture'
+        assert data['data'] == expected['data']
+
+    @pytest.mark.parametrize("attrs", [
+        {'classifiers': 1},
+        {'keywords': 5},
+        {'extras_require': ['a']},
+        {'extras_require': {1: ['foo']}},
+    ])
+    def test_invalid_values(self, attrs):
+        assert meta_capture._capture(attrs, None) is None
+
+    def test_worker_pool_and_limits(self, tmpdir):
+        with meta_forkserver.WorkerPool() as pool:
+            data = self._run(tmpdir, "setuptools_full", worker_pool=pool)
+        assert data['engine'] == 'capture'
+        data = meta_utils._setup_py_run_from_dir(
+            self._copy_fixture(tmpdir.mkdir("limits"), "setuptools_full"),
+            sys.executable, limits=meta_limits.Limits(cpu_time=60),
+            capture=True)
+        assert data['engine'] == 'capture'
+
+    def test_declarative_config(self, tmpdir):
+        # setup.cfg has the metadata, so the distribution is needed
+        data = self._run(tmpdir, "setupcfg_declarative")
+        assert data['engine'] == 'execute'
+
+    def test_fields(self, tmpdir):
+        tmpdir.join("setup.cfg").write("[metadata]\nname = testpkg\n")
+        tmpdir.join("setup.py").write(
+            "from setuptools import setup\n"
+            "setup(install_requires=['foo'])\n"
+            "open('after_setup', 'w').close()\n")
+        data = meta_utils._setup_py_run_from_dir(
+            tmpdir.strpath, sys.executable, fields=['install_requires'],
+            capture=True)
+        assert data['engine'] == 'capture'
+        assert data['data'] == {'install_requires': ['foo']}
+        # setup.py exits in setup()
+        assert not tmpdir.join("after_setup").exists()
+        # the name is in setup.cfg
+        data = meta_utils._setup_py_run_from_dir(
+            tmpdir.strpath, sys.executable, fields=['name'], capture=True)
+        assert data['engine'] == 'execute'
+        assert data['data'] == {'name': 'testpkg'}
+
+    def test_unknown_keyword(self, tmpdir):
+        tmpdir.join("setup.py").write(
+            "from setuptools import setup\n"
+            "setup(name='testpkg', unknown_plugin_option=True)\n")
+        data = meta_utils._setup_py_run_from_dir(
+            tmpdir.strpath, sys.executable, capture=True)
+        assert data['engine'] == 'execute'
+
+    def test_from_archive(self, tararchive):
+        tar_name, tar_files = tararchive
+        data = asyncio.run(meta_aio.async_from_archive(tar_name,
+                                                       capture=True))
+        assert data['engine'] == 'capture'
+        assert data == meta_utils.from_archive(tar_name, capture=True)
+
+
+class TestStubs(object):
+    _SETUP_PY = (
+        "import numpy\n"
+        "from Cython.Build import cythonize\n"
+        "from pybind11.setup_helpers import Pybind11Extension\n"
+        "from setuptools import setup, Extension\n"
+        "setup(name='testpkg', version='1.0',\n"
+        "      install_requires=['numpy>=%s' % numpy.__version__[:1]],\n"
+        "      ext_modules=cythonize(['testpkg/*.pyx']) + [\n"
+        "          Extension('testpkg.c', ['testpkg/c.c'],\n"
+        "                    include_dirs=[numpy.get_include()]),\n"
+        "          Pybind11Extension('testpkg.p', ['testpkg/p.cpp'],\n"
+        "                            cxx_std=11)])\n")
+
+    def _setup_dir(self, tmpdir):
+        tmpdir.join("setup.py").write(self._SETUP_PY)
+        tmpdir.mkdir("testpkg").join("fast.pyx").write("")
+        return tmpdir.strpath
+
+    def test_install(self):
+        finder = meta_stubs.StubFinder(['metaextract_stub_test'])
+        sys.meta_path.insert(0, finder)
+        try:
+            import metaextract_stub_test.sub.module as stub
+            assert not stub.anything.called()
+            assert list(stub.anything) == []
+            with pytest.raises(AttributeError):
+                stub.__missing__
+        finally:
+            sys.meta_path.remove(finder)
+            for name in list(sys.modules):
+                if name.startswith('metaextract_stub_test'):
+                    del sys.modules[name]
+
+    def test_cythonize(self, tmpdir):
+        tmpdir.mkdir("pkg").join("a.pyx").write("")
+        with tmpdir.as_cwd():
+            extensions = meta_stubs._cythonize(
+                ['pkg/*.pyx', setuptools.Extension('b', ['b.c'])])
+        assert [e.name for e in extensions] == ['pkg.a', 'b']
+        assert extensions[0].sources == ['pkg/a.pyx']
+
+    def test_missing_package(self, tmpdir):
+        tmpdir.join("setup.py").write(
+            "import metaextract_missing_pkg\n"
+            "from setuptools import setup\n"
+            "setup(name='testpkg', version='1.0')\n")
+        with pytest.raises(subprocess.CalledProcessError):
+            meta_utils._setup_py_run_from_dir(tmpdir.strpath,
+                                              sys.executable)
+        data = meta_utils._setup_py_run_from_dir(
+            tmpdir.strpath, sys.executable,
+            stub_imports=['metaextract_missing_pkg'])
+        assert data['data']['name'] == 'testpkg'
+
+    @pytest.mark.parametrize("kwargs", [
+        {},
+        {'capture': True},
+        {'limits': meta_limits.Limits(cpu_time=60)},
+    ])
+    def test_setup_py(self, tmpdir, kwargs):
+        data = meta_utils._setup_py_run_from_dir(
+            self._setup_dir(tmpdir), sys.executable,
+            stub_imports=meta_stubs.DEFAULT_STUBS, **kwargs)
+        assert data['data']['install_requires'] == ['numpy>=1']
+        assert data['data']['has_ext_modules'] is True
+
+    def test_worker_pool(self, tmpdir):
+        with meta_forkserver.WorkerPool() as pool:
+            data = meta_utils._setup_py_run_from_dir(
+                self._setup_dir(tmpdir), sys.executable, worker_pool=pool,
+                stub_imports=meta_stubs.DEFAULT_STUBS)
+        assert data['data']['name'] == 'testpkg'
+        # the stubs were only installed in the forked child
+        assert not any(isinstance(f, meta_stubs.StubFinder)
+                       for f in sys.meta_path)
+
+
+class TestMultiInterpreter(object):
+    _SETUP_PY = (
+        "import os\n"
+        "from setuptools import setup\n"
+        "with open('marker', 'a') as f:\n"
+        "    f.write('x')\n"
+        "with open('marker') as f:\n"
+        "    runs = len(f.read())\n"
+        "setup(name='testpkg', version='1.0',\n"
+        "      install_requires=['runs%d' % runs,\n"
+        "                        os.environ.get('TEST_PY', 'default')])\n")
+
+    def _python(self, tmpdir, name, exit_code=None):
+        """a wrapper script for the interpreter which sets TEST_PY"""
+        script = tmpdir.join(name)
+        if exit_code is not None:
+            script.write("#!/bin/sh\nexit %d\n" % exit_code)
+        else:
+            script.write("#!/bin/sh\nTEST_PY=%s exec %s \"$@\"\n" % (
+                name, sys.executable))
+        script.chmod(0o755)
+        return script.strpath
+
+    def _archive(self, tmpdir):
+        return _make_tar(tmpdir.join("testpkg-1.0.tar.gz").strpath, {
+            "testpkg-1.0/setup.py": self._SETUP_PY,
+            "testpkg-1.0/data.bin": "x" * meta_utils._VIEW_LINK_MIN_SIZE,
+        })
+
+    def test_from_archive_multi(self, tmpdir):
+        pys = [self._python(tmpdir, "py1"), self._python(tmpdir, "py2")]
+        data = meta_utils.from_archive_multi(self._archive(tmpdir), pys)
+        assert list(data) == pys
+        # every interpreter ran in its own view of the tree
+        assert data[pys[0]]['data']['install_requires'] == ['py1', 'runs1']
+        assert data[pys[1]]['data']['install_requires'] == ['py2', 'runs1']
+
+    def test_failed_interpreter(self, tmpdir):
+        pys = [self._python(tmpdir, "py1"),
+               self._python(tmpdir, "broken", exit_code=1)]
+        data = meta_utils.from_archive_multi(self._archive(tmpdir), pys)
+        assert data[pys[0]]['data']['name'] == 'testpkg'
+        assert data[pys[1]]['error']['type'] == 'CalledProcessError'
+
+    def test_cache(self, tmpdir):
+        pys = [self._python(tmpdir, "py1"), self._python(tmpdir, "py2")]
+        archive = self._archive(tmpdir)
+        cache = meta_cache.ResultCache(tmpdir.join("cache").strpath)
+        meta_utils.from_archive(archive, pys[0], cache=cache)
+        data = meta_utils.from_archive_multi(archive, pys, cache=cache)
+        assert data == meta_utils.from_archive_multi(archive, pys,
+                                                     cache=cache)
+        assert data[pys[1]]['data']['install_requires'] == ['py2', 'runs1']
+
+    def test_tree_view(self, tmpdir):
+        root = tmpdir.mkdir("root")
+        root.join("setup.py").write("x" * meta_utils._VIEW_LINK_MIN_SIZE)
+        root.join("data.bin").write("x" * meta_utils._VIEW_LINK_MIN_SIZE)
+        root.join("small.txt").write("x")
+        with meta_utils._tree_view(root.strpath, tmpdir.strpath,
+                                   False) as view:
+            assert os.stat(os.path.join(view, "data.bin")).st_nlink == 2
+            assert os.stat(os.path.join(view, "setup.py")).st_nlink == 1
+            assert os.stat(os.path.join(view, "small.txt")).st_nlink == 1
+        assert not os.path.exists(view)
+
+    def test_cmdline(self, tmpdir):
+        pys = [self._python(tmpdir, "py1"), self._python(tmpdir, "py2")]
+        output = subprocess.check_output(
+            [sys.executable, "-m", "metaextract.cmds", "--python", pys[0],
+             "--python", pys[1], self._archive(tmpdir)])
+        data = json.loads(output.decode('utf-8'))
+        assert sorted(data) == sorted(pys)
+        assert data[pys[1]]['data']['install_requires'] == ['py2', 'runs1']
+
+    def test_batch(self, tmpdir):
+        pys = [self._python(tmpdir, "py1"), self._python(tmpdir, "py2")]
+        archive = self._archive(tmpdir)
+        records = list(meta_batch.iter_from_archives([archive], pys, jobs=1))
+        assert records[0]['archive'] == archive
+        assert sorted(records[0]['interpreters']) == sorted(pys)
+
+
+class TestServer(object):
+    @pytest.fixture()
+    def server(self, tmpdir):
+        socket_path = tmpdir.join("metaextract.sock").strpath
+        cache = meta_cache.ResultCache(tmpdir.join("cache").strpath)
+        server = meta_server.Server(socket_path, jobs=2, max_upload=1024 ** 2,
+                                    read_timeout=1, cache=cache)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        client = meta_server.Client(socket_path)
+        while not client.available():
+            time.sleep(0.01)
+        yield server
+        server.shutdown()
+        thread.join()
+        assert not os.path.exists(socket_path)
+
+    def test_from_archive(self, server, tararchive):
+        tar_name, tar_files = tararchive
+        client = meta_server.Client(server.socket_path)
+        data = client.from_archive(tar_name)
+        assert data['data']['install_requires'] == ['bar', 'foo']
+        # the second request is answered from the cache
+        assert client.from_archive(tar_name) == data
+        assert len(os.listdir(server.kwargs['cache'].directory)) == 1
+        data = client.from_archive(tar_name, fields=['name'])
+        assert data['data'] == {'name': 'testpkg'}
+
+    def test_upload(self, server, tararchive):
+        tar_name, tar_files = tararchive
+        client = meta_server.Client(server.socket_path)
+        with open(tar_name, 'rb') as f:
+            data = client.from_fileobj(f)
+        assert data['data']['install_requires'] == ['bar', 'foo']
+        data = client.from_fileobj(io.BytesIO(b'x' * (1024 ** 2 + 1)))
+        assert data['error']['message'] == \
+            "The upload has more than %d bytes" % 1024 ** 2
+
+    def test_error(self, server, tmpdir):
+        client = meta_server.Client(server.socket_path)
+        data = client.from_archive(tmpdir.join("missing.tar.gz").strpath)
+        assert data['error']['type'] == 'Exception'
+
+    def test_idle_client(self, server, tararchive):
+        tar_name, tar_files = tararchive
+        # both handlers are held by clients which send nothing
+        idle = [socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                for _ in range(2)]
+        for sock in idle:
+            sock.connect(server.socket_path)
+        for sock in idle:
+            sock.settimeout(10)
+            assert sock.recv(1) == b''
+            sock.close()
+        client = meta_server.Client(server.socket_path, timeout=10)
+        assert client.from_archive(tar_name)['data']['name'] == 'testpkg'
+
+    def test_already_running(self, server):
+        with pytest.raises(Exception) as e:
+            meta_server.Server(server.socket_path).serve_forever()
+        assert "already listening" in str(e.value)
+
+    def test_cmdline(self, tmpdir, tararchive):
+        tar_name, tar_files = tararchive
+        socket_path = tmpdir.join("cmd.sock").strpath
+        cmd = [sys.executable, "-m", "metaextract.cmds"]
+        # without a running daemon, the archive is processed locally
+        data = json.loads(subprocess.check_output(
+            cmd + ["--server", socket_path, tar_name]).decode('utf-8'))
+        assert data['data']['name'] == 'testpkg'
+        daemon = subprocess.Popen(
+            cmd + ["serve", "--socket", socket_path, "--cache-dir",
+                   tmpdir.join("cache").strpath, "-j", "1"])
+        try:
+            client = meta_server.Client(socket_path)
+            while not client.available():
+                assert daemon.poll() is None
+                time.sleep(0.05)
+            output = subprocess.check_output(
+                cmd + ["--server", socket_path, "--fields", "name",
+                       tar_name, tar_name])
+            records = [json.loads(line) for line in
+                       output.decode('utf-8').splitlines()]
+            assert [r['data'] for r in records] == [{'name': 'testpkg'}] * 2
+        finally:
+            daemon.terminate()
+            assert daemon.wait() == 0
+        assert not os.path.exists(socket_path)
+
+
+class TestResult(object):
+    _DATA = {
+        'version': meta_result.DATA_VERSION,
+        'engine': 'execute',
+        'data': {
+            'name': 'testpkg',
+            'install_requires': ['foo>=1.0', 'bar'],
+            'extras_require': {'test': ['pytest']},
+            'data_files': [['share/testpkg', ['a.txt', 'b.txt']]],
+            'long_description': u'l\u00f6ng ' * 100,
+            'description': None,
+            'platform': ['any'],
+        },
+    }
+
+    def test_round_trip(self):
+        result = meta_result.Result.from_dict(self._DATA)
+        assert result.to_dict() == self._DATA
+        result = pickle.loads(pickle.dumps(result))
+        assert result.to_dict() == self._DATA
+        error = {'version': 1, 'error': {'type': 'LimitExceeded',
+                                         'message': 'too large',
+                                         'limit': 'max_bytes'}}
+        assert meta_result.Result.from_dict(error).to_dict() == error
+
+    def test_metadata(self):
+        data = meta_result.Result.from_dict(self._DATA).data
+        assert data['install_requires'] == ('foo>=1.0', 'bar')
+        assert data.name == 'testpkg'
+        assert data['platform'] == ('any', )
+        assert data.get('version') is None
+        assert 'version' not in data
+        with pytest.raises(KeyError):
+            data['version']
+        with pytest.raises(AttributeError):
+            data.version
+        assert sorted(data) == sorted(self._DATA['data'])
+        assert len(data) == len(self._DATA['data'])
+
+    def test_compact(self):
+        first = meta_result.Result.from_dict(json.loads(
+            json.dumps(self._DATA))).data
+        second = meta_result.Result.from_dict(json.loads(
+            json.dumps(self._DATA))).data
+        # repeated strings are shared and long texts are compressed
+        assert first['install_requires'][0] is \
+            second['install_requires'][0]
+        assert isinstance(first._long_description, bytes)
+        assert first.long_description == self._DATA['data'][
+            'long_description']
+        assert not hasattr(first, '__dict__')
+
+    @pytest.mark.parametrize("fixture_name", [
+        "setuptools_full", "distutils_with_extension",
+    ])
+    def test_fixture(self, tmpdir, fixture_name):
+        fixture_dir = os.path.join(fixtures_base_dir, fixture_name)
+        dest_dir = os.path.join(tmpdir.strpath, fixture_name)
+        shutil.copytree(fixture_dir, dest_dir)
+        data = meta_utils._setup_py_run_from_dir(dest_dir, sys.executable)
+        data = json.loads(json.dumps(data))
+        assert meta_result.Result.from_dict(data).to_dict() == data
@@ -17,9 +17,15 @@
 
 from __future__ import print_function
 
-from contextlib import contextmanager
+import codecs
+from concurrent import futures
+from contextlib import contextmanager, ExitStack
+import copy
+import functools
+import io
 import json
 import os
+import re
 import shutil
 import subprocess
 import sys
@@ -27,115 +33,729 @@ import tarfile
 import tempfile
 import zipfile
 
+from . import DATA_VERSION
+from . import archive as meta_archive
+from . import limits as meta_limits
+from . import pkginfo as meta_pkginfo
+from . import pyproject as meta_pyproject
+from . import setupcfg as meta_setupcfg
+from . import static as meta_static
+from . import wheel as meta_wheel
+from . import workdir as meta_workdir
+
 
 __all__ = [
-    "from_archive"
+    "from_archive",
+    "from_archive_multi",
+    "from_bytes",
+    "from_fileobj",
 ]
 
 
+# the metadata can be passed over a pipe to setup.py (subprocess pass_fds)
+_HAS_PASS_FDS = os.name == 'posix'
+
+# file objects which can not be read more than once are copied into a
+# spooled tempfile. Up to that size it is kept in memory
+_SPOOL_MAX_SIZE = 64 * 1024 ** 2
+
+# tarfile supports extraction filters (python >= 3.12 and security
+# backports)
+_HAS_TAR_FILTER = hasattr(tarfile, 'data_filter')
+
+# the views of an extracted tree for more interpreters share the files of
+# at least that size (hard links). Smaller files and python sources are
+# copied, so a setup.py which rewrites them can't change the other views
+_VIEW_LINK_MIN_SIZE = 64 * 1024
+
+# the valid names of the fields (the keys of the data)
+_FIELD_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+# an encoding declaration as defined in PEP-0263
+_CODING_RE = re.compile(br'^[ \t\f]*#.*?coding[:=][ \t]*([-\w.]+)')
+
+# the engines which collect metadata without executing code from the
+# archive. The first one which returns data wins
+_STATIC_ENGINES = (
+    meta_pyproject.from_dir,
+    meta_setupcfg.from_dir,
+    meta_static.from_dir,
+)
+
+
 @contextmanager
-def _extract_to_tempdir(archive_filename):
-    """extract the given tarball or zipfile to a tempdir and change
-    the cwd to the new tempdir. Delete the tempdir at the end"""
-    if not os.path.exists(archive_filename):
+def _extract_to_tempdir(archive_filename, sparse=None,
+                        extraction_limits=None, workdir=None,
+                        background_cleanup=False):
+    """extract the given tarball or zipfile to a tempdir in workdir. Delete
+    the tempdir at the end (or queue it for the cleanup thread). The cwd is
+    not changed so this can be used from multiple threads at the same
+    time"""
+    if not meta_archive.is_fileobj(archive_filename) and \
+            not os.path.exists(archive_filename):
         raise Exception("Archive '%s' does not exist" % (archive_filename))
 
-    tempdir = tempfile.mkdtemp(prefix="metaextract_")
-    current_cwd = os.getcwd()
+    tempdir = meta_workdir.make_tempdir(workdir)
     try:
-        if tarfile.is_tarfile(archive_filename):
-            with tarfile.open(archive_filename) as f:
-                f.extractall(tempdir)
-        elif zipfile.is_zipfile(archive_filename):
-            with zipfile.ZipFile(archive_filename) as f:
-                f.extractall(tempdir)
-        else:
-            raise Exception("Can not extract '%s'. "
-                            "Not a tar or zip file" % archive_filename)
-        os.chdir(tempdir)
+        _extract_archive(archive_filename, tempdir, sparse, extraction_limits)
         yield tempdir
     finally:
-        os.chdir(current_cwd)
-        shutil.rmtree(tempdir)
+        meta_workdir.remove_tempdir(tempdir, background_cleanup)
 
 
-@contextmanager
-def _enter_single_subdir(root_dir):
-    """if the given directory has just a single subdir, enter that"""
-    current_cwd = os.getcwd()
+def _extract_archive(archive_filename, dest_dir, sparse=None,
+                     extraction_limits=None):
+    """extract the given tarball or zipfile to dest_dir. With a
+    :class:`metaextract.sparse.SparseExtraction`, only the needed members
+    are extracted in full. The extraction stops with
+    :class:`metaextract.limits.LimitExceeded` as soon as one of the
+    extraction limits (defaults to
+    :class:`metaextract.limits.ExtractionLimits`) is exceeded and with
+    :class:`metaextract.limits.UnsafeArchive` for members which would be
+    written outside of dest_dir"""
+    if extraction_limits is None:
+        extraction_limits = meta_limits.ExtractionLimits()
+    extract = functools.partial(
+        _extract_members, dest_dir=dest_dir, sparse=sparse,
+        extraction_limits=extraction_limits,
+        archive_size=meta_archive.archive_size(archive_filename))
     try:
-        dest_dir = root_dir
-        dir_list = os.listdir(root_dir)
-        if len(dir_list) == 1:
-            first = os.path.join(root_dir, dir_list[0])
-            if os.path.isdir(first):
-                dest_dir = first
+        with meta_archive.open_archive(archive_filename) as archive:
+            extract(archive)
+    except tarfile.StreamError:
+        # hardlinks to earlier members can't be extracted from a stream
+        _clear_dir(dest_dir)
+        with meta_archive.open_source(archive_filename) as f:
+            with tarfile.open(fileobj=f) as archive:
+                extract(archive)
+
+
+def _extract_members(archive, dest_dir, sparse, extraction_limits,
+                     archive_size):
+    if isinstance(archive, zipfile.ZipFile):
+        # the sizes in the central directory can be trusted. zipfile never
+        # inflates more than that. So everything is checked up front
+        infos = archive.infolist()
+        size = 0
+        for count, info in enumerate(infos, 1):
+            _check_member_name(info.filename)
+            size += info.file_size
+            extraction_limits.check(count, size, archive_size)
+        if sparse is None:
+            archive.extractall(dest_dir, members=infos)
         else:
-            dest_dir = root_dir
-        os.chdir(dest_dir)
-        yield dest_dir
-    finally:
-        os.chdir(current_cwd)
+            sparse.extract_zip(archive, dest_dir, infos)
+        return
+    members = _checked_tar_members(archive, extraction_limits, archive_size)
+    if sparse is not None:
+        members = sparse.tar_members(members)
+    if not _HAS_TAR_FILTER:
+        archive.extractall(dest_dir, members=members)
+        return
+    try:
+        archive.extractall(dest_dir, members=members, filter='data')
+    except tarfile.FilterError as e:
+        raise meta_limits.UnsafeArchive(str(e))
+
+
+def _checked_tar_members(tar, extraction_limits, archive_size):
+    """the members of the tar archive. The limits are checked before a
+    member is extracted"""
+    size = 0
+    for count, member in enumerate(tar, 1):
+        size += member.size
+        extraction_limits.check(count, size, archive_size)
+        if not _HAS_TAR_FILTER:
+            _check_tar_member(member)
+        yield member
+
+
+def _check_member_name(name):
+    """raise :class:`metaextract.limits.UnsafeArchive` if the member would
+    be written outside of the extraction directory"""
+    parts = name.replace('\\', '/').split('/')
+    if name.startswith(('/', '\\')) or os.path.splitdrive(name)[0] or \
+            '..' in parts:
+        raise meta_limits.UnsafeArchive(
+            "the member '%s' is outside of the extraction directory" % name)
+
+
+def _check_tar_member(member):
+    """a simplified version of the tarfile ``data`` filter for python
+    versions without extraction filters"""
+    _check_member_name(member.name)
+    if member.issym() or member.islnk():
+        if os.path.isabs(member.linkname) or \
+                '..' in member.linkname.split('/'):
+            raise meta_limits.UnsafeArchive(
+                "the link '%s' points outside of the extraction directory" %
+                member.name)
+    elif not member.isfile() and not member.isdir():
+        raise meta_limits.UnsafeArchive(
+            "the member '%s' is not a regular file, directory or link" %
+            member.name)
 
 
-def _set_file_encoding_utf8(filename):
-    """set a encoding header as suggested in PEP-0263. This
-    is not entirely correct because we don't know the encoding of the
-    given file but it's at least a chance to get metadata from the setup.py"""
-    with open(filename, 'r+') as f:
+def _clear_dir(path):
+    for name in os.listdir(path):
+        child = os.path.join(path, name)
+        if os.path.isdir(child) and not os.path.islink(child):
+            shutil.rmtree(child)
+        else:
+            os.remove(child)
+
+
+def _single_subdir(root_dir):
+    """if the given directory has just a single subdir, return that.
+    Otherwise return the given directory"""
+    dir_list = os.listdir(root_dir)
+    if len(dir_list) == 1:
+        first = os.path.join(root_dir, dir_list[0])
+        if os.path.isdir(first):
+            return first
+    return root_dir
+
+
+def _set_file_encoding(filename, encoding):
+    """set the given encoding header as suggested in PEP-0263. A shebang
+    line is kept as the first line"""
+    with open(filename, 'rb') as f:
         content = f.read()
-        f.seek(0, 0)
-        f.write("# -*- coding: utf-8 -*-\n" + content)
+    header = ("# -*- coding: %s -*-\n" % encoding).encode('ascii')
+    if content.startswith(b'#!'):
+        shebang, sep, rest = content.partition(b'\n')
+        content = shebang + sep + header + rest
+    else:
+        content = header + content
+    with open(filename, 'wb') as f:
+        f.write(content)
 
 
-def _setup_py_run_from_dir(root_dir, py_interpreter):
-    """run the extractmeta command via the setup.py in the given root_dir.
-    the output of extractmeta is json and is stored in a tempfile
-    which is then read in and returned as data"""
-    data = {}
-    with _enter_single_subdir(root_dir) as single_subdir:
-        if not os.path.exists("setup.py"):
-            if not os.path.exists("pyproject.toml"):
-                raise Exception("'setup.py' does not exist in '%s'" % (
-                    single_subdir))
-
-            # Create it for pyproject.toml without setup.py
-            with open("setup.py", "w") as f:
-                f.write("from setuptools import setup\nsetup()\n")
-
-        # generate a temporary json file which contains the metadata
-        output_json = tempfile.NamedTemporaryFile()
-        cmd = "%s setup.py -q --command-packages metaextract " \
-              "metaextract -o %s " % (py_interpreter, output_json.name)
+def _source_encoding(source):
+    """the encoding header which must be added to the given python source
+    (bytes) so every interpreter can read it. None if the source has a BOM,
+    an encoding header or is plain ascii. Sources which are not valid utf-8
+    are assumed to be latin-1 which decodes everything"""
+    if source.startswith(codecs.BOM_UTF8):
+        return None
+    for line in source.splitlines()[:2]:
+        if _CODING_RE.match(line):
+            return None
+    for encoding in ('ascii', 'utf-8'):
         try:
-            subprocess.check_output(cmd, stderr=subprocess.STDOUT, shell=True)
-        except subprocess.CalledProcessError:
-            # try again with a encoding in setup.py
-            _set_file_encoding_utf8("setup.py")
-            subprocess.check_output(cmd, shell=True)
+            source.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+        return None if encoding == 'ascii' else encoding
+    return 'latin-1'
 
-        # read json file and return data
+
+def _fix_file_encoding(filename):
+    """add an encoding header to the file if it needs one
+
+    :returns: True if the file was changed
+    """
+    with open(filename, 'rb') as f:
+        encoding = _source_encoding(f.read())
+    if encoding is None:
+        return False
+    _set_file_encoding(filename, encoding)
+    return True
+
+
+def _launcher_args(limits, capture, stub_imports=None):
+    """the interpreter arguments before setup.py"""
+    if limits is None:
+        limits = meta_limits.Limits()
+    return limits.launcher_args(capture, stub_imports)
+
+
+def _check_output(setup_dir, args, py_interpreter, worker_pool, limits=None,
+                  capture=False, stub_imports=None, **kwargs):
+    """run setup.py with the given args in setup_dir. Either with a fresh
+    interpreter or with a warm worker from the worker_pool. With capture,
+    setup() is replaced (see :mod:`metaextract.capture`). The packages in
+    stub_imports are served as stubs (see :mod:`metaextract.stubs`)"""
+    if worker_pool is not None:
+        return worker_pool.check_output(py_interpreter, setup_dir, args,
+                                        limits, capture, stub_imports)
+    cmd = [py_interpreter] + _launcher_args(limits, capture, stub_imports)
+    cmd += ['setup.py'] + args
+    # a setup.py which asks for input must not block
+    if limits is None:
+        return subprocess.check_output(cmd, cwd=setup_dir,
+                                       stdin=subprocess.DEVNULL, **kwargs)
+    return meta_limits.check_output(cmd, limits, cwd=setup_dir, **kwargs)
+
+
+def _setup_py_prepare(root_dir):
+    """find the setup.py in root_dir (or in its single subdir). For a
+    pyproject.toml without setup.py, a minimal setup.py is created
+
+    :returns: the directory which contains the setup.py and its path
+    """
+    single_subdir = _single_subdir(root_dir)
+    setup_py = os.path.join(single_subdir, "setup.py")
+    if not os.path.exists(setup_py):
+        if not os.path.exists(os.path.join(single_subdir, "pyproject.toml")):
+            raise Exception("'setup.py' does not exist in '%s'" % (
+                single_subdir))
+
+        # Create it for pyproject.toml without setup.py
+        with open(setup_py, "w") as f:
+            f.write("from setuptools import setup\nsetup()\n")
+    return single_subdir, setup_py
+
+
+def _setup_py_args(output_filename=None, output_fd=None, fields=None):
+    """the setup.py arguments to write the metadata (only the given fields
+    if not None) to output_filename or to the inherited file descriptor
+    output_fd"""
+    args = ['-q', '--command-packages', 'metaextract', 'metaextract']
+    if fields is not None:
+        for field in fields:
+            if not _FIELD_RE.match(field):
+                raise Exception("Invalid field name '%s'" % field)
+        args += ['--fields', ','.join(sorted(fields))]
+    if output_fd is not None:
+        return args + ['--output-fd', str(output_fd)]
+    return args + ['-o', output_filename]
+
+
+def _setup_py_parse_output(text):
+    """parse the json which the metaextract command wrote"""
+    data = json.loads(text)
+    # the capture mode sets its own engine
+    data.setdefault('engine', 'execute')
+    return _sort_data(data)
+
+
+def _setup_py_read_output(output_filename):
+    """read the json which the metaextract command wrote to a file"""
+    with open(output_filename, "r") as f:
+        return _setup_py_parse_output(f.read())
+
+
+def _max_output(limits):
+    return limits.max_output if limits is not None else None
+
+
+def _run_with_pipe(setup_dir, py_interpreter, limits, fields, capture,
+                   stub_imports, **kwargs):
+    """run the metaextract command which writes compact json to a pipe.
+    The pipe is read while setup.py runs so a large output can't block it.
+    The stdout of setup.py stays separate
+
+    :returns: the json text
+    """
+    read_fd, write_fd = os.pipe()
+    collector = meta_limits.OutputCollector(os.fdopen(read_fd, 'rb'),
+                                            _max_output(limits))
+    reader = collector.start()
+    try:
+        _check_output(setup_dir, _setup_py_args(output_fd=write_fd,
+                                                fields=fields),
+                      py_interpreter, None, limits, capture, stub_imports,
+                      pass_fds=(write_fd, ), **kwargs)
+    finally:
+        os.close(write_fd)
+        reader.join()
+    if collector.exceeded:
+        raise meta_limits.output_exceeded(limits)
+    return collector.value().decode('utf-8')
+
+
+def _run_with_tempfile(setup_dir, py_interpreter, worker_pool, limits,
+                       fields, capture, stub_imports, **kwargs):
+    """run the metaextract command which writes the json to a tempfile
+
+    :returns: the json text
+    """
+    with tempfile.NamedTemporaryFile() as output_json:
+        _check_output(setup_dir, _setup_py_args(output_json.name,
+                                                fields=fields),
+                      py_interpreter, worker_pool, limits, capture,
+                      stub_imports, **kwargs)
+        max_output = _max_output(limits)
+        if max_output is not None and \
+                os.path.getsize(output_json.name) > max_output:
+            raise meta_limits.output_exceeded(limits)
         with open(output_json.name, "r") as f:
-            data = json.loads(f.read())
-
-        # sort some of the keys if the dict values are lists
-        for key in ['data_files', 'entry_points', 'extras_require',
-                    'install_requires', 'setup_requires', 'scripts',
-                    'tests_require', 'tests_suite']:
-            if key in data['data'] and isinstance(data['data'][key], list):
-                data['data'][key] = sorted(data['data'][key])
+            return f.read()
+
+
+def _setup_py_run_from_dir(root_dir, py_interpreter, worker_pool=None,
+                           limits=None, fields=None, capture=False,
+                           stub_imports=None):
+    """run the extractmeta command via the setup.py in the given root_dir.
+    the output of extractmeta is json and is read from a pipe (or from a
+    tempfile on platforms without inheritable file descriptors or when a
+    worker_pool is used) and returned as data"""
+    single_subdir, setup_py = _setup_py_prepare(root_dir)
+    _fix_file_encoding(setup_py)
+    if worker_pool is None and _HAS_PASS_FDS:
+        run = functools.partial(_run_with_pipe, single_subdir,
+                                py_interpreter, limits, fields, capture,
+                                stub_imports)
+    else:
+        run = functools.partial(_run_with_tempfile, single_subdir,
+                                py_interpreter, worker_pool, limits, fields,
+                                capture, stub_imports)
+    # the encoding header was fixed before, so a failure would just fail
+    # again
+    return _setup_py_parse_output(run(stderr=subprocess.STDOUT))
+
+
+def _sort_data(data):
+    """sort some of the keys if the dict values are lists"""
+    for key in ['data_files', 'entry_points', 'extras_require',
+                'install_requires', 'setup_requires', 'scripts',
+                'tests_require', 'tests_suite']:
+        if key in data['data'] and isinstance(data['data'][key], list):
+            data['data'][key] = sorted(data['data'][key])
+    return data
+
+
+def _static_run_from_dir(root_dir):
+    """try to get the metadata without executing any code from the
+    archive. Returns None if that is not possible"""
+    single_subdir = _single_subdir(root_dir)
+    for engine in _STATIC_ENGINES:
+        data = engine(single_subdir)
+        if data is not None:
+            return _sort_data(data)
+    return None
+
+
+def _project(data, fields):
+    """only keep the given fields (if not None) of the data"""
+    if fields is not None and 'data' in data:
+        data['data'] = dict((k, v) for k, v in data['data'].items()
+                            if k in fields)
+    return data
+
+
+def _cache_key(cache, archive_filename, py_interpreter, static,
+               fields=None, capture=False, stub_imports=None):
+    if cache is None:
+        return None
+    if not meta_archive.is_fileobj(archive_filename) and \
+            not os.path.exists(archive_filename):
+        return None
+    options = {'static': static}
+    if fields is not None:
+        options['fields'] = sorted(fields)
+    if capture:
+        options['capture'] = True
+    if stub_imports:
+        options['stub_imports'] = sorted(stub_imports)
+    return cache.key(archive_filename, py_interpreter, options)
+
+
+def _read_without_extracting(archive_filename, static,
+                             extraction_limits=None):
+    """the metadata of wheels and (with static) of sdists with a usable
+    PKG-INFO. Returns None if the archive needs to be extracted"""
+    data = None
+    if meta_wheel.is_wheel(archive_filename):
+        data = meta_wheel.from_wheel(archive_filename, extraction_limits)
+    elif static:
+        # PKG-INFO can be read without extracting the archive
+        data = meta_pkginfo.from_archive(archive_filename,
+                                         extraction_limits)
+    if data is not None:
+        data = _sort_data(data)
     return data
 
 
+def _run_extracted(archive_filename, py_interpreter, static, worker_pool,
+                   limits, fields, extraction_limits, workdir,
+                   background_cleanup, capture, stub_imports, sparse):
+    """extract the archive and collect the metadata with the static engines
+    (if static) or by running setup.py"""
+    with _extract_to_tempdir(archive_filename, sparse, extraction_limits,
+                             workdir, background_cleanup) as root_dir:
+        data = None
+        if static:
+            data = _static_run_from_dir(root_dir)
+        if data is None:
+            data = _setup_py_run_from_dir(root_dir, py_interpreter,
+                                          worker_pool, limits, fields,
+                                          capture, stub_imports)
+        return data
+
+
+def _link_or_copy(src, dst):
+    """the copy_function for the views of an extracted tree"""
+    if os.path.getsize(src) >= _VIEW_LINK_MIN_SIZE and \
+            not src.endswith('.py'):
+        try:
+            os.link(src, dst)
+            return dst
+        except OSError:
+            pass
+    return shutil.copy2(src, dst)
+
+
+@contextmanager
+def _tree_view(root_dir, workdir, background_cleanup):
+    """a copy of the extracted tree in root_dir which shares the large
+    files with it"""
+    tempdir = meta_workdir.make_tempdir(workdir)
+    try:
+        view = os.path.join(tempdir, 'tree')
+        shutil.copytree(root_dir, view, symlinks=True,
+                        copy_function=_link_or_copy)
+        yield view
+    finally:
+        meta_workdir.remove_tempdir(tempdir, background_cleanup)
+
+
+def _error_result(exc):
+    """the structured error which is returned instead of metadata"""
+    if isinstance(exc, meta_limits.ResultError):
+        error = exc.to_dict()
+    else:
+        error = {'type': exc.__class__.__name__, 'message': str(exc)}
+    return {'version': DATA_VERSION, 'error': error}
+
+
+def _is_retryable(result):
+    """check if the run failed in a way a full extraction may fix"""
+    return isinstance(result, Exception) and \
+        not isinstance(result, meta_limits.ResultError)
+
+
+def _run_extracted_multi(archive_filename, py_interpreters, static,
+                         worker_pool, limits, fields, extraction_limits,
+                         workdir, background_cleanup, capture, stub_imports,
+                         sparse):
+    """extract the archive once and run setup.py with every interpreter in
+    parallel, each in its own view of the extracted tree
+
+    :returns: a dict with the data or the exception for every interpreter
+    """
+    with _extract_to_tempdir(archive_filename, sparse, extraction_limits,
+                             workdir, background_cleanup) as root_dir:
+        if static:
+            data = _static_run_from_dir(root_dir)
+            if data is not None:
+                return dict((py, copy.deepcopy(data))
+                            for py in py_interpreters)
+        with ExitStack() as stack:
+            # the first interpreter runs in the extracted tree itself. The
+            # views are created before any setup.py runs
+            roots = [root_dir] + [
+                stack.enter_context(_tree_view(root_dir, workdir,
+                                               background_cleanup))
+                for py in py_interpreters[1:]]
+            with futures.ThreadPoolExecutor(len(py_interpreters)) as pool:
+                jobs = dict(
+                    (py, pool.submit(_setup_py_run_from_dir, root, py,
+                                     worker_pool, limits, fields, capture,
+                                     stub_imports))
+                    for py, root in zip(py_interpreters, roots))
+            results = {}
+            for py, job in jobs.items():
+                try:
+                    results[py] = job.result()
+                except Exception as e:
+                    results[py] = e
+            return results
+
+
+def _is_rewindable(fileobj):
+    """check if the file object can be read from the start again"""
+    try:
+        return fileobj.seekable() and fileobj.tell() == 0
+    except (AttributeError, IOError, OSError, ValueError):
+        return False
+
+
 ###############################################################################
-def from_archive(archive_filename, py_interpreter=sys.executable):
-    """extract metadata from a given sdist archive file
+def from_archive(archive_filename, py_interpreter=sys.executable, cache=None,
+                 static=False, worker_pool=None, limits=None, fields=None,
+                 sparse=None, extraction_limits=None, workdir=None,
+                 background_cleanup=False, capture=False, stub_imports=None):
+    """extract metadata from a given sdist archive or wheel file
 
-    :param archive_filename: a sdist archive file
+    The cwd of the process is not changed, so this can be called from
+    multiple threads at the same time.
+
+    :param archive_filename: a sdist archive or a wheel file. Wheels are
+                             always read without executing anything. See
+                             :func:`from_fileobj` for archives which are
+                             not in a file
     :param py_interpreter: The full path to the used python interpreter
+    :param cache: an optional :class:`metaextract.cache.ResultCache`. If
+                  given, results are looked up in and stored to the cache
+    :param static: try to get the metadata without executing the setup.py
+                   first (from PKG-INFO, pyproject.toml, setup.cfg or by
+                   parsing setup.py). setup.py is only executed if that fails
+    :param worker_pool: an optional :class:`metaextract.forkserver.WorkerPool`.
+                        If given, setup.py is executed by a warm worker
+                        instead of a freshly started interpreter
+    :param limits: optional :class:`metaextract.limits.Limits` for the
+                   execution of setup.py
+    :param fields: an optional list of the keys (i.e. ``install_requires``)
+                   which should be in the data. Other keys (i.e. the
+                   possibly large ``long_description``) are not computed
+                   when setup.py is executed
+    :param sparse: an optional :class:`metaextract.sparse.SparseExtraction`.
+                   If given, large and binary members are extracted as empty
+                   placeholders. If that fails, the archive is extracted
+                   again in full
+    :param extraction_limits: optional
+                              :class:`metaextract.limits.ExtractionLimits`.
+                              Defaults to the default limits
+    :param workdir: the directory the archive is extracted in (i.e. a
+                    tmpfs). Defaults to ``$METAEXTRACT_WORKDIR`` or the
+                    default temp directory
+    :param background_cleanup: remove the extracted files in a background
+                               thread instead of before returning (see
+                               :func:`metaextract.workdir.wait_for_cleanup`)
+    :param capture: replace setup() while setup.py runs, so only its
+                    keyword arguments are converted and the distribution is
+                    only finalized if a requested key needs it (see
+                    :mod:`metaextract.capture`)
+    :param stub_imports: an optional list of top level packages (i.e.
+                         :data:`metaextract.stubs.DEFAULT_STUBS`) which are
+                         served as lightweight stub modules while setup.py
+                         runs (see :mod:`metaextract.stubs`)
 
-    :returns: a json blob with metadata
+    :returns: a json blob with metadata. The ``engine`` key tells how the
+              metadata was collected (i.e. ``execute`` or ``ast``). If a
+              limit was exceeded or the archive is unsafe, the blob has an
+              ``error`` key with the ``type``, ``message`` and (for limits)
+              ``limit`` instead of ``data``. Such results are not cached
 """
-    with _extract_to_tempdir(archive_filename) as root_dir:
-        data = _setup_py_run_from_dir(root_dir, py_interpreter)
+    key = _cache_key(cache, archive_filename, py_interpreter, static, fields,
+                     capture, stub_imports)
+    if key is not None:
+        data = cache.get(key)
+        if data is not None:
+            return data
+    run = functools.partial(_run_extracted, archive_filename,
+                            py_interpreter, static, worker_pool, limits,
+                            fields, extraction_limits, workdir,
+                            background_cleanup, capture, stub_imports)
+    try:
+        data = _read_without_extracting(archive_filename, static,
+                                        extraction_limits)
+        if data is None:
+            try:
+                data = run(sparse)
+            except meta_limits.ResultError:
+                raise
+            except Exception:
+                if sparse is None:
+                    raise
+                # setup.py may need one of the files which were not
+                # extracted. Try again with everything
+                data = run(None)
+    except meta_limits.ResultError as e:
+        return {'version': DATA_VERSION, 'error': e.to_dict()}
+    data = _project(data, fields)
+    if key is not None:
+        cache.put(key, data)
     return data
+
+
+def from_archive_multi(archive_filename, py_interpreters, cache=None,
+                       static=False, worker_pool=None, limits=None,
+                       fields=None, sparse=None, extraction_limits=None,
+                       workdir=None, background_cleanup=False, capture=False,
+                       stub_imports=None):
+    """extract metadata from a given sdist archive or wheel file for more
+    than one interpreter (i.e. to get the ``install_requires`` which setup.py
+    computes for every python version)
+
+    The archive is extracted once. setup.py runs for all interpreters in
+    parallel, each in its own view of the extracted tree which shares the
+    large files (hard links) with the others.
+
+    :param archive_filename: a sdist archive or a wheel file
+    :param py_interpreters: a list of the full paths to the python
+                            interpreters
+    :param kwargs: the other parameters are the same as for
+                   :func:`from_archive`
+
+    :returns: a dict with the json blob (see :func:`from_archive`) for every
+              interpreter. If setup.py failed for an interpreter, its blob
+              has an ``error`` key with the ``type`` and ``message`` of the
+              failure instead of ``data``
+"""
+    py_interpreters = list(dict.fromkeys(py_interpreters))
+    results = {}
+    keys = {}
+    for py in py_interpreters:
+        keys[py] = _cache_key(cache, archive_filename, py, static, fields,
+                              capture, stub_imports)
+        if keys[py] is not None:
+            data = cache.get(keys[py])
+            if data is not None:
+                results[py] = data
+    todo = [py for py in py_interpreters if py not in results]
+    if todo:
+        run = functools.partial(_run_extracted_multi, archive_filename)
+        args = (static, worker_pool, limits, fields, extraction_limits,
+                workdir, background_cleanup, capture, stub_imports)
+        try:
+            data = _read_without_extracting(archive_filename, static,
+                                            extraction_limits)
+            if data is not None:
+                found = dict((py, copy.deepcopy(data)) for py in todo)
+            else:
+                found = run(todo, *(args + (sparse,)))
+                # setup.py may need one of the files which were not
+                # extracted. Try again with everything
+                failed = [py for py, result in found.items()
+                          if _is_retryable(result)]
+                if sparse is not None and failed:
+                    found.update(run(failed, *(args + (None,))))
+        except meta_limits.ResultError as e:
+            found = dict.fromkeys(todo, e)
+        for py, data in found.items():
+            if isinstance(data, Exception):
+                results[py] = _error_result(data)
+                continue
+            results[py] = _project(data, fields)
+            if keys[py] is not None:
+                cache.put(keys[py], results[py])
+    return dict((py, results[py]) for py in py_interpreters)
+
+
+def from_fileobj(fileobj, py_interpreter=sys.executable, **kwargs):
+    """extract metadata from a sdist archive or wheel in a binary file
+    object (i.e. an upload) without writing it to a file first
+
+    A seekable file object at position 0 (i.e. :class:`io.BytesIO`) is read
+    directly. Other file objects (i.e. a pipe) are read once into a spooled
+    tempfile which is kept in memory up to 64 MB, because the archive may
+    have to be read more than once. The file object is not closed.
+
+    :param fileobj: a binary file object with a sdist archive or a wheel.
+                    Wheels are detected by their content
+    :param py_interpreter: The full path to the used python interpreter
+    :param kwargs: additional keyword arguments for :func:`from_archive`
+
+    :returns: a json blob with metadata (see :func:`from_archive`)
+    """
+    if _is_rewindable(fileobj):
+        return from_archive(fileobj, py_interpreter, **kwargs)
+    with tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX_SIZE) as spool:
+        shutil.copyfileobj(fileobj, spool)
+        return from_archive(spool, py_interpreter, **kwargs)
+
+
+def from_bytes(data, py_interpreter=sys.executable, **kwargs):
+    """extract metadata from a sdist archive or wheel given as bytes (or
+    any other bytes-like object like a :class:`memoryview`)
+
+    :param data: the content of a sdist archive or a wheel
+    :param py_interpreter: The full path to the used python interpreter
+    :param kwargs: additional keyword arguments for :func:`from_archive`
+
+    :returns: a json blob with metadata (see :func:`from_archive`)
+    """
+    return from_fileobj(io.BytesIO(data), py_interpreter, **kwargs)
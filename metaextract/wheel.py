@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016, Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import zipfile
+
+from . import DATA_VERSION
+from . import archive as meta_archive
+from . import limits as meta_limits
+from . import pkginfo as meta_pkginfo
+from . import static as meta_static
+
+
+__all__ = [
+    "from_wheel",
+    "is_wheel",
+]
+
+
+ENGINE = "wheel"
+
+
+def is_wheel(filename):
+    """check if filename is a wheel (PEP 427). A binary file object has no
+    usable name, so it is a wheel if it is a zip file with a WHEEL file in
+    a top level .dist-info directory"""
+    if not meta_archive.is_fileobj(filename):
+        return filename.endswith('.whl') and zipfile.is_zipfile(filename)
+    if not zipfile.is_zipfile(filename):
+        return False
+    with zipfile.ZipFile(filename) as zf:
+        names = zf.namelist()
+    return any(name.count('/') == 1 and name.endswith('.dist-info/WHEEL')
+               for name in names)
+
+
+def _dist_info_dir(names):
+    """the name of the single top level .dist-info directory"""
+    dirs = set()
+    for name in names:
+        parts = name.split('/')
+        if len(parts) == 2 and parts[0].endswith('.dist-info') and \
+                parts[1] == 'METADATA':
+            dirs.add(parts[0])
+    if len(dirs) != 1:
+        raise Exception("Can not find a single .dist-info directory")
+    return dirs.pop()
+
+
+def _check_limits(zf, extraction_limits, archive_size):
+    """check the limits against the central directory before anything is
+    inflated"""
+    infos = zf.infolist()
+    extraction_limits.check(len(infos), sum(i.file_size for i in infos),
+                            archive_size)
+
+
+def _read(zf, name):
+    """read a metadata file with at most
+    :data:`metaextract.pkginfo._MAX_MEMBER_SIZE` bytes"""
+    try:
+        info = zf.getinfo(name)
+    except KeyError:
+        return None
+    limit = meta_pkginfo._MAX_MEMBER_SIZE
+    with zf.open(info) as f:
+        data = f.read(limit + 1)
+    if info.file_size > limit or len(data) > limit:
+        raise meta_limits.LimitExceeded(
+            'max_member_size', "the wheel member '%s' has more than %d "
+            "bytes" % (name, limit))
+    return data.decode('utf-8')
+
+
+###############################################################################
+def from_wheel(wheel_filename, extraction_limits=None):
+    """extract metadata from a wheel file
+
+    Only the zip central directory and the METADATA, entry_points.txt and
+    WHEEL files from the .dist-info directory are read. Nothing is extracted
+    to disk or executed. ``has_ext_modules`` is derived from the
+    ``Root-Is-Purelib`` field. The keys which are not part of the package
+    metadata are not included (see
+    :func:`metaextract.pkginfo.from_archive`).
+
+    :param wheel_filename: a wheel file or a seekable binary file object
+    :param extraction_limits: optional
+                              :class:`metaextract.limits.ExtractionLimits`.
+                              They are checked against the central
+                              directory before anything is read
+
+    :returns: a json blob with metadata
+    """
+    if extraction_limits is None:
+        extraction_limits = meta_limits.ExtractionLimits()
+    archive_size = meta_archive.archive_size(wheel_filename)
+    with zipfile.ZipFile(wheel_filename) as zf:
+        _check_limits(zf, extraction_limits, archive_size)
+        dist_info = _dist_info_dir(zf.namelist())
+        metadata = _read(zf, dist_info + '/METADATA')
+        entry_points = _read(zf, dist_info + '/entry_points.txt')
+        wheel = _read(zf, dist_info + '/WHEEL')
+    try:
+        kwargs = meta_pkginfo.metadata_to_kwargs(
+            meta_pkginfo._parse_metadata(metadata))
+        if entry_points is not None:
+            kwargs['entry_points'] = meta_pkginfo.parse_entry_points(
+                entry_points)
+        data = meta_pkginfo.kwargs_to_data(kwargs)
+    except meta_static._Unresolvable as e:
+        raise Exception("Can not read the metadata of the wheel: %s" % e)
+    if wheel is not None:
+        purelib = meta_pkginfo._parse_metadata(wheel).get('Root-Is-Purelib')
+        data['has_ext_modules'] = purelib == 'false'
+    return {
+        'version': DATA_VERSION,
+        'data': data,
+        'engine': ENGINE,
+    }
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016, Thomas Bechtold <thomasbechtold@jpberlin.de>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""the scratch directories archives are extracted to
+
+The directories are created in the ``workdir`` (i.e. a tmpfs), the
+``METAEXTRACT_WORKDIR`` directory or the default temp directory. They can
+be removed by a background thread, so the caller does not wait for the
+removal of thousands of extracted files.
+"""
+
+from __future__ import print_function
+
+from multiprocessing import util as mp_util
+import os
+import queue
+import shutil
+import tempfile
+import threading
+
+
+__all__ = [
+    "ENV_WORKDIR",
+    "make_tempdir",
+    "remove_tempdir",
+    "wait_for_cleanup",
+]
+
+
+ENV_WORKDIR = 'METAEXTRACT_WORKDIR'
+
+# the number of directories which may wait for their removal. Callers block
+# when more are waiting, so a slow disk can't fill up
+_MAX_PENDING = 64
+
+
+class _Cleaner(object):
+    """a daemon thread which removes the queued directories"""
+    def __init__(self):
+        self._queue = queue.Queue(_MAX_PENDING)
+        thread = threading.Thread(target=self._run,
+                                  name="metaextract-cleanup")
+        thread.daemon = True
+        thread.start()
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            try:
+                shutil.rmtree(path, ignore_errors=True)
+            finally:
+                self._queue.task_done()
+
+    def put(self, path):
+        self._queue.put(path)
+
+    def join(self):
+        self._queue.join()
+
+
+_lock = threading.Lock()
+# the cleaner of this process, by pid. A forked child starts its own
+_cleaners = {}
+
+
+def _cleaner():
+    pid = os.getpid()
+    with _lock:
+        if pid not in _cleaners:
+            _cleaners[pid] = _Cleaner()
+            # unlike atexit handlers, multiprocessing finalizers also run
+            # when a worker of a process pool exits
+            mp_util.Finalize(None, wait_for_cleanup, exitpriority=0)
+        return _cleaners[pid]
+
+
+def make_tempdir(workdir=None):
+    """create a new scratch directory
+
+    :param workdir: the directory the scratch directory is created in.
+                    Defaults to ``$METAEXTRACT_WORKDIR`` or the default
+                    temp directory. Created if needed
+    """
+    if workdir is None:
+        workdir = os.environ.get(ENV_WORKDIR) or None
+    if workdir is not None:
+        os.makedirs(workdir, exist_ok=True)
+    return tempfile.mkdtemp(prefix="metaextract_", dir=workdir)
+
+
+def remove_tempdir(path, background=False):
+    """remove the scratch directory
+
+    :param background: queue the directory for the cleanup thread instead
+                       of removing it before returning
+    """
+    if background:
+        _cleaner().put(path)
+    else:
+        shutil.rmtree(path)
+
+
+def wait_for_cleanup():
+    """wait until the cleanup thread removed all queued directories"""
+    cleaner = _cleaners.get(os.getpid())
+    if cleaner is not None:
+        cleaner.join()
@@ -35,6 +35,10 @@ setuptools.setup(
     url='http://github.com/toabctl/metaextract',
     packages=['metaextract'],
     cmdclass=metaextract.setup.get_cmdclass(),
+    install_requires=[
+        "packaging",
+        'tomli; python_version < "3.11"',
+    ],
     tests_require=["flake8", "pytest", "mock"],
     classifiers=[
         'Development Status :: 5 - Production/Stable',